@@ -0,0 +1,36 @@
+"""
+Write and read a very deep entity chain, like a long rig or transform stack.
+
+Usage:
+    PYTHONPATH=src python benchmarks/deep_chain.py [depth]
+"""
+import io
+import sys
+import time
+
+import mug
+from scenes import deep_chain
+
+
+def main():
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    root = deep_chain(depth)
+
+    start = time.perf_counter()
+    data = mug.dumps(root)
+    write_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    mug.read(io.BytesIO(data))
+    read_time = time.perf_counter() - start
+
+    print("depth: {}, size: {:.1f} MB".format(depth, len(data) / 1e6))
+    print("write: {:.3f} s ({:.0f} entities/s)".format(write_time,
+                                                       depth / write_time))
+    print("read: {:.3f} s ({:.0f} entities/s)".format(read_time,
+                                                      depth / read_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+"""
+Write and read synthetic scenes with each engine, reporting throughput and
+peak memory, and compare results against a baseline.
+
+Each case, a scene and an operation, runs in its own process so peak RSS
+isn't shared between cases. Results are stored as JSON, case name ->
+measures.
+
+Usage:
+    PYTHONPATH=src python benchmarks/run.py [--scale SCALE] [--repeat N]
+        [--workers N] [--output results.json] [--baseline baseline.json]
+        [--threshold RATIO] [case pattern ...]
+
+Examples:
+    PYTHONPATH=src python benchmarks/run.py --output baseline.json
+    PYTHONPATH=src python benchmarks/run.py --baseline baseline.json
+    PYTHONPATH=src python benchmarks/run.py "meshes/*" "*/read_mmap"
+"""
+import argparse
+import fnmatch
+import gc
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import mug
+from mug.core import iter_hierarchy
+from scenes import SCENES
+
+
+class Operation(NamedTuple):
+    """Benchmarked operation.
+
+    Attributes:
+        prepare (Callable): Return the `run` argument from a scene and a
+            temporary file path, not measured.
+        run (Callable): Measured operation.
+        options (Dict[str, Any]): `mug.write` options of the written or read
+            file. Throughput is computed from the byte count of the file
+            written with them, before compression.
+    """
+    prepare: Callable[[mug.Entity, str], Any]
+    run: Callable[[Any], Any]
+    options: Dict[str, Any] = {}
+
+
+def _write(**options) -> Operation:
+    return Operation(lambda scene, _: scene,
+                     lambda scene: mug.write(io.BytesIO(), scene, **options),
+                     options)
+
+
+def _read(run: Callable[[bytes], Any] = mug.loads, **options) -> Operation:
+    return Operation(lambda scene, _: mug.dumps(scene, **options), run,
+                     options)
+
+
+def _written(scene: mug.Entity, path: str) -> str:
+    with open(path, 'wb') as fd:
+        mug.write(fd, scene)
+
+    return path
+
+
+def _walk_lazy(path: str):
+    for entity in iter_hierarchy(mug.open(path, lazy=True)):
+        entity.attributes
+
+
+def _iter_events(data: bytes):
+    for _ in mug.iter_events(io.BytesIO(data)):
+        pass
+
+
+def _operations(workers: Optional[int]) -> Dict[str, Operation]:
+    operations = {
+        'write': _write(),
+        'write_sized': _write(sized=True),
+        'write_string_table': _write(string_table=True),
+        'write_toc': _write(toc=True),
+        'write_zlib': _write(compression='zlib'),
+        'write_table': Operation(
+            lambda scene, _: mug.SceneTable.from_entity(scene),
+            lambda table: mug.write(io.BytesIO(), table)),
+        'read': _read(),
+        'read_sized': _read(sized=True),
+        'read_string_table': _read(string_table=True),
+        'read_zlib': _read(compression='zlib'),
+        'read_table': _read(lambda data: mug.loads(data, table=True)),
+        'read_mmap': Operation(_written, mug.read_mmap),
+        'read_lazy': Operation(_written, _walk_lazy),
+        'iter_events': _read(_iter_events),
+    }
+
+    if workers is not None:
+        operations['write_parallel'] = _write(workers=workers)
+        operations['read_parallel'] = _read(
+            lambda data: mug.read(io.BytesIO(data), workers=workers),
+            sized=True)
+
+    return operations
+
+
+def _peak_rss() -> Optional[int]:
+    """Return the peak resident set size of this process, in bytes."""
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_case(case: str, scale: float, repeat: int,
+             workers: Optional[int]) -> Dict[str, Any]:
+    """Run `case`, named "scene/operation", and return its measures.
+
+    Throughput is measured on the fastest of `repeat` runs, and traced
+    memory on one more run.
+    """
+    scene_name, operation_name = case.split('/')
+    operation = _operations(workers)[operation_name]
+    scene = SCENES[scene_name](scale)
+    entity_count = sum(1 for _ in iter_hierarchy(scene))
+
+    fd, path = tempfile.mkstemp(prefix="mug_bench_")
+    os.close(fd)
+
+    try:
+        options = {name: value for name, value in operation.options.items()
+                   if name not in ('compression', 'workers')}
+        size = len(mug.dumps(scene, **options))
+
+        argument = operation.prepare(scene, path)
+        del scene
+
+        times = []
+
+        for _ in range(repeat):
+            gc.collect()
+            start = time.perf_counter()
+            operation.run(argument)
+            times.append(time.perf_counter() - start)
+
+        peak_rss = _peak_rss()
+
+        gc.collect()
+        tracemalloc.start()
+        operation.run(argument)
+        _, peak_traced = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        os.remove(path)
+
+    seconds = min(times)
+
+    return {
+        'seconds': seconds,
+        'bytes': size,
+        'entities': entity_count,
+        'mb_per_s': size / 1e6 / seconds,
+        'entities_per_s': entity_count / seconds,
+        'peak_traced': peak_traced,
+        'peak_rss': peak_rss,
+    }
+
+
+def compare(results: Dict[str, Dict[str, Any]],
+            baseline: Dict[str, Dict[str, Any]],
+            threshold: float) -> List[str]:
+    """Return regressions of `results` against `baseline` results.
+
+    A case regresses if its throughput drops, or its traced memory peak
+    rises, by more than `threshold` times the baseline one.
+    """
+    regressions = []
+
+    for case, measures in results.items():
+        base = baseline.get(case)
+        if base is None:
+            continue
+
+        if measures['mb_per_s'] < base['mb_per_s'] * (1 - threshold):
+            regressions.append("{}: {:.1f} MB/s, was {:.1f} MB/s".format(
+                case, measures['mb_per_s'], base['mb_per_s']))
+
+        if measures['peak_traced'] > base['peak_traced'] * (1 + threshold):
+            regressions.append("{}: {:.1f} MB traced, was {:.1f} MB".format(
+                case, measures['peak_traced'] / 1e6,
+                base['peak_traced'] / 1e6))
+
+    return regressions
+
+
+def _format_row(case: str, measures: Dict[str, Any]) -> str:
+    peak_rss = measures['peak_rss']
+    return "{:<32} {:>9.1f} {:>12.0f} {:>11.1f} {:>9}".format(
+        case, measures['mb_per_s'], measures['entities_per_s'],
+        measures['peak_traced'] / 1e6,
+        '-' if peak_rss is None else "{:.1f}".format(peak_rss / 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('patterns', nargs='*', default=['*'],
+                        help="cases to run, like 'meshes/*' or '*/read'")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="scene size factor")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="measured runs per case")
+    parser.add_argument('--workers', type=int,
+                        help="also run parallel engines with this many "
+                             "worker processes")
+    parser.add_argument('--output', help="JSON file to store results in")
+    parser.add_argument('--baseline', help="JSON results to compare with")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="regression ratio tolerated against baseline")
+    parser.add_argument('--case', help=argparse.SUPPRESS)  # child process
+    args = parser.parse_args()
+
+    if args.case:
+        json.dump(run_case(args.case, args.scale, args.repeat, args.workers),
+                  sys.stdout)
+        return
+
+    cases = [scene + '/' + operation
+             for scene in SCENES for operation in _operations(args.workers)]
+    cases = [case for case in cases
+             if any(fnmatch.fnmatch(case, pattern)
+                    for pattern in args.patterns)]
+
+    child_args = ['--scale', str(args.scale), '--repeat', str(args.repeat)]
+    if args.workers is not None:
+        child_args += ['--workers', str(args.workers)]
+
+    print("{:<32} {:>9} {:>12} {:>11} {:>9}".format(
+        "case", "MB/s", "entities/s", "traced MB", "RSS MB"))
+
+    results = {}
+
+    for case in cases:
+        process = subprocess.run(
+            [sys.executable, __file__, '--case', case] + child_args,
+            stdout=subprocess.PIPE, check=True, universal_newlines=True)
+        results[case] = json.loads(process.stdout)
+        print(_format_row(case, results[case]), flush=True)
+
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'scale': args.scale,
+                'repeat': args.repeat,
+                'results': results,
+            }, fd, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as fd:
+            baseline = json.load(fd)
+
+        if baseline['scale'] != args.scale:
+            sys.exit("baseline scale {} differs".format(baseline['scale']))
+
+        regressions = compare(results, baseline['results'], args.threshold)
+
+        for regression in regressions:
+            print("regression:", regression)
+
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Synthetic scene generators of representative shapes, sized by a scale factor.
+"""
+from array import array
+from typing import Callable, Dict
+
+import mug
+
+
+def _xform(i: int) -> tuple:
+    return (1.0, 0.0, 0.0, 0.0,
+            0.0, 1.0, 0.0, 0.0,
+            0.0, 0.0, 1.0, 0.0,
+            float(i), 0.0, 0.0, 1.0)
+
+
+def wide_flat(scale: float = 1.0) -> mug.Entity:
+    """Root with many small children, like instanced props in a set."""
+    root = mug.Entity("set")
+
+    for i in range(int(100000 * scale)):
+        child = mug.Entity("prop_{}".format(i))
+        child.attributes.append(mug.Attribute("id", mug.AttributeType.U32,
+                                              i))
+        child.attributes.append(mug.Attribute("translate",
+                                              mug.AttributeType.F32X3,
+                                              (float(i), 0.0, 0.0)))
+        root.children.append(child)
+
+    return root
+
+
+def deep_chain(depth: int) -> mug.Entity:
+    """Chain of `depth` entities, like a long rig or transform stack."""
+    root = entity = mug.Entity("joint0")
+
+    for i in range(1, depth):
+        child = mug.Entity("joint{}".format(i))
+        child.attributes.append(mug.Attribute("xform",
+                                              mug.AttributeType.F32X16,
+                                              (0.0,) * 16))
+        entity.children.append(child)
+        entity = child
+
+    return root
+
+
+def deep(scale: float = 1.0) -> mug.Entity:
+    """Very deep entity chain."""
+    return deep_chain(max(1, int(50000 * scale)))
+
+
+def _mesh(name: str, point_count: int) -> mug.Entity:
+    mesh = mug.Entity(name)
+    mesh.attributes.append(mug.Attribute(
+        "points", mug.AttributeType.F32_ARRAY,
+        array('f', range(3 * point_count))))
+    mesh.attributes.append(mug.Attribute(
+        "normals", mug.AttributeType.F32_ARRAY,
+        array('f', [0.0, 1.0, 0.0] * point_count)))
+    mesh.attributes.append(mug.Attribute(
+        "indices", mug.AttributeType.U32_ARRAY,
+        array('I', [i % point_count for i in range(6 * point_count)])))
+    return mesh
+
+
+def meshes(scale: float = 1.0) -> mug.Entity:
+    """Few entities holding large numeric arrays, like geometry caches."""
+    root = mug.Entity("geometry")
+
+    for i in range(max(1, int(200 * scale))):
+        root.children.append(_mesh("mesh_{}".format(i), 5000))
+
+    return root
+
+
+def metadata(scale: float = 1.0) -> mug.Entity:
+    """Entities holding many strings, like asset tracking metadata."""
+    root = mug.Entity("assets")
+
+    for i in range(int(20000 * scale)):
+        asset = mug.Entity("asset_{}".format(i))
+        asset.attributes.append(mug.Attribute(
+            "path", mug.AttributeType.STR,
+            "/projects/show/assets/props/asset_{0}/v{1:03}/asset_{0}.mug"
+            .format(i, i % 100)))
+        asset.attributes.append(mug.Attribute(
+            "description", mug.AttributeType.STR,
+            "Prop number {} of the set, modeled and published.".format(i)))
+        asset.attributes.append(mug.Attribute(
+            "tags", mug.AttributeType.STR_ARRAY,
+            ["prop", "set_{}".format(i % 10), "approved", "v{}".format(i)]))
+        root.children.append(asset)
+
+    return root
+
+
+def mixed(scale: float = 1.0) -> mug.Entity:
+    """Groups of props having transforms, metadata and small meshes."""
+    root = mug.Entity("world")
+
+    for i in range(max(1, int(100 * scale))):
+        group = mug.Entity("group_{}".format(i))
+        root.children.append(group)
+
+        for j in range(100):
+            prop = mug.Entity("prop_{}".format(j))
+            prop.attributes.append(mug.Attribute(
+                "xform", mug.AttributeType.F32X16, _xform(j)))
+            prop.attributes.append(mug.Attribute(
+                "asset", mug.AttributeType.STR,
+                "/assets/prop_{}.mug".format(j)))
+            prop.attributes.append(mug.Attribute(
+                "visible", mug.AttributeType.U8, 1))
+
+            if j % 10 == 0:
+                prop.children.append(_mesh("geo", 100))
+
+            group.children.append(prop)
+
+    return root
+
+
+SCENES: Dict[str, Callable[[float], mug.Entity]] = {
+    'wide_flat': wide_flat,
+    'deep': deep,
+    'meshes': meshes,
+    'metadata': metadata,
+    'mixed': mixed,
+}
@@ -1,4 +1,17 @@
 """
 Mug module.
 """
-from .core import Entity, Attribute, AttributeType, read, write
+from .core import Entity, Attribute, AttributeType, ArrayFormat, \
+    FormatFlag, AttributeCodec, NamedList, TocEntry, register_codec, \
+    get_codec, read, write, dumps, loads
+from .events import StartEntity, Attr, EndEntity, iter_events
+from .index import read_entity, read_toc, patch
+from .mapped import read_mmap
+from .lazy import LazyEntity, open
+from .stream import StreamWriter
+from .table import SceneTable
+from .stats import Stats, Measure
+from .scan import LargeAttribute, ScanResult, scan
+from .incremental import WriteCache
+from .compression import CompressionCodec, ModuleCodec, register_compression, \
+    get_compression
@@ -0,0 +1,308 @@
+"""
+Asyncio reading and writing, from and to streams.
+"""
+import asyncio
+import struct
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from .core import Entity, ArrayFormat, FormatFlag, TruncatedError, \
+    DEFAULT_CHUNK_SIZE, INSTANCE_TAG, REFERENCE_TAG, _Encoder, _U64, \
+    _buffer_value_readers, _encode_scene, _numpy, _scene_encoder, \
+    copy_hierarchy, header_unpack_from, string_table_unpack_from, \
+    suint_unpack_from, tag_unpack_from
+from .mapped import unpack_entity_head
+from .table import SceneTable
+
+# Byte count `read` requests from the stream at once.
+DEFAULT_READ_SIZE = 1 << 16
+
+
+class _StreamBuffer:
+    """Bytes received from a stream reader, not decoded yet.
+
+    Attributes:
+        data (bytes): Received bytes.
+        offset (int): Offset of the first byte not decoded in `data`.
+        discarded_count (int): Byte count decoded and discarded before
+            `data`.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, read_size: int):
+        self.data = b''
+        self.offset = 0
+        self.discarded_count = 0
+        self._reader = reader
+        self._read_size = read_size
+        self._eof = False
+
+    async def unpack(self, function: Callable[..., Tuple], *args: Any) -> Any:
+        """Decode from `data` with a buffer function, receiving more bytes
+        until it succeeds.
+
+        Args:
+            function: Function called with `data`, `offset` and `args`,
+                returning decoded values followed by the offset following
+                them.
+            args: Other `function` arguments.
+
+        Returns:
+            Decoded values, a single one unpacked.
+
+        Raises:
+            ValueError: If the stream ends before the values, or if they are
+                invalid.
+        """
+        while True:
+            # Missing bytes raise any of these, other errors are raised as
+            # soon as the invalid bytes are received.
+            try:
+                *values, offset = function(self.data, self.offset, *args)
+            except (IndexError, struct.error, TruncatedError):
+                if self._eof:
+                    raise TruncatedError("unexpected end of file") from None
+            else:
+                self.offset = offset
+                return values[0] if len(values) == 1 else values
+
+            await self._receive()
+
+    async def _receive(self):
+        """Receive at least as many bytes as there are left to decode.
+
+        Doubling what is buffered on each try keeps decoding values larger
+        than the read size linear.
+        """
+        chunks = []
+        size = 0
+        min_size = max(self._read_size, len(self.data) - self.offset)
+
+        while size < min_size:
+            chunk = await self._reader.read(min_size - size)
+
+            if not chunk:
+                self._eof = True
+                break
+
+            chunks.append(chunk)
+            size += len(chunk)
+
+        # Values decoded as memoryviews keep referencing the previous bytes.
+        self.data = self.data[self.offset:] + b''.join(chunks)
+        self.discarded_count += self.offset
+        self.offset = 0
+
+        # The reader doesn't suspend while it has buffered bytes.
+        await asyncio.sleep(0)
+
+
+async def read(reader: asyncio.StreamReader,
+               array_format: ArrayFormat = ArrayFormat.TUPLE,
+               numpy: bool = False, table: bool = False,
+               read_size: int = DEFAULT_READ_SIZE,
+               copy_instances: bool = False) -> Union[Entity, SceneTable]:
+    """Read mug scene from `reader` stream.
+
+    Bytes are received by chunks of about `read_size` bytes, only keeping
+    those of the entity being decoded, and other tasks run between chunks.
+    Attribute values are decoded by the same functions as `read_mmap`, so
+    `ArrayFormat.MEMORYVIEW` and `ArrayFormat.NUMPY` values are read only.
+
+    Examples:
+        >>> async def handle(reader, writer):
+        ...     root = await mug.aio.read(reader)
+
+    Args:
+        reader: Stream to read from, at the mug file start.
+        array_format: Format to read numeric array attribute values as.
+        numpy: Shortcut for `array_format=ArrayFormat.NUMPY`.
+        table: Return a `SceneTable` instead of entities.
+        read_size: Byte count to request from `reader` at once.
+        copy_instances: See `mug.read`.
+
+    Returns:
+        Root entity, or scene table.
+
+    Raises:
+        ValueError: If not a mug file, or if the stream ends too soon.
+    """
+    if numpy:
+        array_format = ArrayFormat.NUMPY
+
+    if array_format is ArrayFormat.NUMPY:
+        _numpy()  # fail early if missing
+
+    buffer = _StreamBuffer(reader, read_size)
+    unpack = buffer.unpack
+
+    flags = await unpack(header_unpack_from)
+    strings = await unpack(string_table_unpack_from, flags)
+
+    readers = _buffer_value_readers(array_format)
+    sized = FormatFlag.SIZED in flags
+    streamed = FormatFlag.STREAMED in flags
+
+    if FormatFlag.INSTANCED in flags:
+        root = await _read_instanced(buffer, readers, sized, strings,
+                                     copy_instances)
+        return SceneTable.from_entity(root) if table else root
+
+    root, child_count = await unpack(unpack_entity_head, readers, sized,
+                                     strings)
+
+    # Entities having children left to read and their remaining child count,
+    # in the current batch if streamed.
+    parents = []
+    child_counts = []
+
+    if child_count:
+        parents.append(root)
+        child_counts.append(child_count)
+
+    while parents:
+        child_count = child_counts[-1]
+
+        if not child_count:
+            if streamed:
+                child_count = await unpack(suint_unpack_from)  # next batch
+
+            if not child_count:
+                parents.pop()
+                child_counts.pop()
+                continue
+
+        child_counts[-1] = child_count - 1
+
+        entity, child_count = await unpack(unpack_entity_head, readers,
+                                           sized, strings)
+        parents[-1].children.append(entity)
+
+        if child_count:
+            parents.append(entity)
+            child_counts.append(child_count)
+
+    return SceneTable.from_entity(root) if table else root
+
+
+def _distance_unpack_from(buffer: bytes, offset: int) -> Tuple[int, int]:
+    """Return the u64 following a reference tag, and the offset following
+    it."""
+    return _U64.unpack_from(buffer, offset)[0], offset + _U64.size
+
+
+async def _read_instanced(buffer: _StreamBuffer, readers: Dict[int, Callable],
+                          sized: bool, strings: Optional[List[str]],
+                          copy_instances: bool) -> Entity:
+    """`read` hierarchy of `FormatFlag.INSTANCED` files, see
+    `core.read_hierarchy`."""
+    unpack = buffer.unpack
+    instances = {}  # instance offset -> instance
+    root = None
+    # Entities having children left to read, their remaining child count
+    # and their offset if instances, None otherwise.
+    parents = []
+    child_counts = []
+    offsets = []
+
+    while True:
+        if parents:
+            if not child_counts[-1]:
+                entity = parents.pop()
+                child_counts.pop()
+                offset = offsets.pop()
+
+                if offset is not None:
+                    instances[offset] = entity
+                continue
+
+            child_counts[-1] -= 1
+        elif root is not None:
+            return root
+
+        offset = buffer.discarded_count + buffer.offset
+        tag = await unpack(tag_unpack_from)
+        child_count = 0
+
+        if tag == REFERENCE_TAG:
+            distance = await unpack(_distance_unpack_from)
+            entity = instances.get(offset - distance)
+
+            if entity is None:
+                raise ValueError("invalid instance reference")
+
+            if copy_instances:
+                entity = copy_hierarchy(entity)
+
+            offset = None
+        else:
+            if tag != INSTANCE_TAG:
+                offset = None
+
+            entity, child_count = await unpack(unpack_entity_head, readers,
+                                               sized, strings)
+
+            if offset is not None and not child_count:
+                instances[offset] = entity
+
+        if root is None:
+            root = entity
+        else:
+            parents[-1].children.append(entity)
+
+        if child_count:
+            parents.append(entity)
+            child_counts.append(child_count)
+            offsets.append(offset)
+
+
+async def _send(writer: asyncio.StreamWriter, encoder: _Encoder):
+    """Send `encoder` buffered bytes to `writer`, waiting for it to drain."""
+    data = bytes(encoder.buffer)  # the transport may keep it
+    encoder.flushed_count += len(data)
+    encoder.buffer.clear()
+
+    writer.write(data)
+    await writer.drain()
+
+    # Draining doesn't suspend below the transport high-water mark.
+    await asyncio.sleep(0)
+
+
+async def write(writer: asyncio.StreamWriter,
+                entity: Union[Entity, SceneTable],
+                chunk_size: int = DEFAULT_CHUNK_SIZE, sized: bool = False,
+                toc: bool = False, toc_attributes: bool = False,
+                string_table: bool = False, instances: bool = False):
+    """Write mug scene to `writer` stream, as `mug.write` does.
+
+    Encoded bytes are sent by chunks of about `chunk_size` bytes, waiting
+    for `writer` to drain, and other tasks run between chunks. With
+    `sized=True` or `instances=True`, the whole hierarchy is encoded before
+    the first chunk.
+
+    Examples:
+        >>> async def handle(reader, writer):
+        ...     await mug.aio.write(writer, root)
+        ...     writer.close()
+
+    Args:
+        writer: Stream to write in.
+        entity: Root entity, or scene table, to write.
+        chunk_size: Byte count to accumulate before sending to `writer`.
+        sized: See `mug.write`.
+        toc: See `mug.write`.
+        toc_attributes: See `mug.write`.
+        string_table: See `mug.write`.
+        instances: See `mug.write`.
+    """
+    encoder = _scene_encoder(entity, sized, toc, toc_attributes,
+                             string_table, instances)
+    buffer = encoder.buffer
+
+    for _ in _encode_scene(encoder, entity):
+        if len(buffer) >= chunk_size:
+            await _send(writer, encoder)
+
+    if encoder.toc is not None:
+        encoder.toc_footer()
+
+    await _send(writer, encoder)
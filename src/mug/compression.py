@@ -0,0 +1,483 @@
+"""
+Block compressed container, wrapping the bytes of a mug file.
+
+The mug file bytes are split into blocks of a fixed size, compressed
+independently so they can be decompressed in parallel, and any of them
+alone to seek in the mug file.
+"""
+import bz2
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import io
+import mmap
+import os
+from typing import BinaryIO, Deque, Dict, List, Optional, Tuple
+import zlib
+
+try:
+    import lzma
+except ImportError:  # Python built without liblzma
+    lzma = None
+
+from .core import DEFAULT_BLOCK_SIZE, _flush, _read_into, _seekable, \
+    as_str_bytes, as_suint_bytes, str_read, suint_read
+
+COMPRESSED_MAGIC = b'MUGZ'
+
+# Read size of the buffer wrapping decompressed blocks.
+_READ_BUFFER_SIZE = 1 << 16
+
+
+class CompressionCodec:
+    """Compression algorithm of container blocks.
+
+    Subclasses must implement `compress` and `decompress`. Algorithms
+    releasing the GIL, like `zlib`, `lzma` and `bz2`, benefit from blocks
+    being decompressed in parallel.
+    """
+
+    def compress(self, data: bytes) -> bytes:
+        """Return compressed `data`."""
+        raise NotImplementedError
+
+    def decompress(self, data: bytes) -> bytes:
+        """Return decompressed `data`."""
+        raise NotImplementedError
+
+
+class ModuleCodec(CompressionCodec):
+    """Codec of a module having `compress` and `decompress` functions."""
+
+    def __init__(self, module):
+        """Initialize module codec.
+
+        Args:
+            module: Compression module, like `zlib`.
+        """
+        self.compress = module.compress
+        self.decompress = module.decompress
+
+
+_COMPRESSIONS: Dict[str, CompressionCodec] = {}
+
+
+def register_compression(name: str, codec: CompressionCodec):
+    """Register `codec` to compress and decompress `name` container blocks.
+
+    Examples:
+        >>> import zstandard
+        >>> register_compression("zstd", ModuleCodec(zstandard))
+        >>> write(fd, root, compression="zstd")
+
+    Args:
+        name: Compression name, stored in container headers.
+        codec: Codec of the compression.
+    """
+    _COMPRESSIONS[name] = codec
+
+
+def get_compression(name: str) -> CompressionCodec:
+    """Return `name` compression codec.
+
+    Args:
+        name: Compression name.
+
+    Returns:
+        Codec of the compression.
+
+    Raises:
+        ValueError: If `name` compression is not registered.
+    """
+    try:
+        return _COMPRESSIONS[name]
+    except KeyError:
+        raise ValueError("unknown compression: {}".format(name)) from None
+
+
+register_compression('zlib', ModuleCodec(zlib))
+register_compression('bz2', ModuleCodec(bz2))
+
+if lzma is not None:
+    register_compression('lzma', ModuleCodec(lzma))
+
+
+def _worker_count(workers: Optional[int]) -> int:
+    """Return the thread count compressing or decompressing blocks."""
+    if workers is None:
+        return min(32, os.cpu_count() or 1)
+
+    if workers < 1:
+        raise ValueError("worker count must be positive")
+
+    return workers
+
+
+class BlockWriter(io.RawIOBase):
+    """Write only file object compressing written bytes by blocks.
+
+    Blocks are compressed in a thread pool, and written in order as they
+    complete. `close` writes the last block and the container end, leaving
+    the wrapped file object open.
+    """
+
+    def __init__(self, fd: BinaryIO, compression: str = 'zlib',
+                 block_size: int = DEFAULT_BLOCK_SIZE,
+                 workers: Optional[int] = None):
+        """Initialize block writer, writing the container header.
+
+        Args:
+            fd: File object to write the container in.
+            compression: Name of the compression, see
+                `register_compression`.
+            block_size: Mug file byte count of each block.
+            workers: Thread count compressing blocks, the CPU count if None.
+        """
+        super().__init__()
+
+        if block_size < 1:
+            raise ValueError("block size must be positive")
+
+        self._fd = fd
+        self._codec = get_compression(compression)
+        self._block_size = block_size
+        self._buffer = bytearray()
+
+        workers = _worker_count(workers)
+        self._executor = ThreadPoolExecutor(workers)
+        self._max_pending = 2 * workers
+        self._pending: Deque[Future] = deque()
+
+        self._write(bytearray(COMPRESSED_MAGIC + as_str_bytes(compression) +
+                              as_suint_bytes(block_size)))
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        buffer = self._buffer
+        buffer += data
+        block_size = self._block_size
+
+        if len(buffer) >= block_size:
+            view = memoryview(buffer)
+            block_end = len(buffer) - len(buffer) % block_size
+
+            for start in range(0, block_end, block_size):
+                self._submit(bytes(view[start:start + block_size]))
+
+            view.release()
+            del buffer[:block_end]
+
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+
+        try:
+            if self._buffer:
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+
+            while self._pending:
+                self._write_block(self._pending.popleft())
+
+            self._write(bytearray(b'\x00'))  # container end
+        finally:
+            self._executor.shutdown()
+            super().close()
+
+    def _submit(self, block: bytes):
+        """Compress `block` in the thread pool, writing completed blocks."""
+        if len(self._pending) >= self._max_pending:
+            self._write_block(self._pending.popleft())
+
+        self._pending.append(self._executor.submit(self._codec.compress,
+                                                   block))
+
+    def _write_block(self, future: Future):
+        """Write compressed block of `future`, prefixed by its byte count."""
+        data = future.result()
+
+        if not data:
+            raise ValueError("compressed block must not be empty")
+
+        self._write(bytearray(as_suint_bytes(len(data))))
+        self._write(bytearray(data))
+
+    def _write(self, data: bytearray):
+        _flush(self._fd, data)
+
+
+class BlockReader(io.RawIOBase):
+    """Read only file object over the mug file of a container.
+
+    Blocks are decompressed in a thread pool, ahead of the read position.
+    Seeking only decompresses the blocks read from, if the wrapped file
+    object is seekable too.
+    """
+
+    def __init__(self, fd: BinaryIO, workers: Optional[int] = None):
+        """Initialize block reader, reading the container header.
+
+        Args:
+            fd: File object to read the container from, past its magic
+                number.
+            workers: Thread count decompressing blocks, the CPU count if
+                None.
+
+        Raises:
+            ValueError: If the compression is not registered.
+        """
+        super().__init__()
+
+        self._fd = fd
+        self._codec = get_compression(str_read(fd))
+        self._block_size = suint_read(fd)
+
+        if not self._block_size:
+            raise ValueError("invalid block size")
+
+        self._fd_seekable = _seekable(fd)
+
+        # Offset and byte count of the compressed data of the blocks found.
+        self._blocks: List[Tuple[int, int]] = []
+        self._block_count: Optional[int] = None  # once the end is found
+
+        workers = _worker_count(workers)
+        self._executor = ThreadPoolExecutor(workers)
+        self._prefetch_count = 2 * workers
+        self._pending: Dict[int, Future] = {}
+
+        self._block_index = -1
+        self._block = memoryview(b'')
+        self._position = 0
+        self._size: Optional[int] = None
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return self._fd_seekable
+
+    def readinto(self, b) -> int:
+        block = self._load(self._position // self._block_size)
+        start = self._position % self._block_size
+        data = block[start:start + len(b)]
+        b[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if not self._fd_seekable:
+            raise io.UnsupportedOperation("wrapped file object not seekable")
+
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._mug_size()
+        elif whence != io.SEEK_SET:
+            raise ValueError("invalid whence")
+
+        if offset < 0:
+            raise ValueError("negative seek position")
+
+        self._position = offset
+        return offset
+
+    def tell(self) -> int:
+        return self._position
+
+    def close(self):
+        if self.closed:
+            return
+
+        for future in self._pending.values():
+            future.cancel()
+
+        self._pending.clear()
+        self._executor.shutdown()
+        super().close()
+
+    def read_all_blocks(self) -> List[bytes]:
+        """Return all the decompressed blocks, from the first one."""
+        blocks = []
+        index = 0
+
+        while True:
+            block = self._load(index)
+
+            if not block:
+                return blocks
+
+            blocks.append(block.obj)
+            index += 1
+
+    def _mug_size(self) -> int:
+        """Return the mug file byte count, decompressing the last block."""
+        if self._size is None:
+            while self._find_block():
+                pass
+
+            self._size = 0
+            last_index = self._block_count - 1
+
+            if last_index >= 0:
+                self._size = last_index * self._block_size + \
+                    len(self._load(last_index))
+
+        return self._size
+
+    def _find_block(self) -> bool:
+        """Read the header of the block following the found ones.
+
+        Returns:
+            False if the container end is reached instead.
+        """
+        if self._block_count is not None:
+            return False
+
+        fd = self._fd
+
+        if self._fd_seekable and self._blocks:
+            offset, size = self._blocks[-1]
+            fd.seek(offset + size)
+
+        size = suint_read(fd)
+
+        if not size:
+            self._block_count = len(self._blocks)
+            return False
+
+        index = len(self._blocks)
+        self._blocks.append((fd.tell() if self._fd_seekable else -1, size))
+
+        if not self._fd_seekable:
+            # Data can't be read later, decompress it as it comes.
+            self._submit(index, bytearray(size))
+
+        return True
+
+    def _submit(self, index: int, data: Optional[bytearray] = None):
+        """Decompress block at `index` in the thread pool."""
+        if index in self._pending:
+            return
+
+        if data is None:
+            offset, size = self._blocks[index]
+            self._fd.seek(offset)
+            data = bytearray(size)
+
+        _read_into(self._fd, memoryview(data))
+        self._pending[index] = self._executor.submit(self._codec.decompress,
+                                                     data)
+
+    def _load(self, index: int) -> memoryview:
+        """Return block at `index`, empty past the last one."""
+        if index == self._block_index:
+            return self._block
+
+        prefetch_end = index + 1 + self._prefetch_count
+
+        while len(self._blocks) < prefetch_end and self._find_block():
+            pass
+
+        if index >= len(self._blocks):
+            return memoryview(b'')
+
+        if not self._fd_seekable and index not in self._pending:
+            raise io.UnsupportedOperation("wrapped file object not seekable")
+
+        for i in range(index, min(prefetch_end, len(self._blocks))):
+            self._submit(i)
+
+        # Forget blocks behind, they are read again when seeking back.
+        for i in [i for i in self._pending if i < index]:
+            self._pending.pop(i).cancel()
+
+        block = self._pending.pop(index).result()
+
+        if len(block) != self._block_size and \
+                (self._block_count is None or index < self._block_count - 1):
+            raise ValueError("invalid compressed block size")
+
+        self._block_index = index
+        self._block = memoryview(block)
+        return self._block
+
+
+def _peek_magic(fd: BinaryIO) -> bytes:
+    """Return the first bytes at `fd` position, without reading them."""
+    if _seekable(fd):
+        start = fd.tell()
+        magic = fd.read(len(COMPRESSED_MAGIC))
+        fd.seek(start)
+        return magic
+
+    peek = getattr(fd, 'peek', None)
+    if peek is None:
+        return b''
+
+    return peek(len(COMPRESSED_MAGIC))[:len(COMPRESSED_MAGIC)]
+
+
+def open_blocks(fd: BinaryIO,
+                workers: Optional[int] = None) -> Optional[BinaryIO]:
+    """Return a file object over the mug file of the container at `fd`.
+
+    Args:
+        fd: File object to read from.
+        workers: Thread count decompressing blocks, the CPU count if None.
+
+    Returns:
+        Buffered `BlockReader`, None if `fd` is not at a container start.
+        Closing it leaves `fd` open.
+    """
+    if _peek_magic(fd) != COMPRESSED_MAGIC:
+        return None
+
+    fd.read(len(COMPRESSED_MAGIC))
+
+    return io.BufferedReader(BlockReader(fd, workers), _READ_BUFFER_SIZE)
+
+
+def map_blocks(fd: BinaryIO) -> mmap.mmap:
+    """Return the mug file of the container at `fd`, decompressed in an
+    anonymous memory mapping.
+
+    Args:
+        fd: File object to read from, past the container magic number.
+
+    Returns:
+        Mug file mapping.
+    """
+    with BlockReader(fd) as reader:
+        blocks = reader.read_all_blocks()
+
+    mapping = mmap.mmap(-1, max(1, sum(len(block) for block in blocks)))
+
+    for block in blocks:
+        mapping.write(block)
+
+    mapping.seek(0)
+    return mapping
+
+
+def compress(data: bytes, compression: str = 'zlib',
+             block_size: int = DEFAULT_BLOCK_SIZE) -> bytes:
+    """Return the container of `data` mug file bytes.
+
+    Args:
+        data: Mug file bytes.
+        compression: See `BlockWriter`.
+        block_size: See `BlockWriter`.
+
+    Returns:
+        Container bytes.
+    """
+    fd = io.BytesIO()
+
+    with BlockWriter(fd, compression, block_size) as writer:
+        writer.write(data)
+
+    return fd.getvalue()
@@ -1,9 +1,22 @@
 """
 Main internal module.
 """
-from enum import IntEnum
-from typing import BinaryIO, List, Any
+from array import array
+import copy
+from enum import Enum, IntEnum, IntFlag
+import io
+import itertools
+import mmap
+from typing import TYPE_CHECKING, AbstractSet, BinaryIO, Callable, Dict, \
+    Iterable, Iterator, List, Any, NamedTuple, Optional, Set, Tuple, Union
+from collections import Counter
 import struct
+import sys
+
+if TYPE_CHECKING:
+    from .table import SceneTable
+    from .stats import Stats
+    from .incremental import WriteCache
 
 MAX_U8 = 255
 MAX_U16 = 65535
@@ -12,6 +25,25 @@ MAX_U64 = 9223372036854775808
 
 BYTE_ORDER = 'little'
 
+_NATIVE_LITTLE_ENDIAN = sys.byteorder == BYTE_ORDER
+
+# Bytes-like object values are decoded from by offset. Slicing it must return
+# bytes-like objects having a `decode` method, so not a `memoryview`.
+ReadBuffer = Union[bytes, bytearray, mmap.mmap]
+
+# `struct` format character -> little-endian numpy dtype.
+_DTYPES = {'B': '<u1', 'H': '<u2', 'I': '<u4', 'Q': '<u8',
+           'b': '<i1', 'h': '<i2', 'i': '<i4', 'q': '<i8',
+           'e': '<f2', 'f': '<f4', 'd': '<f8'}
+
+
+class TruncatedError(ValueError):
+    """Error raised when a file or buffer ends before a decoded value.
+
+    Stream readers receive more bytes on this error, and fail on other
+    `ValueError` ones.
+    """
+
 
 class AttributeType(IntEnum):
     # 1 component
@@ -108,543 +140,2750 @@ class AttributeType(IntEnum):
     STR_ARRAY = 78
 
 
-def attr_type_read(fd: BinaryIO) -> AttributeType:
-    return AttributeType.from_bytes(fd.read(1), BYTE_ORDER, signed=False)
+# File header magic numbers.
+MAGIC = b'MUGS'
+MAGIC_V2 = b'MUG2'  # followed by a u8 of `FormatFlag`
 
 
-def as_attr_value_bytes(attr_type: AttributeType, value: Any):
-    if attr_type == AttributeType.U8:
-        return value.to_bytes(1, BYTE_ORDER, signed=False)
-    elif attr_type == AttributeType.U16:
-        return value.to_bytes(2, BYTE_ORDER, signed=False)
-    elif attr_type == AttributeType.U32:
-        return value.to_bytes(4, BYTE_ORDER, signed=False)
-    elif attr_type == AttributeType.U64:
-        return value.to_bytes(8, BYTE_ORDER, signed=False)
-    elif attr_type == AttributeType.I8:
-        return value.to_bytes(1, BYTE_ORDER, signed=True)
-    elif attr_type == AttributeType.I16:
-        return value.to_bytes(2, BYTE_ORDER, signed=True)
-    elif attr_type == AttributeType.I32:
-        return value.to_bytes(4, BYTE_ORDER, signed=True)
-    elif attr_type == AttributeType.I64:
-        return value.to_bytes(8, BYTE_ORDER, signed=True)
-    elif attr_type == AttributeType.F16:
-        return struct.pack('<e', value)
-    elif attr_type == AttributeType.F32:
-        return struct.pack('<f', value)
-    elif attr_type == AttributeType.F64:
-        return struct.pack('<d', value)
-    elif attr_type == AttributeType.STR:
-        return as_str_bytes(value)
-    elif attr_type == AttributeType.U8X2:
-        return struct.pack('<2B', *value)
-    elif attr_type == AttributeType.U16X2:
-        return struct.pack('<2H', *value)
-    elif attr_type == AttributeType.U32X2:
-        return struct.pack('<2I', *value)
-    elif attr_type == AttributeType.U64X2:
-        return struct.pack('<2Q', *value)
-    elif attr_type == AttributeType.I8X2:
-        return struct.pack('<2b', *value)
-    elif attr_type == AttributeType.I16X2:
-        return struct.pack('<2h', *value)
-    elif attr_type == AttributeType.I32X2:
-        return struct.pack('<2i', *value)
-    elif attr_type == AttributeType.I64X2:
-        return struct.pack('<2q', *value)
-    elif attr_type == AttributeType.F16X2:
-        return struct.pack('<2e', *value)
-    elif attr_type == AttributeType.F32X2:
-        return struct.pack('<2f', *value)
-    elif attr_type == AttributeType.F64X2:
-        return struct.pack('<2d', *value)
-    elif attr_type == AttributeType.U8X3:
-        return struct.pack('<3B', *value)
-    elif attr_type == AttributeType.U16X3:
-        return struct.pack('<3H', *value)
-    elif attr_type == AttributeType.U32X3:
-        return struct.pack('<3I', *value)
-    elif attr_type == AttributeType.U64X3:
-        return struct.pack('<3Q', *value)
-    elif attr_type == AttributeType.I8X3:
-        return struct.pack('<3b', *value)
-    elif attr_type == AttributeType.I16X3:
-        return struct.pack('<3h', *value)
-    elif attr_type == AttributeType.I32X3:
-        return struct.pack('<3i', *value)
-    elif attr_type == AttributeType.I64X3:
-        return struct.pack('<3q', *value)
-    elif attr_type == AttributeType.F16X3:
-        return struct.pack('<3e', *value)
-    elif attr_type == AttributeType.F32X3:
-        return struct.pack('<3f', *value)
-    elif attr_type == AttributeType.F64X3:
-        return struct.pack('<3d', *value)
-    elif attr_type == AttributeType.U8X4:
-        return struct.pack('<4B', *value)
-    elif attr_type == AttributeType.U16X4:
-        return struct.pack('<4H', *value)
-    elif attr_type == AttributeType.U32X4:
-        return struct.pack('<4I', *value)
-    elif attr_type == AttributeType.U64X4:
-        return struct.pack('<4Q', *value)
-    elif attr_type == AttributeType.I8X4:
-        return struct.pack('<4b', *value)
-    elif attr_type == AttributeType.I16X4:
-        return struct.pack('<4h', *value)
-    elif attr_type == AttributeType.I32X4:
-        return struct.pack('<4i', *value)
-    elif attr_type == AttributeType.I64X4:
-        return struct.pack('<4q', *value)
-    elif attr_type == AttributeType.F16X4:
-        return struct.pack('<4e', *value)
-    elif attr_type == AttributeType.F32X4:
-        return struct.pack('<4f', *value)
-    elif attr_type == AttributeType.F64X4:
-        return struct.pack('<4d', *value)
-    elif attr_type == AttributeType.U8X9:
-        return struct.pack('<9B', *value)
-    elif attr_type == AttributeType.U16X9:
-        return struct.pack('<9H', *value)
-    elif attr_type == AttributeType.U32X9:
-        return struct.pack('<9I', *value)
-    elif attr_type == AttributeType.U64X9:
-        return struct.pack('<9Q', *value)
-    elif attr_type == AttributeType.I8X9:
-        return struct.pack('<9b', *value)
-    elif attr_type == AttributeType.I16X9:
-        return struct.pack('<9h', *value)
-    elif attr_type == AttributeType.I32X9:
-        return struct.pack('<9i', *value)
-    elif attr_type == AttributeType.I64X9:
-        return struct.pack('<9q', *value)
-    elif attr_type == AttributeType.F16X9:
-        return struct.pack('<9e', *value)
-    elif attr_type == AttributeType.F32X9:
-        return struct.pack('<9f', *value)
-    elif attr_type == AttributeType.F64X9:
-        return struct.pack('<9d', *value)
-    elif attr_type == AttributeType.U8X16:
-        return struct.pack('<16B', *value)
-    elif attr_type == AttributeType.U16X16:
-        return struct.pack('<16H', *value)
-    elif attr_type == AttributeType.U32X16:
-        return struct.pack('<16I', *value)
-    elif attr_type == AttributeType.U64X16:
-        return struct.pack('<16Q', *value)
-    elif attr_type == AttributeType.I8X16:
-        return struct.pack('<16b', *value)
-    elif attr_type == AttributeType.I16X16:
-        return struct.pack('<16h', *value)
-    elif attr_type == AttributeType.I32X16:
-        return struct.pack('<16i', *value)
-    elif attr_type == AttributeType.I64X16:
-        return struct.pack('<16q', *value)
-    elif attr_type == AttributeType.F16X16:
-        return struct.pack('<16e', *value)
-    elif attr_type == AttributeType.F32X16:
-        return struct.pack('<16f', *value)
-    elif attr_type == AttributeType.F64X16:
-        return struct.pack('<16d', *value)
-    elif attr_type == AttributeType.U8_ARRAY:
-        return as_suint_bytes(len(value)) + \
-               struct.pack('<{}B'.format(len(value)), *value)
-    elif attr_type == AttributeType.U16_ARRAY:
-        return as_suint_bytes(len(value)) + \
-               struct.pack('<{}H'.format(len(value)), *value)
-    elif attr_type == AttributeType.U32_ARRAY:
-        return as_suint_bytes(len(value)) + \
-               struct.pack('<{}I'.format(len(value)), *value)
-    elif attr_type == AttributeType.U64_ARRAY:
-        return as_suint_bytes(len(value)) + \
-               struct.pack('<{}Q'.format(len(value)), *value)
-    elif attr_type == AttributeType.I8_ARRAY:
-        return as_suint_bytes(len(value)) + \
-               struct.pack('<{}b'.format(len(value)), *value)
-    elif attr_type == AttributeType.I16_ARRAY:
-        return as_suint_bytes(len(value)) + \
-               struct.pack('<{}h'.format(len(value)), *value)
-    elif attr_type == AttributeType.I32_ARRAY:
-        return as_suint_bytes(len(value)) + \
-               struct.pack('<{}i'.format(len(value)), *value)
-    elif attr_type == AttributeType.I64_ARRAY:
-        return as_suint_bytes(len(value)) + \
-               struct.pack('<{}q'.format(len(value)), *value)
-    elif attr_type == AttributeType.F16_ARRAY:
-        return as_suint_bytes(len(value)) + \
-               struct.pack('<{}e'.format(len(value)), *value)
-    elif attr_type == AttributeType.F32_ARRAY:
-        return as_suint_bytes(len(value)) + \
-               struct.pack('<{}f'.format(len(value)), *value)
-    elif attr_type == AttributeType.F64_ARRAY:
-        return as_suint_bytes(len(value)) + \
-               struct.pack('<{}d'.format(len(value)), *value)
-    elif attr_type == AttributeType.STR_ARRAY:
-        return as_suint_bytes(len(value)) + \
-               b''.join((as_str_bytes(s) for s in value))
-    else:
-        raise ValueError("unknown attribute type")
+class FormatFlag(IntFlag):
+    """Optional features of a version 2 mug file, stored in its header.
 
+    A file without any is written in version 1 format.
+    """
+    # Entities and attribute values are prefixed by their byte count, so they
+    # can be skipped in a single seek.
+    SIZED = 1
+    # Children are written in batches, each one prefixed by its child count,
+    # and the last one followed by a zero count, so entities can be written
+    # before their child count is known.
+    STREAMED = 2
+    # Entity and attribute names are stored once in a string table following
+    # the header, and referenced by their suint index.
+    STRING_TABLE = 4
+    # Entities are preceded by a u8 tag, and subtrees equal to a previous one
+    # are stored as a reference to it, see `INSTANCE_TAG`. Not combined with
+    # `STREAMED`.
+    INSTANCED = 8
+
+
+# Tags preceding entities of `FormatFlag.INSTANCED` files.
+ENTITY_TAG = 0
+# Entity referenced by following `REFERENCE_TAG` records.
+INSTANCE_TAG = 1
+# Reference to a previous `INSTANCE_TAG` entity and its descendants, stored
+# instead of them as the u64 byte count from the instance tag to this one.
+REFERENCE_TAG = 2
+
+
+class ArrayFormat(Enum):
+    """Python type numeric array attribute values are read as.
+
+    `ARRAY` and `MEMORYVIEW` copy the value bytes once into a contiguous typed
+    buffer instead of building a Python number per component. `array.array`
+    and `memoryview` can't hold half floats, so `F16_ARRAY` values are widened
+    to 32 bits floats in those formats.
+
+    `NUMPY` reads both numeric vectors (`U8X2` to `F64X16`) and arrays as
+    `numpy.ndarray` of the matching little-endian dtype, and requires NumPy.
+    """
+    TUPLE = 0  # tuple of Python numbers
+    ARRAY = 1  # array.array
+    MEMORYVIEW = 2  # memoryview over an array.array
+    NUMPY = 3  # numpy.ndarray
 
-def attr_value_read(fd: BinaryIO, attr_type: AttributeType):
-    if attr_type == AttributeType.U8:
-        return int.from_bytes(fd.read(1), BYTE_ORDER, signed=False)
-    elif attr_type == AttributeType.U16:
-        return int.from_bytes(fd.read(2), BYTE_ORDER, signed=False)
-    elif attr_type == AttributeType.U32:
-        return int.from_bytes(fd.read(4), BYTE_ORDER, signed=False)
-    elif attr_type == AttributeType.U64:
-        return int.from_bytes(fd.read(8), BYTE_ORDER, signed=True)
-    elif attr_type == AttributeType.I8:
-        return int.from_bytes(fd.read(1), BYTE_ORDER, signed=True)
-    elif attr_type == AttributeType.I16:
-        return int.from_bytes(fd.read(2), BYTE_ORDER, signed=True)
-    elif attr_type == AttributeType.I32:
-        return int.from_bytes(fd.read(4), BYTE_ORDER, signed=True)
-    elif attr_type == AttributeType.I64:
-        return int.from_bytes(fd.read(8), BYTE_ORDER, signed=True)
-    elif attr_type == AttributeType.F16:
-        return struct.unpack('<e', fd.read(2))[0]
-    elif attr_type == AttributeType.F32:
-        return struct.unpack('<f', fd.read(4))[0]
-    elif attr_type == AttributeType.F64:
-        return struct.unpack('<d', fd.read(8))[0]
-    elif attr_type == AttributeType.STR:
-        return str_read(fd)
-    elif attr_type == AttributeType.U8X2:
-        return struct.unpack('<2B', fd.read(2))
-    elif attr_type == AttributeType.U16X2:
-        return struct.unpack('<2H', fd.read(4))
-    elif attr_type == AttributeType.U32X2:
-        return struct.unpack('<2I', fd.read(8))
-    elif attr_type == AttributeType.U64X2:
-        return struct.unpack('<2Q', fd.read(16))
-    elif attr_type == AttributeType.I8X2:
-        return struct.unpack('<2b', fd.read(2))
-    elif attr_type == AttributeType.I16X2:
-        return struct.unpack('<2h', fd.read(4))
-    elif attr_type == AttributeType.I32X2:
-        return struct.unpack('<2i', fd.read(8))
-    elif attr_type == AttributeType.I64X2:
-        return struct.unpack('<2q', fd.read(16))
-    elif attr_type == AttributeType.F16X2:
-        return struct.unpack('<2e', fd.read(4))
-    elif attr_type == AttributeType.F32X2:
-        return struct.unpack('<2f', fd.read(8))
-    elif attr_type == AttributeType.F64X2:
-        return struct.unpack('<2d', fd.read(16))
-    elif attr_type == AttributeType.U8X3:
-        return struct.unpack('<3B', fd.read(3))
-    elif attr_type == AttributeType.U16X3:
-        return struct.unpack('<3H', fd.read(6))
-    elif attr_type == AttributeType.U32X3:
-        return struct.unpack('<3I', fd.read(12))
-    elif attr_type == AttributeType.U64X3:
-        return struct.unpack('<3Q', fd.read(24))
-    elif attr_type == AttributeType.I8X3:
-        return struct.unpack('<3b', fd.read(3))
-    elif attr_type == AttributeType.I16X3:
-        return struct.unpack('<3h', fd.read(6))
-    elif attr_type == AttributeType.I32X3:
-        return struct.unpack('<3i', fd.read(12))
-    elif attr_type == AttributeType.I64X3:
-        return struct.unpack('<3q', fd.read(24))
-    elif attr_type == AttributeType.F16X3:
-        return struct.unpack('<3e', fd.read(6))
-    elif attr_type == AttributeType.F32X3:
-        return struct.unpack('<3f', fd.read(12))
-    elif attr_type == AttributeType.F64X3:
-        return struct.unpack('<3d', fd.read(24))
-    elif attr_type == AttributeType.U8X4:
-        return struct.unpack('<4B', fd.read(4))
-    elif attr_type == AttributeType.U16X4:
-        return struct.unpack('<4H', fd.read(8))
-    elif attr_type == AttributeType.U32X4:
-        return struct.unpack('<4I', fd.read(16))
-    elif attr_type == AttributeType.U64X4:
-        return struct.unpack('<4Q', fd.read(32))
-    elif attr_type == AttributeType.I8X4:
-        return struct.unpack('<4b', fd.read(4))
-    elif attr_type == AttributeType.I16X4:
-        return struct.unpack('<4h', fd.read(8))
-    elif attr_type == AttributeType.I32X4:
-        return struct.unpack('<4i', fd.read(16))
-    elif attr_type == AttributeType.I64X4:
-        return struct.unpack('<4q', fd.read(32))
-    elif attr_type == AttributeType.F16X4:
-        return struct.unpack('<4e', fd.read(8))
-    elif attr_type == AttributeType.F32X4:
-        return struct.unpack('<4f', fd.read(16))
-    elif attr_type == AttributeType.F64X4:
-        return struct.unpack('<4d', fd.read(32))
-    elif attr_type == AttributeType.U8X9:
-        return struct.unpack('<9B', fd.read(9))
-    elif attr_type == AttributeType.U16X9:
-        return struct.unpack('<9H', fd.read(18))
-    elif attr_type == AttributeType.U32X9:
-        return struct.unpack('<9I', fd.read(36))
-    elif attr_type == AttributeType.U64X9:
-        return struct.unpack('<9Q', fd.read(72))
-    elif attr_type == AttributeType.I8X9:
-        return struct.unpack('<9b', fd.read(9))
-    elif attr_type == AttributeType.I16X9:
-        return struct.unpack('<9h', fd.read(18))
-    elif attr_type == AttributeType.I32X9:
-        return struct.unpack('<9i', fd.read(36))
-    elif attr_type == AttributeType.I64X9:
-        return struct.unpack('<9q', fd.read(72))
-    elif attr_type == AttributeType.F16X9:
-        return struct.unpack('<9e', fd.read(18))
-    elif attr_type == AttributeType.F32X9:
-        return struct.unpack('<9f', fd.read(36))
-    elif attr_type == AttributeType.F64X9:
-        return struct.unpack('<9d', fd.read(72))
-    elif attr_type == AttributeType.U8X16:
-        return struct.unpack('<16B', fd.read(16))
-    elif attr_type == AttributeType.U16X16:
-        return struct.unpack('<16H', fd.read(32))
-    elif attr_type == AttributeType.U32X16:
-        return struct.unpack('<16I', fd.read(64))
-    elif attr_type == AttributeType.U64X16:
-        return struct.unpack('<16Q', fd.read(128))
-    elif attr_type == AttributeType.I8X16:
-        return struct.unpack('<16b', fd.read(16))
-    elif attr_type == AttributeType.I16X16:
-        return struct.unpack('<16h', fd.read(32))
-    elif attr_type == AttributeType.I32X16:
-        return struct.unpack('<16i', fd.read(64))
-    elif attr_type == AttributeType.I64X16:
-        return struct.unpack('<16q', fd.read(128))
-    elif attr_type == AttributeType.F16X16:
-        return struct.unpack('<16e', fd.read(32))
-    elif attr_type == AttributeType.F32X16:
-        return struct.unpack('<16f', fd.read(64))
-    elif attr_type == AttributeType.F64X16:
-        return struct.unpack('<16d', fd.read(128))
-    elif attr_type == AttributeType.U8_ARRAY:
-        value_count = suint_read(fd)
-        return struct.unpack('<{}B'.format(value_count),
-                             fd.read(1 * value_count))
-    elif attr_type == AttributeType.U16_ARRAY:
-        value_count = suint_read(fd)
-        return struct.unpack('<{}H'.format(value_count),
-                             fd.read(2 * value_count))
-    elif attr_type == AttributeType.U32_ARRAY:
-        value_count = suint_read(fd)
-        return struct.unpack('<{}I'.format(value_count),
-                             fd.read(4 * value_count))
-    elif attr_type == AttributeType.U64_ARRAY:
-        value_count = suint_read(fd)
-        return struct.unpack('<{}Q'.format(value_count),
-                             fd.read(8 * value_count))
-    elif attr_type == AttributeType.I8_ARRAY:
-        value_count = suint_read(fd)
-        return struct.unpack('<{}b'.format(value_count),
-                             fd.read(1 * value_count))
-    elif attr_type == AttributeType.I16_ARRAY:
-        value_count = suint_read(fd)
-        return struct.unpack('<{}h'.format(value_count),
-                             fd.read(2 * value_count))
-    elif attr_type == AttributeType.I32_ARRAY:
-        value_count = suint_read(fd)
-        return struct.unpack('<{}i'.format(value_count),
-                             fd.read(4 * value_count))
-    elif attr_type == AttributeType.I64_ARRAY:
-        value_count = suint_read(fd)
-        return struct.unpack('<{}q'.format(value_count),
-                             fd.read(8 * value_count))
-    elif attr_type == AttributeType.F16_ARRAY:
-        value_count = suint_read(fd)
-        print(value_count)
-        return struct.unpack('<{}e'.format(value_count),
-                             fd.read(2 * value_count))
-    elif attr_type == AttributeType.F32_ARRAY:
-        value_count = suint_read(fd)
-        return struct.unpack('<{}f'.format(value_count),
-                             fd.read(4 * value_count))
-    elif attr_type == AttributeType.F64_ARRAY:
-        value_count = suint_read(fd)
-        return struct.unpack('<{}d'.format(value_count),
-                             fd.read(8 * value_count))
-    elif attr_type == AttributeType.STR_ARRAY:
-        value_count = suint_read(fd)
-        return [str_read(fd) for _ in range(value_count)]
 
-    else:
-        raise ValueError("unknown attribute type")
+class AttributeCodec:
+    """Encoder and decoder of an attribute type value.
 
+    Subclass it and register an instance with `register_codec` to add a new
+    attribute type.
 
-def suint_read(fd: BinaryIO):
-    value = int.from_bytes(fd.read(1), BYTE_ORDER)
-    if value == MAX_U8:
-        value = int.from_bytes(fd.read(2), BYTE_ORDER)
-        if value == MAX_U16:
-            value = int.from_bytes(fd.read(4), BYTE_ORDER)
-            if value == MAX_U32:
-                value = int.from_bytes(fd.read(8), BYTE_ORDER)
+    Attributes:
+        size (Optional[int]): Encoded byte count of the value for fixed sized
+            types, None for variable sized ones.
+    """
 
-    return value
+    size: Optional[int] = None
 
+    def as_bytes(self, value: Any) -> bytes:
+        """Encode `value`.
 
-def as_suint_bytes(value):
-    if value < MAX_U8:
-        return value.to_bytes(1, BYTE_ORDER)
-    elif value < MAX_U16:
-        return bytes((MAX_U8,)) + value.to_bytes(2, BYTE_ORDER)
-    elif value < MAX_U32:
-        return bytes((MAX_U8, MAX_U8, MAX_U8)) + value.to_bytes(4, BYTE_ORDER)
-    elif value < MAX_U64:
-        return bytes((MAX_U8, MAX_U8, MAX_U8, MAX_U8, MAX_U8, MAX_U8, MAX_U8)) \
-               + value.to_bytes(8, BYTE_ORDER)
-    else:
-        raise ValueError("invalid shortest uint value")
+        Args:
+            value: Value to encode.
 
+        Returns:
+            Encoded value.
+        """
+        raise NotImplementedError
 
-def suint_write(fd: BinaryIO, value: int):
-    fd.write(as_suint_bytes(value))
+    def read(self, fd: BinaryIO) -> Any:
+        """Decode a value from `fd` file object.
 
+        Args:
+            fd: File object to read from.
 
-def as_str_bytes(value: str):
-    byte_value = value.encode()
-    return as_suint_bytes(len(byte_value)) + byte_value
+        Returns:
+            Decoded value.
+        """
+        raise NotImplementedError
 
+    def skip(self, fd: BinaryIO):
+        """Move `fd` file object past a value, without decoding it.
 
-def str_read(fd: BinaryIO) -> str:
-    value_len = suint_read(fd)
-    byte_value = fd.read(value_len)
-    return byte_value.decode('utf-8')
+        Fixed sized values are skipped with a single seek.
 
+        Args:
+            fd: File object to read from.
+        """
+        if self.size is not None:
+            fd.seek(self.size, io.SEEK_CUR)
+        else:
+            self.read(fd)
 
-class Attribute:
-    """Named object that store a typed value.
+    def reader(self, array_format: ArrayFormat) -> Callable[[BinaryIO], Any]:
+        """Return the function decoding values in `array_format` format.
 
-    Examples:
-        >>> entity = Entity("my_entity")
-        >>> attr = Attribute("my_attr", AttributeType.U8, 42)
-        >>> entity.attributes.append(attr)
+        Args:
+            array_format: Format to read numeric arrays as.
 
-    Attributes:
-        name (str): Attribute name.
-        type_ (AttributeType): Attribute type.
-        value (Any): Attribute value.
-    """
+        Returns:
+            Function reading a value from a file object.
+        """
+        return self.read
 
-    def __init__(self, name: str, type_: AttributeType, value: Any):
-        """Initialize attribute.
+    def unpack_from(self, buffer: ReadBuffer, offset: int) -> Tuple[Any, int]:
+        """Decode a value from `buffer` at `offset`.
+
+        The default implementation calls `read` on a file object wrapping
+        `buffer`, override it for faster decoding.
 
         Args:
-            name (str): Attribute name.
-            type_ (AttributeType): Attribute type.
-            value (Any): Attribute value.
+            buffer: Buffer to read from.
+            offset: Offset of the value in `buffer`.
+
+        Returns:
+            Decoded value and offset following it.
         """
-        self.name: str = name
-        self.type_: AttributeType = type_
-        self.value: Any = value
+        fd = _BufferFile(buffer, offset)
+        return self.read(fd), fd.tell()
 
+    def skip_from(self, buffer: ReadBuffer, offset: int) -> int:
+        """Return the offset following the value at `offset` in `buffer`.
 
-class Entity:
-    """Named object that can have children and attributes.
+        Args:
+            buffer: Buffer to read from.
+            offset: Offset of the value in `buffer`.
 
-    Examples:
-        >>> a = Entity("foo")
-        >>> b = Entity("bar")
-        >>> a.children.append(b)  # Set "bar" a child of "foo".
+        Returns:
+            Offset following the value.
+        """
+        if self.size is not None:
+            return offset + self.size
 
-    Attributes:
-        name (str): Entity name.
-        attributes (List[Attribute]): Entity attributes.
-        children (List[Enitity]): Entity children.
-    """
+        return self.unpack_from(buffer, offset)[1]
 
-    def __init__(self, name: str):
-        """Initialize entity.
+    def buffer_reader(self, array_format: ArrayFormat) \
+            -> Callable[[ReadBuffer, int], Tuple[Any, int]]:
+        """Return the function decoding values from buffers in `array_format`.
 
         Args:
-            name (str): Entity name.
+            array_format: Format to read numeric arrays as.
+
+        Returns:
+            Function reading a value from a buffer at an offset and returning
+            it with the offset following it.
         """
-        self.name = name
-        self.attributes: List[Attribute] = []
-        self.children: List[Entity] = []
+        return self.unpack_from
 
 
-def write_recursive(fd: BinaryIO, entity: Entity):
-    """A recursive version of `write`
+class ScalarCodec(AttributeCodec):
+    """Codec of a single component numeric value.
 
     Args:
-        fd: File object to write in.
-        entity: Entity to write.
+        format_ (str): `struct` format character of the value.
     """
-    fd.write(as_str_bytes(entity.name))
 
-    fd.write(as_suint_bytes(len(entity.attributes)))  # attribute count
+    def __init__(self, format_: str):
+        self._struct = struct.Struct('<' + format_)
+        self.size = self._struct.size
+        self.format = format_
 
-    for attr in entity.attributes:
-        fd.write(as_str_bytes(attr.name))
-        fd.write(attr.type_.to_bytes(1, BYTE_ORDER, signed=False))
-        fd.write(as_attr_value_bytes(attr.type_, attr.value))
+    def as_bytes(self, value: Any) -> bytes:
+        return self._struct.pack(value)
 
-    fd.write(as_suint_bytes(len(entity.children)))
+    def read(self, fd: BinaryIO) -> Any:
+        return self._struct.unpack(fd.read(self.size))[0]
 
-    for child_entity in entity.children:
-        write_recursive(fd, child_entity)
+    def unpack_from(self, buffer: ReadBuffer, offset: int) -> Tuple[Any, int]:
+        return self._struct.unpack_from(buffer, offset)[0], offset + self.size
 
 
-def write(fd: BinaryIO, entity: Entity):
-    """Write mug scene to `fd` file object.
+class VectorCodec(AttributeCodec):
+    """Codec of a fixed component count numeric value, read as a tuple.
+
+    Values can also be written from, and read as, a `numpy.ndarray`.
 
     Args:
-        fd: File object to write in.
-        entity: Root entity to write.
+        format_ (str): `struct` format character of a component.
+        count (int): Component count.
+    """
+
+    def __init__(self, format_: str, count: int):
+        self._struct = struct.Struct('<{}{}'.format(count, format_))
+        self.size = self._struct.size
+        self.format = format_
+        self.count = count
+        self.dtype = _DTYPES[format_]
+
+    def as_bytes(self, value: Any) -> bytes:
+        if _is_ndarray(value):
+            if value.size != self.count:
+                raise ValueError("invalid component count")
+
+            return _ndarray_bytes(value, self.dtype)
+
+        return self._struct.pack(*value)
+
+    def read(self, fd: BinaryIO) -> Any:
+        return self._struct.unpack(fd.read(self.size))
+
+    def read_numpy(self, fd: BinaryIO) -> Any:
+        """Decode a value from `fd` file object as a `numpy.ndarray`.
+
+        Args:
+            fd: File object to read from.
+
+        Returns:
+            Decoded value.
+        """
+        return _numpy().frombuffer(_read_bytearray(fd, self.size), self.dtype)
+
+    def reader(self, array_format: ArrayFormat) -> Callable[[BinaryIO], Any]:
+        if array_format is ArrayFormat.NUMPY:
+            return self.read_numpy
+
+        return self.read
+
+    def unpack_from(self, buffer: ReadBuffer, offset: int) -> Tuple[Any, int]:
+        return self._struct.unpack_from(buffer, offset), offset + self.size
+
+    def unpack_numpy_from(self, buffer: ReadBuffer,
+                          offset: int) -> Tuple[Any, int]:
+        """Buffer version of `read_numpy`, the array references `buffer`."""
+        end = offset + self.size
+
+        if end > len(buffer):
+            raise TruncatedError("unexpected end of file")
+
+        return _numpy().frombuffer(buffer, self.dtype, self.count, offset), \
+            end
+
+    def buffer_reader(self, array_format: ArrayFormat) \
+            -> Callable[[ReadBuffer, int], Tuple[Any, int]]:
+        if array_format is ArrayFormat.NUMPY:
+            return self.unpack_numpy_from
+
+        return self.unpack_from
+
+
+class ArrayCodec(AttributeCodec):
+    """Codec of a variable component count numeric value, read as a tuple.
+
+    Values can also be written from, and read as, an `array.array`, a
+    `memoryview` or a `numpy.ndarray` (see `ArrayFormat`). Multidimensional
+    `numpy.ndarray` values are written flattened.
+
+    Args:
+        format_ (str): `struct` format character of a component.
     """
-    fd.write(b'MUGS')
-    write_recursive(fd, entity)
 
+    def __init__(self, format_: str):
+        self.format = format_
+        self.item_size = struct.calcsize('<' + format_)
+        self.typecode = _array_typecode(format_, self.item_size)
+        self.dtype = _DTYPES[format_]
+
+    def as_bytes(self, value: Any) -> bytes:
+        if _is_ndarray(value):
+            return as_suint_bytes(value.size) + \
+                _ndarray_bytes(value, self.dtype)
+
+        count = len(value)
+
+        if _NATIVE_LITTLE_ENDIAN and self.typecode is not None and \
+                _buffer_format(value) == self.typecode:
+            return as_suint_bytes(count) + value.tobytes()
+
+        return as_suint_bytes(count) + \
+            struct.pack('<{}{}'.format(count, self.format), *value)
+
+    def read(self, fd: BinaryIO) -> Any:
+        count = suint_read(fd)
+        return struct.unpack('<{}{}'.format(count, self.format),
+                             fd.read(self.item_size * count))
+
+    def skip(self, fd: BinaryIO):
+        fd.seek(self.item_size * suint_read(fd), io.SEEK_CUR)
+
+    def read_array(self, fd: BinaryIO) -> array:
+        """Decode a value from `fd` file object as an `array.array`.
+
+        Args:
+            fd: File object to read from.
+
+        Returns:
+            Decoded value.
+        """
+        if self.typecode is None:  # half floats
+            return array('f', self.read(fd))
+
+        value = array(self.typecode, (0,)) * suint_read(fd)
+        _read_into(fd, memoryview(value).cast('B'))
+
+        if not _NATIVE_LITTLE_ENDIAN:
+            value.byteswap()
+
+        return value
+
+    def read_memoryview(self, fd: BinaryIO) -> memoryview:
+        """Decode a value from `fd` file object as a `memoryview`.
+
+        Args:
+            fd: File object to read from.
+
+        Returns:
+            Decoded value.
+        """
+        return memoryview(self.read_array(fd))
+
+    def read_numpy(self, fd: BinaryIO) -> Any:
+        """Decode a value from `fd` file object as a `numpy.ndarray`.
+
+        Args:
+            fd: File object to read from.
+
+        Returns:
+            Decoded value.
+        """
+        data = _read_bytearray(fd, self.item_size * suint_read(fd))
+        return _numpy().frombuffer(data, self.dtype)
+
+    def reader(self, array_format: ArrayFormat) -> Callable[[BinaryIO], Any]:
+        if array_format is ArrayFormat.ARRAY:
+            return self.read_array
+        elif array_format is ArrayFormat.MEMORYVIEW:
+            return self.read_memoryview
+        elif array_format is ArrayFormat.NUMPY:
+            return self.read_numpy
+
+        return self.read
 
-def read_recursive(fd: BinaryIO):
+    def _payload_range(self, buffer: ReadBuffer,
+                       offset: int) -> Tuple[int, int, int]:
+        """Return component count, start and end offsets of a value."""
+        count, start = suint_unpack_from(buffer, offset)
+        end = start + self.item_size * count
+
+        if end > len(buffer):
+            raise TruncatedError("unexpected end of file")
+
+        return count, start, end
+
+    def unpack_from(self, buffer: ReadBuffer, offset: int) -> Tuple[Any, int]:
+        count, start, end = self._payload_range(buffer, offset)
+        return struct.unpack_from('<{}{}'.format(count, self.format), buffer,
+                                  start), end
+
+    def skip_from(self, buffer: ReadBuffer, offset: int) -> int:
+        return self._payload_range(buffer, offset)[2]
+
+    def unpack_array_from(self, buffer: ReadBuffer,
+                          offset: int) -> Tuple[array, int]:
+        """Buffer version of `read_array`."""
+        if self.typecode is None:  # half floats
+            value, offset = self.unpack_from(buffer, offset)
+            return array('f', value), offset
+
+        _, start, end = self._payload_range(buffer, offset)
+        value = array(self.typecode)
+        value.frombytes(memoryview(buffer)[start:end])
+
+        if not _NATIVE_LITTLE_ENDIAN:
+            value.byteswap()
+
+        return value, end
+
+    def unpack_memoryview_from(self, buffer: ReadBuffer,
+                               offset: int) -> Tuple[memoryview, int]:
+        """Buffer version of `read_memoryview`.
+
+        The value references `buffer` when the component type is natively
+        supported, a copy is made otherwise.
+        """
+        if self.typecode is None or not _NATIVE_LITTLE_ENDIAN:
+            value, offset = self.unpack_array_from(buffer, offset)
+            return memoryview(value), offset
+
+        _, start, end = self._payload_range(buffer, offset)
+        return memoryview(buffer)[start:end].cast(self.typecode), end
+
+    def unpack_numpy_from(self, buffer: ReadBuffer,
+                          offset: int) -> Tuple[Any, int]:
+        """Buffer version of `read_numpy`, the array references `buffer`."""
+        count, start, end = self._payload_range(buffer, offset)
+        return _numpy().frombuffer(buffer, self.dtype, count, start), end
+
+    def buffer_reader(self, array_format: ArrayFormat) \
+            -> Callable[[ReadBuffer, int], Tuple[Any, int]]:
+        if array_format is ArrayFormat.ARRAY:
+            return self.unpack_array_from
+        elif array_format is ArrayFormat.MEMORYVIEW:
+            return self.unpack_memoryview_from
+        elif array_format is ArrayFormat.NUMPY:
+            return self.unpack_numpy_from
+
+        return self.unpack_from
+
+
+def _read_into(fd: BinaryIO, buffer: ReadBuffer):
+    """Fill `buffer` with bytes read from `fd` file object."""
+    readinto = getattr(fd, 'readinto', None)
+
+    if readinto is None:
+        data = fd.read(len(buffer))
+        buffer[:len(data)] = data
+        read_count = len(data)
+    else:
+        read_count = readinto(buffer)
+
+    if read_count != len(buffer):
+        raise TruncatedError("unexpected end of file")
+
+
+class _BufferFile(io.RawIOBase):
+    """Read only file object over a buffer, without copying it."""
+
+    def __init__(self, buffer: ReadBuffer, offset: int = 0):
+        super().__init__()
+        self._buffer = memoryview(buffer)
+        self._offset = offset
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        data = self._buffer[self._offset:self._offset + len(b)]
+        b[:len(data)] = data
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+
+def _seekable(fd: BinaryIO) -> bool:
+    """Return if `fd` file object can seek."""
+    try:
+        return fd.seekable()
+    except AttributeError:
+        return False
+
+
+def _read_bytearray(fd: BinaryIO, size: int) -> bytearray:
+    """Read `size` bytes from `fd` file object in a new bytearray."""
+    data = bytearray(size)
+    _read_into(fd, memoryview(data))
+    return data
+
+
+def _numpy():
+    """Return `numpy` module, imported on first use as it's optional."""
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("numpy is required to read numpy arrays") from None
+
+    return numpy
+
+
+def _is_ndarray(value: Any) -> bool:
+    """Return if `value` is a `numpy.ndarray`, without importing numpy."""
+    numpy = sys.modules.get('numpy')
+    return numpy is not None and isinstance(value, numpy.ndarray)
+
+
+def _ndarray_bytes(value: Any, dtype: str) -> bytes:
+    """Return `value` `numpy.ndarray` as bytes of `dtype` components.
+
+    Raises:
+        ValueError: If `value` has components of another kind than `dtype`
+            ones, like floats for integer types, or values out of `dtype`
+            range.
     """
+    numpy = _numpy()
+    dtype = numpy.dtype(dtype)
+
+    if numpy.can_cast(value.dtype, dtype):
+        return numpy.ascontiguousarray(value, dtype).tobytes()
+
+    if value.dtype.kind not in ('biuf' if dtype.kind == 'f' else 'biu'):
+        raise ValueError("invalid array component type")
+
+    with numpy.errstate(over='ignore', invalid='ignore'):
+        cast = numpy.ascontiguousarray(value, dtype)
+
+    if dtype.kind == 'f':
+        changed = numpy.isfinite(value) & ~numpy.isfinite(cast)
+    else:
+        changed = cast != value
+
+    if changed.any():
+        raise ValueError("array component out of range")
+
+    return cast.tobytes()
+
+
+def _array_typecode(format_: str, item_size: int) -> Optional[str]:
+    """Return `array.array` typecode of `format_` components, if any."""
+    for typecode in (format_, format_.replace('I', 'L').replace('i', 'l')):
+        if typecode != 'e' and array(typecode).itemsize == item_size:
+            return typecode
+
+    return None
+
+
+def _buffer_format(value: Any) -> Optional[str]:
+    """Return the component format of `array.array` or 1D `memoryview`."""
+    if isinstance(value, array):
+        return value.typecode
+    elif isinstance(value, memoryview) and value.ndim == 1:
+        return value.format
+
+    return None
+
+
+class StrCodec(AttributeCodec):
+    """Codec of a string value."""
+
+    def as_bytes(self, value: Any) -> bytes:
+        return as_str_bytes(value)
+
+    def read(self, fd: BinaryIO) -> Any:
+        return str_read(fd)
+
+    def skip(self, fd: BinaryIO):
+        str_skip(fd)
+
+    def unpack_from(self, buffer: ReadBuffer, offset: int) -> Tuple[Any, int]:
+        return str_unpack_from(buffer, offset)
+
+    def skip_from(self, buffer: ReadBuffer, offset: int) -> int:
+        return str_skip_from(buffer, offset)
+
+
+class StrArrayCodec(AttributeCodec):
+    """Codec of a variable count string value, read as a list."""
+
+    def as_bytes(self, value: Any) -> bytes:
+        return as_suint_bytes(len(value)) + \
+            b''.join([as_str_bytes(s) for s in value])
+
+    def read(self, fd: BinaryIO) -> Any:
+        return [str_read(fd) for _ in range(suint_read(fd))]
+
+    def skip(self, fd: BinaryIO):
+        for _ in range(suint_read(fd)):
+            str_skip(fd)
+
+    def unpack_from(self, buffer: ReadBuffer, offset: int) -> Tuple[Any, int]:
+        count, offset = suint_unpack_from(buffer, offset)
+        value = []
+
+        for _ in range(count):
+            item, offset = str_unpack_from(buffer, offset)
+            value.append(item)
+
+        return value, offset
+
+    def skip_from(self, buffer: ReadBuffer, offset: int) -> int:
+        count, offset = suint_unpack_from(buffer, offset)
+
+        for _ in range(count):
+            offset = str_skip_from(buffer, offset)
+
+        return offset
+
+
+# `struct` format character of each numeric component type, in attribute type
+# code order.
+_COMPONENT_FORMATS = 'BHIQbhiqefd'
+
+# Attribute type code -> codec.
+_CODECS: Dict[int, AttributeCodec] = {}
+
+# Attribute type code -> attribute type (or plain code for registered types).
+_ATTR_TYPES: Dict[int, int] = {t.value: t for t in AttributeType}
+
+
+def _register_builtin_codecs():
+    for i, format_ in enumerate(_COMPONENT_FORMATS):
+        _CODECS[AttributeType.U8 + i] = ScalarCodec(format_)
+        _CODECS[AttributeType.U8_ARRAY + i] = ArrayCodec(format_)
+
+        for first_type, count in ((AttributeType.U8X2, 2),
+                                  (AttributeType.U8X3, 3),
+                                  (AttributeType.U8X4, 4),
+                                  (AttributeType.U8X9, 9),
+                                  (AttributeType.U8X16, 16)):
+            _CODECS[first_type + i] = VectorCodec(format_, count)
+
+    _CODECS[AttributeType.STR] = StrCodec()
+    _CODECS[AttributeType.STR_ARRAY] = StrArrayCodec()
+
+
+_register_builtin_codecs()
+
+
+def register_codec(type_code: int, codec: AttributeCodec):
+    """Register `codec` to read and write attributes of `type_code` type.
+
+    Examples:
+        >>> class BoolCodec(AttributeCodec):
+        ...     size = 1
+        ...     def as_bytes(self, value):
+        ...         return b'\\x01' if value else b'\\x00'
+        ...     def read(self, fd):
+        ...         return fd.read(1) != b'\\x00'
+        >>> register_codec(200, BoolCodec())
+        >>> attr = Attribute("my_attr", 200, True)
 
     Args:
-        fd: File object to read from.
+        type_code: Attribute type code, stored as a u8 so between 0 and 255.
+        codec: Codec of the attribute type.
 
-    Returns:
-        Read entity.
+    Raises:
+        ValueError: If `type_code` is out of range or used by a built-in
+            attribute type.
     """
-    entity_name = str_read(fd)
+    if not 0 <= type_code <= MAX_U8:
+        raise ValueError("attribute type code out of range")
 
-    entity = Entity(entity_name)
+    if isinstance(_ATTR_TYPES.get(type_code), AttributeType):
+        raise ValueError("attribute type code used by a built-in type")
 
-    attribute_count = suint_read(fd)
+    _CODECS[type_code] = codec
+    _ATTR_TYPES[type_code] = type_code
 
-    for _ in range(attribute_count):
-        attr_name = str_read(fd)
-        attr_type = attr_type_read(fd)
-        attr_value = attr_value_read(fd, attr_type)
 
-        attr = Attribute(attr_name, attr_type, attr_value)
+def get_codec(attr_type: int) -> AttributeCodec:
+    """Return the codec of `attr_type` attribute type.
 
-        entity.attributes.append(attr)
+    Args:
+        attr_type: Attribute type code.
 
-    child_count = suint_read(fd)
+    Returns:
+        Attribute type codec.
 
-    for _ in range(child_count):
-        child = read_recursive(fd)
+    Raises:
+        ValueError: If `attr_type` has no codec.
+    """
+    try:
+        return _CODECS[attr_type]
+    except KeyError:
+        raise ValueError("unknown attribute type") from None
 
-        entity.children.append(child)
 
-    return entity
+def attr_type_read(fd: BinaryIO) -> AttributeType:
+    try:
+        return _ATTR_TYPES[fd.read(1)[0]]
+    except (KeyError, IndexError):
+        raise ValueError("unknown attribute type") from None
 
 
-def read(fd: BinaryIO) -> Entity:
-    """Read mug scene from `fd` file object.
+def attr_type_unpack_from(buffer: ReadBuffer,
+                          offset: int) -> Tuple[AttributeType, int]:
+    """Buffer version of `attr_type_read`.
 
     Args:
-        fd: File object to read from.
+        buffer: Buffer to read from.
+        offset: Offset of the value in `buffer`.
 
     Returns:
-        Root entity.
+        Read attribute type and offset following it.
     """
-    if fd.read(4) != b'MUGS':
-        raise ValueError("not a valid mug file format")
+    try:
+        return _ATTR_TYPES[buffer[offset]], offset + 1
+    except KeyError:
+        raise ValueError("unknown attribute type") from None
+
+
+def as_attr_value_bytes(attr_type: AttributeType, value: Any):
+    return get_codec(attr_type).as_bytes(value)
+
+
+def attr_value_read(fd: BinaryIO, attr_type: AttributeType):
+    return get_codec(attr_type).read(fd)
 
-    return read_recursive(fd)
+
+def _value_readers(array_format: ArrayFormat) \
+        -> Dict[int, Callable[[BinaryIO], Any]]:
+    """Return attribute type code -> value reading function table."""
+    return {type_code: codec.reader(array_format)
+            for type_code, codec in _CODECS.items()}
+
+
+def _value_skippers() -> Dict[int, Callable[[BinaryIO], None]]:
+    """Return attribute type code -> value skipping function table."""
+    return {type_code: codec.skip for type_code, codec in _CODECS.items()}
+
+
+def _buffer_value_readers(array_format: ArrayFormat) \
+        -> Dict[int, Callable[[ReadBuffer, int], Tuple[Any, int]]]:
+    """Return attribute type code -> buffer value reading function table."""
+    return {type_code: codec.buffer_reader(array_format)
+            for type_code, codec in _CODECS.items()}
+
+
+def _buffer_value_skippers() -> Dict[int, Callable[[ReadBuffer, int], int]]:
+    """Return attribute type code -> buffer value skipping function table."""
+    return {type_code: codec.skip_from for type_code, codec in _CODECS.items()}
+
+
+def suint_read(fd: BinaryIO):
+    value = int.from_bytes(fd.read(1), BYTE_ORDER)
+    if value == MAX_U8:
+        value = int.from_bytes(fd.read(2), BYTE_ORDER)
+        if value == MAX_U16:
+            value = int.from_bytes(fd.read(4), BYTE_ORDER)
+            if value == MAX_U32:
+                value = int.from_bytes(fd.read(8), BYTE_ORDER)
+
+    return value
+
+
+_U16 = struct.Struct('<H')
+_U32 = struct.Struct('<I')
+_U64 = struct.Struct('<Q')
+
+# Byte count of a `REFERENCE_TAG` record.
+_REFERENCE_SIZE = 1 + _U64.size
+
+
+def suint_unpack_from(buffer: ReadBuffer, offset: int) -> Tuple[int, int]:
+    """Buffer version of `suint_read`.
+
+    Args:
+        buffer: Buffer to read from.
+        offset: Offset of the value in `buffer`.
+
+    Returns:
+        Read value and offset following it.
+    """
+    value = buffer[offset]
+    if value != MAX_U8:
+        return value, offset + 1
+
+    value = _U16.unpack_from(buffer, offset + 1)[0]
+    if value != MAX_U16:
+        return value, offset + 3
+
+    value = _U32.unpack_from(buffer, offset + 3)[0]
+    if value != MAX_U32:
+        return value, offset + 7
+
+    return _U64.unpack_from(buffer, offset + 7)[0], offset + 15
+
+
+def as_suint_bytes(value):
+    if value < MAX_U8:
+        return value.to_bytes(1, BYTE_ORDER)
+    elif value < MAX_U16:
+        return bytes((MAX_U8,)) + value.to_bytes(2, BYTE_ORDER)
+    elif value < MAX_U32:
+        return bytes((MAX_U8, MAX_U8, MAX_U8)) + value.to_bytes(4, BYTE_ORDER)
+    elif value < MAX_U64:
+        return bytes((MAX_U8, MAX_U8, MAX_U8, MAX_U8, MAX_U8, MAX_U8, MAX_U8)) \
+               + value.to_bytes(8, BYTE_ORDER)
+    else:
+        raise ValueError("invalid shortest uint value")
+
+
+def suint_write(fd: BinaryIO, value: int):
+    fd.write(as_suint_bytes(value))
+
+
+def as_str_bytes(value: str):
+    byte_value = value.encode()
+    return as_suint_bytes(len(byte_value)) + byte_value
+
+
+def str_read(fd: BinaryIO) -> str:
+    value_len = suint_read(fd)
+    byte_value = fd.read(value_len)
+    return byte_value.decode('utf-8')
+
+
+def str_skip(fd: BinaryIO):
+    """Move `fd` file object past a string, without decoding it.
+
+    Args:
+        fd: File object to read from.
+    """
+    fd.seek(suint_read(fd), io.SEEK_CUR)
+
+
+def name_skip(fd: BinaryIO, strings: Optional[List[str]]):
+    """Move `fd` file object past an entity or attribute name.
+
+    Args:
+        fd: File object to read from.
+        strings: File string table, names being inline strings if None.
+    """
+    if strings is None:
+        str_skip(fd)
+    else:
+        suint_read(fd)  # string index
+
+
+def str_unpack_from(buffer: ReadBuffer, offset: int) -> Tuple[str, int]:
+    """Buffer version of `str_read`.
+
+    Args:
+        buffer: Buffer to read from.
+        offset: Offset of the value in `buffer`.
+
+    Returns:
+        Read value and offset following it.
+    """
+    value_len = buffer[offset]
+    if value_len == MAX_U8:
+        value_len, offset = suint_unpack_from(buffer, offset)
+    else:
+        offset += 1
+
+    end = offset + value_len
+
+    if end > len(buffer):
+        raise TruncatedError("unexpected end of file")
+
+    return buffer[offset:end].decode('utf-8'), end
+
+
+def str_skip_from(buffer: ReadBuffer, offset: int) -> int:
+    """Return the offset following the string at `offset` in `buffer`.
+
+    Args:
+        buffer: Buffer to read from.
+        offset: Offset of the value in `buffer`.
+
+    Returns:
+        Offset following the value.
+    """
+    value_len, offset = suint_unpack_from(buffer, offset)
+    end = offset + value_len
+
+    if end > len(buffer):
+        raise TruncatedError("unexpected end of file")
+
+    return end
+
+
+class Attribute:
+    """Named object that store a typed value.
+
+    Examples:
+        >>> entity = Entity("my_entity")
+        >>> attr = Attribute("my_attr", AttributeType.U8, 42)
+        >>> entity.attributes.append(attr)
+
+    Attributes:
+        name (str): Attribute name.
+        type_ (AttributeType): Attribute type.
+        value (Any): Attribute value.
+    """
+
+    __slots__ = ('name', 'type_', 'value')
+
+    def __init__(self, name: str, type_: AttributeType, value: Any):
+        """Initialize attribute.
+
+        Args:
+            name (str): Attribute name.
+            type_ (AttributeType): Attribute type.
+            value (Any): Attribute value.
+        """
+        self.name: str = name
+        self.type_: AttributeType = type_
+        self.value: Any = value
+
+
+class NamedList(list):
+    """List of entities or attributes, indexing them by name on lookup.
+
+    The name index is built by the first `get` call and rebuilt after the
+    list changes. Renaming an item already in the list isn't a list change:
+    an item renamed away is detected, but not one renamed to a looked up
+    name.
+    """
+
+    # Length and first index of each name once indexed. Appending,
+    # extending and inserting change the length, other mutations reset it
+    # and increment the version, so length and version change on any list
+    # change.
+    __slots__ = ('_names', '_version')
+
+    def get(self, name: str, default: Any = None) -> Any:
+        """Return the first item named `name`.
+
+        Args:
+            name: Item name.
+            default: Returned if there is no such item.
+
+        Returns:
+            Item, or `default`.
+        """
+        names = getattr(self, '_names', None)
+
+        if names is None or names[0] != len(self):
+            names = self._index()
+
+        index = names[1].get(name)
+
+        if index is not None and self[index].name != name:  # renamed
+            index = self._index()[1].get(name)
+
+        return default if index is None else self[index]
+
+    def _index(self) -> Tuple[int, Dict[str, int]]:
+        """Index item names, the first item winning on duplicates."""
+        indices: Dict[str, int] = {}
+
+        for index, item in enumerate(self):
+            indices.setdefault(item.name, index)
+
+        names = self._names = (len(self), indices)
+        return names
+
+    def _changed(self):
+        self._names = None
+        self._version = getattr(self, '_version', 0) + 1
+
+    def __setitem__(self, index, value):
+        self._changed()
+        super().__setitem__(index, value)
+
+    def __delitem__(self, index):
+        self._changed()
+        super().__delitem__(index)
+
+    def __imul__(self, count):
+        self._changed()
+        return super().__imul__(count)
+
+    def pop(self, index=-1):
+        self._changed()
+        return super().pop(index)
+
+    def remove(self, value):
+        self._changed()
+        super().remove(value)
+
+    def clear(self):
+        self._changed()
+        super().clear()
+
+    def sort(self, *args, **kwargs):
+        self._changed()
+        super().sort(*args, **kwargs)
+
+    def reverse(self):
+        self._changed()
+        super().reverse()
+
+
+def _get_named(items: List[Any], name: str) -> Any:
+    """Return the first of `items` named `name`, None if there is none."""
+    if isinstance(items, NamedList):
+        return items.get(name)
+
+    for item in items:
+        if item.name == name:
+            return item
+
+    return None
+
+
+def find_path(entities: List['Entity'],
+              names: List[str]) -> Optional['Entity']:
+    """Return the first entity having `names` path from one of `entities`.
+
+    Entities are searched depth first, in file order, as `read_entity` does.
+    The first entity matching each name is followed, other matching ones
+    only being searched when it has no descendant matching the rest of the
+    path.
+
+    Args:
+        entities: Entities matched against the first name.
+        names: Entity names of the path, from one of `entities`.
+
+    Returns:
+        First entity matching `names`, None if there is none.
+    """
+    entity = _get_named(entities, names[0])
+
+    for name in names[1:]:
+        if entity is None:
+            break
+
+        entity = _get_named(entity.children, name)
+
+    if entity is not None:
+        return entity
+
+    last_depth = len(names) - 1
+    stack = [(entity, 0) for entity in reversed(entities)]
+
+    while stack:
+        entity, depth = stack.pop()
+
+        if entity.name != names[depth]:
+            continue
+
+        if depth == last_depth:
+            return entity
+
+        stack.extend((child, depth + 1) for child in reversed(entity.children))
+
+    return None
+
+
+class Entity:
+    """Named object that can have children and attributes.
+
+    Examples:
+        >>> a = Entity("foo")
+        >>> b = Entity("bar")
+        >>> a.children.append(b)  # Set "bar" a child of "foo".
+        >>> a.find("bar") is b
+        True
+
+    Attributes:
+        name (str): Entity name.
+        attributes (List[Attribute]): Entity attributes, a `NamedList`
+            unless replaced by another list, then searched linearly.
+        children (List[Enitity]): Entity children, a `NamedList` unless
+            replaced by another list, then searched linearly.
+    """
+
+    __slots__ = ('name', 'attributes', 'children')
+
+    def __init__(self, name: str):
+        """Initialize entity.
+
+        Args:
+            name (str): Entity name.
+        """
+        self.name = name
+        self.attributes: List[Attribute] = NamedList()
+        self.children: List[Entity] = NamedList()
+
+    def get_attribute(self, name: str) -> Optional[Attribute]:
+        """Return the first attribute named `name`, None if there is none."""
+        return _get_named(self.attributes, name)
+
+    def child(self, name: str) -> Optional['Entity']:
+        """Return the first child named `name`, None if there is none."""
+        return _get_named(self.children, name)
+
+    def find(self, path: str) -> Optional['Entity']:
+        """Return the descendant at `path`, None if there is none.
+
+        Args:
+            path: Child names from this entity, separated by slashes, like
+                "child/grandchild".
+
+        Returns:
+            First descendant matching `path`, see `find_path`.
+
+        Raises:
+            ValueError: If `path` has an empty name.
+        """
+        names = path.split('/')
+
+        if not all(names):
+            raise ValueError("empty name in entity path")
+
+        return find_path(self.children, names)
+
+
+class TocEntry(NamedTuple):
+    """Table of contents entry of an entity.
+
+    Attributes:
+        offset (int): Entity offset from the file start.
+        attributes (Optional[Dict[str, int]]): Attribute name -> attribute
+            offset from the file start, if attributes are indexed.
+    """
+    offset: int
+    attributes: Optional[Dict[str, int]] = None
+
+
+# Magic number ending a file having a table of contents.
+TOC_MAGIC = b'MUGI'
+
+
+class _Encoder:
+    """Encode entities at the end of a bytearray.
+
+    Attributes:
+        buffer (bytearray): Encoded bytes.
+        flushed_count (int): Byte count flushed out of `buffer`.
+        flags (FormatFlag): Format features to encode with.
+        toc (Optional[Dict[str, TocEntry]]): Entity path -> entity table of
+            contents entry, filled while encoding if given.
+        toc_attributes (bool): If table of contents entries map attribute
+            names to their offset.
+        strings (Optional[Dict[str, bytes]]): Name -> encoded string table
+            index, see `string_table`.
+
+    `wrap_writer` is called with each attribute type code and the function
+    encoding its values, returning the function to encode them with.
+    """
+
+    def __init__(self, flags: FormatFlag = FormatFlag(0), toc: bool = False,
+                 toc_attributes: bool = False,
+                 strings: Optional[Dict[str, bytes]] = None,
+                 wrap_writer: Optional[Callable] = None):
+        self.buffer = bytearray()
+        self.flushed_count = 0
+        self.flags = flags
+        self.toc: Optional[Dict[str, TocEntry]] = {} if toc else None
+        self.toc_attributes = toc_attributes
+        self._sized = FormatFlag.SIZED in flags
+        self._writers = {type_code: codec.as_bytes
+                         for type_code, codec in _CODECS.items()}
+        self._attr_names: Dict[str, bytes] = {}  # repeat a lot, so cached
+        # Name -> encoded string table index, with `FormatFlag.STRING_TABLE`.
+        self.strings = strings
+
+        if wrap_writer is not None:
+            self._writers = {type_code: wrap_writer(type_code, writer)
+                             for type_code, writer in self._writers.items()}
+
+    def tell(self) -> int:
+        """Return the offset of the next encoded byte from the file start."""
+        return self.flushed_count + len(self.buffer)
+
+    def flush(self, fd: BinaryIO):
+        """Write encoded bytes to `fd` file object and empty `buffer`.
+
+        Args:
+            fd: File object to write in.
+        """
+        self.flushed_count += len(self.buffer)
+        _flush(fd, self.buffer)
+
+    def header(self):
+        """Encode file header."""
+        if self.flags:
+            self.buffer += MAGIC_V2
+            self.buffer.append(self.flags)
+        else:
+            self.buffer += MAGIC
+
+    def string_table(self, names: Iterable[str]):
+        """Encode the string table of `FormatFlag.STRING_TABLE` files.
+
+        Following entity and attribute names are encoded as their index in
+        the table.
+
+        Args:
+            names: Entity and attribute names, the most frequent first to
+                get the shortest indices.
+        """
+        strings = self.strings = {}
+        table = bytearray()
+
+        for name in names:
+            if name not in strings:
+                strings[name] = as_suint_bytes(len(strings))
+                table += as_str_bytes(name)
+
+        self.buffer += as_suint_bytes(len(strings))
+        self.buffer += table
+
+    def name_bytes(self, name: str) -> bytes:
+        """Return encoded entity or attribute `name`.
+
+        Raises:
+            ValueError: If `name` is missing from the string table.
+        """
+        if self.strings is None:
+            return as_str_bytes(name)
+
+        try:
+            return self.strings[name]
+        except KeyError:
+            raise ValueError("name missing from string table") from None
+
+    def entity_head(self, entity: Entity,
+                    buffer: Optional[bytearray] = None,
+                    attr_offsets: Optional[Dict[str, int]] = None):
+        """Encode `entity` name, attributes and child count.
+
+        The entity byte count is not encoded, see `hierarchy`.
+
+        Args:
+            entity: Entity to encode.
+            buffer: Buffer to encode into, `buffer` attribute if not given.
+            attr_offsets: Filled with attribute name -> attribute offset in
+                `buffer` if given.
+        """
+        if buffer is None:
+            buffer = self.buffer
+
+        buffer += self.name_bytes(entity.name)
+        buffer += as_suint_bytes(len(entity.attributes))
+
+        for attr in entity.attributes:
+            if attr_offsets is not None:
+                attr_offsets.setdefault(attr.name, len(buffer))
+
+            self.attribute(buffer, attr.name, attr.type_, attr.value)
+
+        buffer += as_suint_bytes(len(entity.children))
+
+    def attribute(self, buffer: bytearray, name: str,
+                  type_: Union[AttributeType, int], value: Any):
+        """Encode an attribute at the end of `buffer`.
+
+        Args:
+            buffer: Buffer to encode into.
+            name: Attribute name.
+            type_: Attribute type.
+            value: Attribute value.
+
+        Raises:
+            ValueError: If `type_` is unknown.
+        """
+        name_bytes = self._attr_names.get(name)
+        if name_bytes is None:
+            name_bytes = self._attr_names[name] = self.name_bytes(name)
+
+        try:
+            value_writer = self._writers[type_]
+        except KeyError:
+            raise ValueError("unknown attribute type") from None
+
+        # Encoded first, not to leave a partial attribute on failure.
+        value_bytes = value_writer(value)
+
+        buffer += name_bytes
+        buffer.append(type_)
+
+        if self._sized:
+            buffer += as_suint_bytes(len(value_bytes))
+        buffer += value_bytes
+
+    def hierarchy(self, entity: Entity) -> Iterator[Entity]:
+        """Encode `entity` and its descendants, in file order.
+
+        Each entity is yielded before being encoded, letting the caller flush
+        the buffer.
+
+        With `FormatFlag.SIZED`, entity byte counts are needed before their
+        encoding, so all entities are encoded in memory first. So they are
+        with `FormatFlag.INSTANCED`, to find equal subtrees.
+
+        Args:
+            entity: Root entity.
+
+        Yields:
+            Entity about to be encoded.
+        """
+        if FormatFlag.INSTANCED in self.flags:
+            yield from self._instanced_hierarchy(entity)
+            return
+
+        toc = self.toc
+
+        if toc is None:
+            entities = iter_hierarchy(entity)
+            paths = itertools.repeat(None)
+        else:
+            entities, paths = _hierarchy_paths(entity)
+
+        if self._sized:
+            yield from self._sized_hierarchy(entities, paths)
+            return
+
+        buffer = self.buffer
+
+        for entity, path in zip(entities, paths):
+            yield entity
+
+            if path is None:
+                self.entity_head(entity)
+                continue
+
+            offset = self.tell()
+            attr_offsets = {} if self.toc_attributes else None
+
+            self.entity_head(entity, buffer, attr_offsets)
+
+            if attr_offsets is not None:
+                base = self.flushed_count  # of offsets in `buffer`
+                attr_offsets = {name: base + attr_offset
+                                for name, attr_offset in attr_offsets.items()}
+
+            toc.setdefault(path, TocEntry(offset, attr_offsets))
+
+    def _sized_hierarchy(self, entities: Iterable[Entity],
+                         paths: Iterable[Optional[str]]) -> Iterator[Entity]:
+        """`FormatFlag.SIZED` version of `hierarchy`."""
+        entities = list(entities)
+        heads = []
+        heads_attr_offsets = []
+
+        for entity in entities:
+            head = bytearray()
+            attr_offsets = {} if self.toc_attributes else None
+            self.entity_head(entity, head, attr_offsets)
+            heads.append(head)
+            heads_attr_offsets.append(attr_offsets)
+
+        # Children follow their parent in file order, so reversed order gets
+        # children sizes before their parent one.
+        sizes: Dict[int, int] = {}  # entity id -> encoded byte count
+        for entity, head in zip(reversed(entities), reversed(heads)):
+            size = len(head)
+
+            for child in entity.children:
+                child_size = sizes[id(child)]
+                size += len(as_suint_bytes(child_size)) + child_size
+
+            sizes[id(entity)] = size
+
+        buffer = self.buffer
+        toc = self.toc
+
+        for entity, head, attr_offsets, path in zip(entities, heads,
+                                                    heads_attr_offsets, paths):
+            yield entity
+
+            offset = self.tell()
+            buffer += as_suint_bytes(sizes[id(entity)])
+
+            if path is not None:
+                if attr_offsets is not None:
+                    base = self.tell()
+                    attr_offsets = {name: base + attr_offset
+                                    for name, attr_offset
+                                    in attr_offsets.items()}
+
+                toc.setdefault(path, TocEntry(offset, attr_offsets))
+
+            buffer += head
+
+    def _instanced_hierarchy(self, root: Entity) -> Iterator[Entity]:
+        """`FormatFlag.INSTANCED` version of `hierarchy`.
+
+        Subtrees are keyed by their encoded entities, so a subtree equal to a
+        previous one is encoded as a reference to it, whether it's made of the
+        same entity objects or not. Subtrees not larger than a reference are
+        encoded again instead.
+        """
+        # Entity objects are encoded once, children first.
+        keys: Dict[int, int] = {}  # entity id -> subtree key
+        key_ids: Dict[Tuple[bytes, Tuple[int, ...]], int] = {}
+        heads: List[bytes] = []  # subtree key -> encoded entity
+        heads_attr_offsets: List[Optional[Dict[str, int]]] = []
+        subtree_sizes: List[int] = []  # subtree key -> byte count if inline
+        stack = [(root, False)]
+
+        while stack:
+            entity, children_keyed = stack.pop()
+
+            if not children_keyed:
+                if id(entity) not in keys:
+                    keys[id(entity)] = -1  # being keyed
+                    stack.append((entity, True))
+                    stack.extend((child, False) for child in entity.children)
+                continue
+
+            head = bytearray()
+            attr_offsets = {} if self.toc_attributes else None
+            self.entity_head(entity, head, attr_offsets)
+            head = bytes(head)
+            child_keys = tuple(keys[id(child)] for child in entity.children)
+            key = key_ids.setdefault((head, child_keys), len(key_ids))
+
+            if key == len(heads):
+                heads.append(head)
+                heads_attr_offsets.append(attr_offsets)
+                subtree_sizes.append(1 + len(head) + sum(
+                    subtree_sizes[child_key] for child_key in child_keys))
+
+            keys[id(entity)] = key
+
+        del key_ids
+
+        # File order records, references not having child records.
+        entities = []
+        record_keys = []
+        targets: List[Optional[int]] = []  # referenced record of references
+        records_children: List[Optional[List[int]]] = []
+        paths = []
+        instances: Dict[int, int] = {}  # subtree key -> first record
+        referenced = set()
+        stack = [(root, -1, '/' + root.name if self.toc is not None
+                  else None)]
+
+        while stack:
+            entity, parent, path = stack.pop()
+            index = len(entities)
+            key = keys[id(entity)]
+            instance = instances.setdefault(key, index)
+
+            entities.append(entity)
+            record_keys.append(key)
+            paths.append(path)
+
+            if parent >= 0:
+                records_children[parent].append(index)
+
+            if instance != index and subtree_sizes[key] > _REFERENCE_SIZE:
+                targets.append(instance)
+                records_children.append(None)
+                referenced.add(instance)
+                continue
+
+            targets.append(None)
+            records_children.append([])
+
+            if path is None:
+                stack.extend((child, index, None)
+                             for child in reversed(entity.children))
+            else:
+                stack.extend((child, index, path + '/' + child.name)
+                             for child in reversed(entity.children))
+
+        del keys
+
+        if self._sized:
+            # Children follow their parent in file order, so reversed order
+            # gets children sizes before their parent one.
+            sizes = [0] * len(entities)
+
+            for index in reversed(range(len(entities))):
+                children = records_children[index]
+                if children is None:
+                    continue
+
+                size = len(heads[record_keys[index]])
+
+                for child in children:
+                    if records_children[child] is None:
+                        size += _REFERENCE_SIZE
+                    else:
+                        child_size = sizes[child]
+                        size += 1 + len(as_suint_bytes(child_size)) + \
+                            child_size
+
+                sizes[index] = size
+
+        buffer = self.buffer
+        toc = self.toc
+        offsets: Dict[int, int] = {}  # referenced record -> offset
+        entries: Dict[int, TocEntry] = {}  # record -> table of contents entry
+
+        for index, entity in enumerate(entities):
+            yield entity
+
+            offset = self.tell()
+            target = targets[index]
+
+            if target is not None:
+                buffer.append(REFERENCE_TAG)
+                buffer += _U64.pack(offset - offsets[target])
+
+                if toc is not None:
+                    # Paths of the referenced entities through this one.
+                    path_stack = [(target, paths[index])]
+
+                    while path_stack:
+                        record, path = path_stack.pop()
+                        if targets[record] is not None:
+                            record = targets[record]
+
+                        toc.setdefault(path, entries[record])
+                        path_stack.extend(
+                            (child, path + '/' + entities[child].name)
+                            for child in reversed(records_children[record]))
+                continue
+
+            if index in referenced:
+                offsets[index] = offset
+                buffer.append(INSTANCE_TAG)
+            else:
+                buffer.append(ENTITY_TAG)
+
+            if self._sized:
+                buffer += as_suint_bytes(sizes[index])
+
+            key = record_keys[index]
+
+            if toc is not None:
+                attr_offsets = heads_attr_offsets[key]
+
+                if attr_offsets is not None:
+                    base = self.tell()
+                    attr_offsets = {name: base + attr_offset
+                                    for name, attr_offset
+                                    in attr_offsets.items()}
+
+                entry = entries[index] = TocEntry(offset, attr_offsets)
+                toc.setdefault(paths[index], entry)
+
+            buffer += heads[key]
+
+    def toc_footer(self):
+        """Encode table of contents and file trailer."""
+        toc_offset = self.tell()
+        buffer = self.buffer
+
+        buffer.append(bool(self.toc_attributes))
+        buffer += as_suint_bytes(len(self.toc))
+
+        for path, entry in self.toc.items():
+            buffer += as_str_bytes(path)
+            buffer += as_suint_bytes(entry.offset)
+
+            if entry.attributes is not None:
+                buffer += as_suint_bytes(len(entry.attributes))
+
+                for name, offset in entry.attributes.items():
+                    buffer += as_str_bytes(name)
+                    buffer += as_suint_bytes(offset)
+
+        buffer += _U64.pack(toc_offset)
+        buffer += TOC_MAGIC
+
+
+def _flush(fd: BinaryIO, buffer: bytearray):
+    """Write `buffer` to `fd` file object and empty it."""
+    while True:
+        written = fd.write(buffer)
+
+        # Raw file objects can write partially.
+        if written is None or written >= len(buffer):
+            break
+
+        del buffer[:written]
+
+    buffer.clear()
+
+
+# Byte count `write` accumulates before writing to the file object.
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+# Mug file byte count of each compressed block, see `write`.
+DEFAULT_BLOCK_SIZE = 1 << 20
+
+
+def iter_hierarchy(entity: Entity) -> Iterator[Entity]:
+    """Iterate over `entity` and its descendants, depth first, in file order.
+
+    Args:
+        entity: Root entity.
+
+    Yields:
+        Entities.
+    """
+    stack = [entity]
+
+    while stack:
+        entity = stack.pop()
+        yield entity
+        stack.extend(reversed(entity.children))
+
+
+def _hierarchy_paths(entity: Entity) -> Tuple[List[Entity], List[str]]:
+    """Return `entity` and its descendants in file order, and their paths.
+
+    A path is made of the names of the entity and its ancestors, each one
+    preceded by a slash: "/root/child/grandchild".
+    """
+    entities = []
+    paths = []
+    stack = [(entity, '/' + entity.name)]
+
+    while stack:
+        entity, path = stack.pop()
+        entities.append(entity)
+        paths.append(path)
+        stack.extend((child, path + '/' + child.name)
+                     for child in reversed(entity.children))
+
+    return entities, paths
+
+
+def _encode_scene(encoder: _Encoder,
+                  scene: Union[Entity, 'SceneTable']) -> Iterator[Any]:
+    """Return the iterator encoding `scene` with `encoder`, see
+    `_Encoder.hierarchy`."""
+    if isinstance(scene, Entity):
+        return encoder.hierarchy(scene)
+
+    from .table import encode_table  # imports this module
+
+    # Sizes, paths and instances are computed from entities, kept alive
+    # while encoding.
+    if encoder.flags & (FormatFlag.SIZED | FormatFlag.INSTANCED) or \
+            encoder.toc is not None:
+        return encoder.hierarchy(scene.to_entity())
+
+    return encode_table(encoder, scene)
+
+
+def write_hierarchy(fd: BinaryIO, entity: Union[Entity, 'SceneTable'],
+                    encoder: Optional[_Encoder] = None,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """Write `entity` and its descendants, without the file header.
+
+    The hierarchy is walked with an explicit stack, so there is no depth
+    limit.
+
+    Args:
+        fd: File object to write in.
+        entity: Entity, or scene table, to write.
+        encoder: Encoder holding bytes not written yet.
+        chunk_size: Byte count to accumulate before writing to `fd`.
+    """
+    if encoder is None:
+        encoder = _Encoder()
+
+    buffer = encoder.buffer
+
+    for _ in _encode_scene(encoder, entity):
+        if len(buffer) >= chunk_size:
+            encoder.flush(fd)
+
+    encoder.flush(fd)
+
+
+def _scene_names(scene: Union[Entity, 'SceneTable']) -> List[str]:
+    """Return entity and attribute names of `scene`, the most frequent
+    first."""
+    if not isinstance(scene, Entity):
+        counts = Counter(scene.entity_names)
+        counts.update(scene.attr_names)
+        return [scene.names[i] for i in sorted(range(len(scene.names)),
+                                               key=counts.__getitem__,
+                                               reverse=True)]
+
+    counts = Counter()
+
+    for entity in iter_hierarchy(scene):
+        counts[entity.name] += 1
+        counts.update(attr.name for attr in entity.attributes)
+
+    return [name for name, _ in counts.most_common()]
+
+
+def _scene_encoder(scene: Union[Entity, 'SceneTable'], sized: bool,
+                   toc: bool, toc_attributes: bool, string_table: bool,
+                   instances: bool = False,
+                   wrap_writer: Optional[Callable] = None) -> _Encoder:
+    """Return an encoder of `write` options, having encoded the header.
+
+    `wrap_writer` is passed to `_Encoder`.
+    """
+    flags = FormatFlag(0)
+
+    if sized:
+        flags |= FormatFlag.SIZED
+
+    if string_table:
+        flags |= FormatFlag.STRING_TABLE
+
+    if instances:
+        flags |= FormatFlag.INSTANCED
+
+    encoder = _Encoder(flags, toc or toc_attributes, toc_attributes,
+                       wrap_writer=wrap_writer)
+    encoder.header()
+
+    if string_table:
+        encoder.string_table(_scene_names(scene))
+
+    return encoder
+
+
+def write(fd: BinaryIO, entity: Union[Entity, 'SceneTable'],
+          chunk_size: int = DEFAULT_CHUNK_SIZE, sized: bool = False,
+          toc: bool = False, toc_attributes: bool = False,
+          string_table: bool = False, compression: Optional[str] = None,
+          block_size: int = DEFAULT_BLOCK_SIZE, workers: Optional[int] = None,
+          split_depth: int = 1, stats: Optional['Stats'] = None,
+          cache: Optional['WriteCache'] = None, instances: bool = False):
+    """Write mug scene to `fd` file object.
+
+    Encoded bytes are accumulated and written by chunks of about `chunk_size`
+    bytes, keeping write calls few on unbuffered file objects.
+
+    Args:
+        fd: File object to write in.
+        entity: Root entity, or scene table, to write.
+        chunk_size: Byte count to accumulate before writing to `fd`.
+        sized: Write a version 2 file with `FormatFlag.SIZED`, prefixing
+            entities and attribute values by their byte count. Readers can
+            then skip them without decoding, at the cost of encoding the
+            whole hierarchy in memory before writing it.
+        toc: Append a table of contents mapping entity paths to their offset,
+            see `read_entity`.
+        toc_attributes: Also map attribute names of each entity to their
+            offset in the table of contents. Implies `toc`.
+        string_table: Write a version 2 file with
+            `FormatFlag.STRING_TABLE`, storing each distinct entity and
+            attribute name once. Smaller and faster to read when names
+            repeat, at the cost of walking the hierarchy once more.
+        compression: Name of the compression to write the file in a block
+            compressed container with, like "zlib", "lzma" or "bz2", see
+            `register_compression`. Readers decompress it transparently.
+        block_size: Mug file byte count of each compressed block. Smaller
+            blocks make seeking cheaper, larger ones compress better.
+        workers: Encode subtrees in this many worker processes, see
+            `split_depth`. Entities are pickled to workers, so custom
+            attribute codecs must be registered when they import their
+            module.
+        split_depth: Depth of the entities encoded with their descendants by
+            a worker, the shallower ones being encoded by this process.
+        stats: Add counts, byte counts and times of written entities and
+            values to it, see `Stats`.
+        cache: Only encode the entities changed since the previous write
+            with it, copying the others from its bytes, see `WriteCache`.
+        instances: Write a version 2 file with `FormatFlag.INSTANCED`,
+            storing subtrees equal to a previous one, like instanced props
+            of a set, as a reference to it. Smaller, and read as shared
+            entities, at the cost of encoding the whole hierarchy in memory
+            before writing it.
+
+    Raises:
+        ValueError: If `stats` is combined with `workers`, or `cache` with
+            `workers` or `stats`, or `instances` with `workers` or `cache`.
+    """
+    if stats is not None and workers is not None:
+        raise ValueError("stats can't be combined with workers")
+
+    if cache is not None and (workers is not None or stats is not None):
+        raise ValueError("cache can't be combined with workers or stats")
+
+    if instances and (workers is not None or cache is not None):
+        raise ValueError("instances can't be combined with workers or cache")
+
+    if compression is not None:
+        from .compression import BlockWriter  # imports this module
+
+        with BlockWriter(fd, compression, block_size) as writer:
+            write(writer, entity, chunk_size, sized, toc, toc_attributes,
+                  string_table, workers=workers, split_depth=split_depth,
+                  stats=stats, cache=cache, instances=instances)
+
+        return
+
+    if cache is not None:
+        from .incremental import write_cached  # imports this module
+
+        if not isinstance(entity, Entity):
+            entity = entity.to_entity()
+
+        write_cached(fd, entity, cache, chunk_size, sized, toc,
+                     toc_attributes, string_table)
+        return
+
+    if stats is not None:
+        from .stats import write_stats  # imports this module
+
+        if not isinstance(entity, Entity):
+            entity = entity.to_entity()
+
+        write_stats(fd, entity, chunk_size, sized, toc, toc_attributes,
+                    string_table, stats, instances)
+        return
+
+    encoder = _scene_encoder(entity, sized, toc, toc_attributes,
+                             string_table, instances)
+
+    if workers is None:
+        write_hierarchy(fd, entity, encoder, chunk_size)
+    else:
+        from .parallel import write_parallel  # imports this module
+
+        if not isinstance(entity, Entity):
+            entity = entity.to_entity()
+
+        write_parallel(fd, entity, encoder, chunk_size, workers, split_depth)
+
+    if encoder.toc is not None:
+        encoder.toc_footer()
+        encoder.flush(fd)
+
+
+def dumps(entity: Union[Entity, 'SceneTable'], sized: bool = False,
+          toc: bool = False, toc_attributes: bool = False,
+          string_table: bool = False, compression: Optional[str] = None,
+          block_size: int = DEFAULT_BLOCK_SIZE,
+          instances: bool = False) -> bytes:
+    """Return `entity` mug scene bytes, as written by `write`.
+
+    Args:
+        entity: Root entity, or scene table, to encode.
+        sized: See `write`.
+        toc: See `write`.
+        toc_attributes: See `write`.
+        string_table: See `write`.
+        compression: See `write`.
+        block_size: See `write`.
+        instances: See `write`.
+
+    Returns:
+        Mug scene bytes.
+    """
+    encoder = _scene_encoder(entity, sized, toc, toc_attributes,
+                             string_table, instances)
+
+    for _ in _encode_scene(encoder, entity):
+        pass
+
+    if encoder.toc is not None:
+        encoder.toc_footer()
+
+    if compression is not None:
+        from .compression import compress  # imports this module
+
+        return compress(encoder.buffer, compression, block_size)
+
+    return bytes(encoder.buffer)
+
+
+def open_blocks(fd: BinaryIO) -> Optional[BinaryIO]:
+    """Return a file object over the mug file of the block compressed
+    container at `fd` position, None if there is no container.
+
+    See `compression.open_blocks`.
+    """
+    from .compression import open_blocks  # imports this module
+
+    return open_blocks(fd)
+
+
+def header_read(fd: BinaryIO) -> FormatFlag:
+    """Read mug file header.
+
+    Args:
+        fd: File object to read from.
+
+    Returns:
+        File format features, none for version 1 files.
+
+    Raises:
+        ValueError: If not a mug file or using unsupported features.
+    """
+    magic = fd.read(4)
+
+    if magic == MAGIC:
+        return FormatFlag(0)
+    elif magic == MAGIC_V2:
+        return _format_flags(fd.read(1))
+
+    raise ValueError("not a valid mug file format")
+
+
+def header_unpack_from(buffer: ReadBuffer,
+                       offset: int = 0) -> Tuple[FormatFlag, int]:
+    """Buffer version of `header_read`.
+
+    Args:
+        buffer: Buffer to read from.
+        offset: Offset of the header in `buffer`.
+
+    Returns:
+        File format features and offset following the header.
+    """
+    magic = buffer[offset:offset + 4]
+
+    if len(magic) < 4:
+        raise TruncatedError("unexpected end of file")
+
+    if magic == MAGIC:
+        return FormatFlag(0), offset + 4
+    elif magic == MAGIC_V2:
+        return _format_flags(buffer[offset + 4:offset + 5]), offset + 5
+
+    raise ValueError("not a valid mug file format")
+
+
+def _format_flags(data: bytes) -> FormatFlag:
+    """Return `FormatFlag` stored in `data` byte, checking it's supported."""
+    if not data:
+        raise TruncatedError("unexpected end of file")
+
+    if data[0] & ~_SUPPORTED_FLAGS or data[0] & _STREAMED_INSTANCED == \
+            _STREAMED_INSTANCED:
+        raise ValueError("unsupported mug file format features")
+
+    return FormatFlag(data[0])
+
+
+def string_table_read(fd: BinaryIO,
+                      flags: FormatFlag) -> Optional[List[str]]:
+    """Read the string table following the header of a mug file.
+
+    Strings are interned, so names are shared with the rest of the program.
+
+    Args:
+        fd: File object to read from, past the header.
+        flags: File format features.
+
+    Returns:
+        Strings, None if the file has no string table.
+    """
+    if FormatFlag.STRING_TABLE not in flags:
+        return None
+
+    return [sys.intern(str_read(fd)) for _ in range(suint_read(fd))]
+
+
+def _string_at(strings: List[str], index: int) -> str:
+    """Return the string at `index` of a string table.
+
+    Raises:
+        ValueError: If `index` is out of the table, rather than an
+            `IndexError`, which buffer readers take for a truncated buffer.
+    """
+    try:
+        return strings[index]
+    except IndexError:
+        raise ValueError("invalid string table index") from None
+
+
+def string_table_unpack_from(buffer: ReadBuffer, offset: int,
+                             flags: FormatFlag) \
+        -> Tuple[Optional[List[str]], int]:
+    """Buffer version of `string_table_read`.
+
+    Args:
+        buffer: Buffer to read from.
+        offset: Offset following the header in `buffer`.
+        flags: File format features.
+
+    Returns:
+        Strings, None if the file has no string table, and offset following
+        them.
+    """
+    if FormatFlag.STRING_TABLE not in flags:
+        return None, offset
+
+    strings = []
+    count, offset = suint_unpack_from(buffer, offset)
+
+    for _ in range(count):
+        string, offset = str_unpack_from(buffer, offset)
+        strings.append(sys.intern(string))
+
+    return strings, offset
+
+
+# Integer as `~` on a `FormatFlag` ignores unknown bits.
+_SUPPORTED_FLAGS = int(FormatFlag.SIZED | FormatFlag.STREAMED |
+                       FormatFlag.STRING_TABLE | FormatFlag.INSTANCED)
+_STREAMED_INSTANCED = int(FormatFlag.STREAMED | FormatFlag.INSTANCED)
+
+
+def tag_read(fd: BinaryIO) -> int:
+    """Read the tag preceding an entity of a `FormatFlag.INSTANCED` file.
+
+    Raises:
+        ValueError: If the file ends or the tag is unknown.
+    """
+    data = fd.read(1)
+
+    if not data:
+        raise TruncatedError("unexpected end of file")
+
+    if data[0] > REFERENCE_TAG:
+        raise ValueError("invalid entity tag")
+
+    return data[0]
+
+
+def tag_unpack_from(buffer: ReadBuffer, offset: int) -> Tuple[int, int]:
+    """Buffer version of `tag_read`.
+
+    Args:
+        buffer: Buffer to read from.
+        offset: Offset of the tag in `buffer`.
+
+    Returns:
+        Read tag and offset following it.
+    """
+    tag = buffer[offset]
+
+    if tag > REFERENCE_TAG:
+        raise ValueError("invalid entity tag")
+
+    return tag, offset + 1
+
+
+def reference_read(fd: BinaryIO, offset: int) -> int:
+    """Read the instance offset of a `REFERENCE_TAG` record.
+
+    Args:
+        fd: File object to read from, past the reference tag.
+        offset: Offset of the reference tag.
+
+    Returns:
+        Offset of the referenced instance tag.
+
+    Raises:
+        ValueError: If the file ends or the reference doesn't point before
+            itself.
+    """
+    data = fd.read(_U64.size)
+
+    if len(data) != _U64.size:
+        raise TruncatedError("unexpected end of file")
+
+    distance = _U64.unpack(data)[0]
+
+    if not 0 < distance <= offset:
+        raise ValueError("invalid instance reference")
+
+    return offset - distance
+
+
+def reference_unpack_from(buffer: ReadBuffer, offset: int) -> Tuple[int, int]:
+    """Buffer version of `reference_read`.
+
+    Args:
+        buffer: Buffer to read from.
+        offset: Offset of the reference tag in `buffer`.
+
+    Returns:
+        Offset of the referenced instance tag and offset following the
+        reference.
+    """
+    distance = _U64.unpack_from(buffer, offset + 1)[0]
+
+    if not 0 < distance <= offset or \
+            buffer[offset - distance] != INSTANCE_TAG:
+        raise ValueError("invalid instance reference")
+
+    return offset - distance, offset + _REFERENCE_SIZE
+
+
+def instance_seek(fd: BinaryIO, offset: int) -> Tuple[int, int]:
+    """Move `fd` file object from a reference to its instance entity.
+
+    Args:
+        fd: File object to read from, past the reference tag.
+        offset: Offset of the reference tag.
+
+    Returns:
+        Offset of the instance tag, and offset following the reference to
+        seek back to once the instance is read.
+
+    Raises:
+        ValueError: If the reference doesn't point to an instance.
+    """
+    instance_offset = reference_read(fd, offset)
+    return_offset = fd.tell()
+    fd.seek(instance_offset)
+
+    if tag_read(fd) != INSTANCE_TAG:
+        raise ValueError("invalid instance reference")
+
+    return instance_offset, return_offset
+
+
+def _read_entity_head(fd: BinaryIO, readers: Dict[int, Callable],
+                      sized: bool, strings: Optional[List[str]] = None,
+                      str_reader: Callable[[BinaryIO], str] = str_read,
+                      suint_reader: Callable[[BinaryIO], int] = suint_read):
+    """Read entity name, attributes and child count.
+
+    Args:
+        fd: File object to read from.
+        readers: Attribute type code -> value reading function table.
+        sized: If entity and attribute values are prefixed by their byte
+            count.
+        strings: File string table, names being inline strings if None.
+        str_reader: Inline name reading function.
+        suint_reader: Size, count and string index reading function.
+
+    Returns:
+        Read entity, without children, and its child count.
+    """
+    if sized:
+        suint_reader(fd)  # entity byte count
+
+    entity = Entity(str_reader(fd) if strings is None
+                    else _string_at(strings, suint_reader(fd)))
+    attributes = entity.attributes
+
+    for _ in range(suint_reader(fd)):
+        attr_name = str_reader(fd) if strings is None \
+            else _string_at(strings, suint_reader(fd))
+        attr_type = attr_type_read(fd)
+
+        if sized:
+            suint_reader(fd)  # value byte count
+
+        attributes.append(Attribute(attr_name, attr_type,
+                                    readers[attr_type](fd)))
+
+    return entity, suint_reader(fd)
+
+
+def attributes_skip(fd: BinaryIO, skippers: Dict[int, Callable],
+                    sized: bool, strings: Optional[List[str]] = None):
+    """Move `fd` file object past an attribute count and its attributes.
+
+    Args:
+        fd: File object to read from.
+        skippers: Attribute type code -> value skipping function table.
+        sized: If attribute values are prefixed by their byte count.
+        strings: File string table, names being inline strings if None.
+    """
+    for _ in range(suint_read(fd)):
+        name_skip(fd, strings)
+        attr_type = attr_type_read(fd)
+
+        if sized:
+            fd.seek(suint_read(fd), io.SEEK_CUR)
+        else:
+            skippers[attr_type](fd)
+
+
+def hierarchy_skip(fd: BinaryIO, skippers: Dict[int, Callable], sized: bool,
+                   streamed: bool = False,
+                   strings: Optional[List[str]] = None,
+                   instanced: bool = False):
+    """Move `fd` file object past an entity and its descendants.
+
+    Args:
+        fd: File object to read from.
+        skippers: Attribute type code -> value skipping function table.
+        sized: If entities and attribute values are prefixed by their byte
+            count, making skipping a single seek.
+        streamed: If children are written in batches, see
+            `FormatFlag.STREAMED`.
+        strings: File string table, names being inline strings if None.
+        instanced: If entities are preceded by a tag, see
+            `FormatFlag.INSTANCED`.
+    """
+    if instanced:
+        remaining_count = 1  # records left to skip
+
+        while remaining_count:
+            remaining_count -= 1
+
+            if tag_read(fd) == REFERENCE_TAG:
+                fd.seek(_U64.size, io.SEEK_CUR)
+            elif sized:
+                fd.seek(suint_read(fd), io.SEEK_CUR)
+            else:
+                name_skip(fd, strings)
+                attributes_skip(fd, skippers, sized, strings)
+                remaining_count += suint_read(fd)
+
+        return
+
+    if sized:
+        fd.seek(suint_read(fd), io.SEEK_CUR)
+        return
+
+    if not streamed:
+        remaining_count = 1  # entities left to skip
+
+        while remaining_count:
+            name_skip(fd, strings)
+            attributes_skip(fd, skippers, sized, strings)
+            remaining_count += suint_read(fd) - 1
+
+        return
+
+    name_skip(fd, strings)
+    attributes_skip(fd, skippers, sized, strings)
+    child_count = suint_read(fd)
+
+    # Children left to skip in the current batch of each entity whose
+    # children are not all skipped.
+    child_counts = [child_count] if child_count else []
+
+    while child_counts:
+        if not child_counts[-1]:
+            child_count = suint_read(fd)  # next batch
+
+            if not child_count:
+                child_counts.pop()
+                continue
+
+            child_counts[-1] = child_count
+
+        child_counts[-1] -= 1
+
+        name_skip(fd, strings)
+        attributes_skip(fd, skippers, sized, strings)
+
+        child_count = suint_read(fd)
+        if child_count:
+            child_counts.append(child_count)
+
+
+def _copy_value(value: Any) -> Any:
+    """Return a copy of attribute `value`, itself if immutable."""
+    if isinstance(value, (int, float, str, tuple)):
+        return value
+
+    if isinstance(value, memoryview):
+        return memoryview(bytearray(value)).cast(value.format)
+
+    return copy.copy(value)
+
+
+def copy_hierarchy(entity: Entity) -> Entity:
+    """Return a copy of an entity and its descendants, as read instances are
+    with `copy_instances=True`.
+
+    Mutable attribute values, like arrays, are copied too. The hierarchy is
+    walked with an explicit stack, so there is no depth limit.
+
+    Args:
+        entity: Root entity.
+
+    Returns:
+        Copied entity.
+    """
+    root = None
+    stack = [(entity, None)]
+
+    while stack:
+        entity, parent = stack.pop()
+        entity_copy = Entity(entity.name)
+        entity_copy.attributes.extend(
+            Attribute(attr.name, attr.type_, _copy_value(attr.value))
+            for attr in entity.attributes)
+
+        if parent is None:
+            root = entity_copy
+        else:
+            parent.children.append(entity_copy)
+
+        stack.extend((child, entity_copy)
+                     for child in reversed(entity.children))
+
+    return root
+
+
+def read_hierarchy(fd: BinaryIO,
+                   readers: Optional[Dict[int, Callable]] = None,
+                   flags: FormatFlag = FormatFlag(0),
+                   strings: Optional[List[str]] = None,
+                   copy_instances: bool = False,
+                   str_reader: Callable[[BinaryIO], str] = str_read,
+                   suint_reader: Callable[[BinaryIO], int] = suint_read) \
+        -> Entity:
+    """Read an entity and its descendants, without the file header.
+
+    The hierarchy is walked with an explicit stack, so there is no depth
+    limit.
+
+    Args:
+        fd: File object to read from.
+        readers: Attribute type code -> value reading function table.
+        flags: File format features.
+        strings: File string table, see `string_table_read`.
+        copy_instances: Read each reference of a `FormatFlag.INSTANCED`
+            file as a copy of its instance, instead of the instance entity
+            itself.
+        str_reader: Function reading inline entity and attribute names,
+            `str_read` replacement.
+        suint_reader: Function reading entity and value sizes, attribute and
+            child counts and string table indices, `suint_read`
+            replacement.
+
+    Returns:
+        Read entity.
+    """
+    if readers is None:
+        readers = _value_readers(ArrayFormat.TUPLE)
+
+    if FormatFlag.INSTANCED in flags:
+        return _read_instanced_hierarchy(fd, readers,
+                                         FormatFlag.SIZED in flags, strings,
+                                         copy_instances, {}, set(),
+                                         str_reader, suint_reader)
+
+    sized = FormatFlag.SIZED in flags
+    streamed = FormatFlag.STREAMED in flags
+
+    root, child_count = _read_entity_head(fd, readers, sized, strings,
+                                          str_reader, suint_reader)
+
+    # Entities having children left to read and their remaining child count,
+    # in the current batch if streamed.
+    parents = []
+    child_counts = []
+
+    if child_count:
+        parents.append(root)
+        child_counts.append(child_count)
+
+    while parents:
+        child_count = child_counts[-1]
+
+        if not child_count:
+            if streamed:
+                child_count = suint_reader(fd)  # next batch
+
+            if not child_count:
+                parents.pop()
+                child_counts.pop()
+                continue
+
+        child_counts[-1] = child_count - 1
+
+        entity, child_count = _read_entity_head(fd, readers, sized, strings,
+                                                str_reader, suint_reader)
+        parents[-1].children.append(entity)
+
+        if child_count:
+            parents.append(entity)
+            child_counts.append(child_count)
+
+    return root
+
+
+def _read_instanced_hierarchy(fd: BinaryIO, readers: Dict[int, Callable],
+                              sized: bool, strings: Optional[List[str]],
+                              copy_instances: bool,
+                              instances: Dict[int, Entity],
+                              resolving: Set[int],
+                              str_reader: Callable[[BinaryIO], str],
+                              suint_reader: Callable[[BinaryIO], int]) \
+        -> Entity:
+    """`read_hierarchy` version of `FormatFlag.INSTANCED` files.
+
+    Instances are remembered by offset once read with their descendants.
+    References to instances not read yet, when reading from the middle of
+    the file, are read by seeking to them.
+
+    Args:
+        instances: Instance offset -> read instance, filled while reading.
+        resolving: Offsets of the instances being read by seeking, which
+            following references can't point to.
+        str_reader: See `read_hierarchy`.
+        suint_reader: See `read_hierarchy`.
+    """
+    root = None
+    # Entities having children left to read, their remaining child count
+    # and their offset if instances, None otherwise.
+    parents = []
+    child_counts = []
+    offsets = []
+
+    while True:
+        if parents:
+            if not child_counts[-1]:
+                entity = parents.pop()
+                child_counts.pop()
+                offset = offsets.pop()
+
+                if offset is not None:
+                    instances[offset] = entity
+                continue
+
+            child_counts[-1] -= 1
+        elif root is not None:
+            return root
+
+        tag = tag_read(fd)
+        offset = None
+        child_count = 0
+
+        if tag == REFERENCE_TAG:
+            reference_offset = fd.tell() - 1
+            instance_offset = reference_read(fd, reference_offset)
+            entity = instances.get(instance_offset)
+
+            if entity is None:
+                # Read from the middle of the file, or invalid.
+                if instance_offset in resolving:
+                    raise ValueError("invalid instance reference")
+
+                return_offset = fd.tell()
+                fd.seek(instance_offset)
+
+                if fd.read(1) != bytes((INSTANCE_TAG,)):
+                    raise ValueError("invalid instance reference")
+
+                fd.seek(instance_offset)
+                resolving.add(instance_offset)
+                entity = _read_instanced_hierarchy(
+                    fd, readers, sized, strings, False, instances, resolving,
+                    str_reader, suint_reader)
+                resolving.discard(instance_offset)
+                fd.seek(return_offset)
+
+            if copy_instances:
+                entity = copy_hierarchy(entity)
+        else:
+            if tag == INSTANCE_TAG:
+                offset = fd.tell() - 1
+
+            entity, child_count = _read_entity_head(fd, readers, sized,
+                                                    strings, str_reader,
+                                                    suint_reader)
+
+            if offset is not None and not child_count:
+                instances[offset] = entity
+
+        if root is None:
+            root = entity
+        else:
+            parents[-1].children.append(entity)
+
+        if child_count:
+            parents.append(entity)
+            child_counts.append(child_count)
+            offsets.append(offset)
+
+
+def _read_selected_entity_head(fd: BinaryIO, readers: Dict[int, Callable],
+                               skippers: Dict[int, Callable], sized: bool,
+                               strings: Optional[List[str]],
+                               attributes: Optional[AbstractSet[str]]):
+    """`_read_entity_head` only decoding `attributes` named attributes.
+
+    Returns:
+        Read entity, without children, its child count and its end offset if
+        sized, None otherwise.
+    """
+    entity_end = None
+
+    if sized:
+        entity_size = suint_read(fd)
+        entity_end = fd.tell() + entity_size
+
+    entity = Entity(str_read(fd) if strings is None
+                    else _string_at(strings, suint_read(fd)))
+    entity_attributes = entity.attributes
+
+    for _ in range(suint_read(fd)):
+        attr_name = str_read(fd) if strings is None \
+            else _string_at(strings, suint_read(fd))
+        attr_type = attr_type_read(fd)
+
+        if sized:
+            value_size = suint_read(fd)
+
+        if attributes is None or attr_name in attributes:
+            entity_attributes.append(Attribute(attr_name, attr_type,
+                                               readers[attr_type](fd)))
+        elif sized:
+            fd.seek(value_size, io.SEEK_CUR)
+        else:
+            skippers[attr_type](fd)
+
+    return entity, suint_read(fd), entity_end
+
+
+def _children_skip(fd: BinaryIO, child_count: int, entity_end: Optional[int],
+                   skippers: Dict[int, Callable], sized: bool,
+                   streamed: bool, strings: Optional[List[str]],
+                   instanced: bool = False):
+    """Move `fd` file object past the children of an entity.
+
+    Args:
+        fd: File object to read from, past the entity child count.
+        child_count: Entity child count, of the first batch if streamed.
+        entity_end: Entity end offset if sized, to seek straight to.
+        skippers: Attribute type code -> value skipping function table.
+        sized: If entities are prefixed by their byte count.
+        streamed: If children are written in batches.
+        strings: File string table, names being inline strings if None.
+        instanced: If entities are preceded by a tag.
+    """
+    if entity_end is not None:
+        fd.seek(entity_end)
+        return
+
+    while child_count:
+        for _ in range(child_count):
+            hierarchy_skip(fd, skippers, sized, streamed, strings, instanced)
+
+        if not streamed:
+            break
+
+        child_count = suint_read(fd)  # next batch
+
+
+def read_selected_hierarchy(fd: BinaryIO, readers: Dict[int, Callable],
+                            flags: FormatFlag = FormatFlag(0),
+                            max_depth: Optional[int] = None,
+                            attributes: Optional[AbstractSet[str]] = None,
+                            entity_filter: Optional[
+                                Callable[[Entity], bool]] = None,
+                            strings: Optional[List[str]] = None) -> Entity:
+    """`read_hierarchy` skipping what is not selected, without decoding it.
+
+    Skipping seeks past fixed sized values and numeric arrays, and past whole
+    entities in sized files.
+
+    References of `FormatFlag.INSTANCED` files are read by seeking to their
+    instance, so each one is read as a distinct entity.
+
+    Args:
+        fd: Seekable file object to read from.
+        readers: Attribute type code -> value reading function table.
+        flags: File format features.
+        max_depth: Depth of the deepest entities to read, 0 for the root one.
+        attributes: Names of the attributes to read.
+        entity_filter: Called with each entity but the root one, once its
+            attributes are read. Returning False skips it and its
+            descendants.
+        strings: File string table, see `string_table_read`.
+
+    Returns:
+        Read entity.
+    """
+    sized = FormatFlag.SIZED in flags
+    streamed = FormatFlag.STREAMED in flags
+    instanced = FormatFlag.INSTANCED in flags
+    skippers = _value_skippers()
+
+    if max_depth is None:
+        max_depth = sys.maxsize
+
+    if instanced and tag_read(fd) == REFERENCE_TAG:
+        raise ValueError("invalid instance reference")
+
+    root, child_count, entity_end = _read_selected_entity_head(
+        fd, readers, skippers, sized, strings, attributes)
+
+    # Entities having children left to read and their remaining child count,
+    # in the current batch if streamed.
+    parents = []
+    child_counts = []
+    # Instance and return offsets of parents read through a reference, None
+    # for the others.
+    parents_references = []
+    open_instances = set()  # instance offsets of `parents_references`
+
+    if child_count:
+        if max_depth > 0:
+            parents.append(root)
+            child_counts.append(child_count)
+            parents_references.append(None)
+        else:
+            _children_skip(fd, child_count, entity_end, skippers, sized,
+                           streamed, strings, instanced)
+
+    while parents:
+        child_count = child_counts[-1]
+
+        if not child_count:
+            if streamed:
+                child_count = suint_read(fd)  # next batch
+
+            if not child_count:
+                parents.pop()
+                child_counts.pop()
+                reference = parents_references.pop()
+
+                if reference is not None:
+                    open_instances.discard(reference[0])
+                    fd.seek(reference[1])
+                continue
+
+        child_counts[-1] = child_count - 1
+        reference = None
+
+        if instanced and tag_read(fd) == REFERENCE_TAG:
+            reference = instance_seek(fd, fd.tell() - 1)
+
+            if reference[0] in open_instances:
+                raise ValueError("invalid instance reference")
+
+        entity, child_count, entity_end = _read_selected_entity_head(
+            fd, readers, skippers, sized, strings, attributes)
+
+        if entity_filter is not None and not entity_filter(entity):
+            if reference is not None:
+                fd.seek(reference[1])
+            elif child_count:
+                _children_skip(fd, child_count, entity_end, skippers, sized,
+                               streamed, strings, instanced)
+            continue
+
+        parents[-1].children.append(entity)
+
+        if child_count and len(parents) < max_depth:
+            parents.append(entity)
+            child_counts.append(child_count)
+            parents_references.append(reference)
+
+            if reference is not None:
+                open_instances.add(reference[0])
+        elif reference is not None:
+            fd.seek(reference[1])
+        elif child_count:
+            _children_skip(fd, child_count, entity_end, skippers, sized,
+                           streamed, strings, instanced)
+
+    return root
+
+
+def read(fd: BinaryIO, array_format: ArrayFormat = ArrayFormat.TUPLE,
+         numpy: bool = False, max_depth: Optional[int] = None,
+         attributes: Optional[Iterable[str]] = None,
+         entity_filter: Optional[Callable[[Entity], bool]] = None,
+         table: bool = False, workers: Optional[int] = None,
+         split_depth: int = 1, stats: Optional['Stats'] = None,
+         copy_instances: bool = False) -> Union[Entity, 'SceneTable']:
+    """Read mug scene from `fd` file object.
+
+    Both version 1 and 2 files are read, and block compressed containers
+    too, their blocks being decompressed in a thread pool.
+
+    `max_depth`, `attributes` and `entity_filter` select what to read, the
+    rest being skipped without being decoded, which needs `fd` to be
+    seekable. Files written with `sized=True` are the fastest to skip.
+
+    Examples:
+        >>> with open("my_scene.mug", "rb") as fd:
+        ...     root = read(fd, max_depth=2, attributes={"xform"},
+        ...                 entity_filter=lambda e: e.name != "proxy")
+
+    Args:
+        fd: File object to read from.
+        array_format: Format to read numeric array attribute values as.
+        numpy: Shortcut for `array_format=ArrayFormat.NUMPY`.
+        max_depth: Depth of the deepest entities to read, 0 for the root
+            one. All entities if None.
+        attributes: Names of the attributes to read. All attributes if None.
+        entity_filter: Called with each entity but the root one, once its
+            selected attributes are read. Returning False skips it and its
+            descendants.
+        table: Read the scene as a `SceneTable`, without building entity
+            and attribute objects. `array_format` is ignored.
+        workers: Decode subtrees in this many worker processes, see
+            `split_depth`. The scene is read in memory first, and can't be
+            selected nor read as a table.
+        split_depth: Depth of the entities decoded with their descendants by
+            a worker, the shallower ones being decoded by this process.
+        stats: Add counts, byte counts and times of read entities, values,
+            names and sizes to it, see `Stats`. The scene can't be selected,
+            read as a table nor by workers.
+        copy_instances: Read each reference of a `FormatFlag.INSTANCED`
+            file as a copy of its instance, instead of sharing the instance
+            entity between its occurrences. Selected and table reads always
+            copy.
+
+    Returns:
+        Root entity, or scene table.
+
+    Raises:
+        ValueError: If `workers` or `stats` is combined with selective or
+            table reading, or with each other.
+    """
+    if numpy:
+        array_format = ArrayFormat.NUMPY
+
+    if array_format is ArrayFormat.NUMPY:
+        _numpy()  # fail early if missing
+
+    selected = max_depth is not None or attributes is not None or \
+        entity_filter is not None
+
+    if workers is not None and (selected or table):
+        raise ValueError("workers can't be combined with selective or table "
+                         "reading")
+
+    if stats is not None and (selected or table or workers is not None):
+        raise ValueError("stats can't be combined with selective, table or "
+                         "parallel reading")
+
+    blocks = open_blocks(fd)
+
+    if blocks is not None:
+        with blocks:
+            if workers is None:
+                return read(blocks, array_format, numpy, max_depth,
+                            attributes, entity_filter, table, stats=stats,
+                            copy_instances=copy_instances)
+
+            # Decompressed before forking workers, not to fork threads.
+            data = blocks.read()
+
+        return read(io.BytesIO(data), array_format, workers=workers,
+                    split_depth=split_depth, copy_instances=copy_instances)
+
+    if stats is not None:
+        from .stats import read_stats  # imports this module
+
+        return read_stats(fd, array_format, stats, copy_instances)
+
+    flags = header_read(fd)
+    strings = string_table_read(fd, flags)
+
+    if workers is not None:
+        from .parallel import read_parallel  # imports this module
+
+        return read_parallel(fd, flags, strings, array_format, workers,
+                             split_depth, copy_instances)
+
+    if FormatFlag.INSTANCED in flags and not _seekable(fd):
+        # References are resolved from read offsets, which only need to be
+        # relative to the same position.
+        fd = io.BytesIO(fd.read())
+
+    if table:
+        from .table import SceneTable, read_table  # imports this module
+
+        if not selected:
+            return read_table(fd, flags, strings)
+
+    readers = _value_readers(array_format)
+
+    if not selected:
+        return read_hierarchy(fd, readers, flags, strings, copy_instances)
+
+    if attributes is not None:
+        attributes = frozenset(attributes)
+
+    root = read_selected_hierarchy(fd, readers, flags, max_depth, attributes,
+                                   entity_filter, strings)
+
+    return SceneTable.from_entity(root) if table else root
+
+
+def loads(data: bytes, array_format: ArrayFormat = ArrayFormat.TUPLE,
+          numpy: bool = False, table: bool = False,
+          copy_instances: bool = False) -> Union[Entity, 'SceneTable']:
+    """Read mug scene from `data` bytes, as returned by `dumps`.
+
+    Args:
+        data: Mug scene bytes.
+        array_format: Format to read numeric array attribute values as.
+        numpy: Shortcut for `array_format=ArrayFormat.NUMPY`.
+        table: See `read`.
+        copy_instances: See `read`.
+
+    Returns:
+        Root entity, or scene table.
+    """
+    return read(io.BytesIO(data), array_format, numpy, table=table,
+                copy_instances=copy_instances)
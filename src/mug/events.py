@@ -0,0 +1,168 @@
+"""
+Streaming parsing, as a flat sequence of events.
+"""
+from typing import Any, BinaryIO, Iterator, List, NamedTuple, Optional, \
+    Tuple, Union
+
+from .core import AttributeType, ArrayFormat, FormatFlag, REFERENCE_TAG, \
+    _numpy, _string_at, _value_readers, attr_type_read, header_read, \
+    instance_seek, open_blocks, str_read, string_table_read, suint_read, \
+    tag_read
+
+
+class StartEntity(NamedTuple):
+    """Entity start, followed by its attributes and its children events.
+
+    Attributes:
+        name (str): Entity name.
+        depth (int): Entity depth, 0 for the root one.
+    """
+    name: str
+    depth: int
+
+
+class Attr(NamedTuple):
+    """Attribute of the last started entity.
+
+    Attributes:
+        name (str): Attribute name.
+        type (Union[AttributeType, int]): Attribute type.
+        value (Any): Attribute value.
+    """
+    name: str
+    type: Union[AttributeType, int]
+    value: Any
+
+
+class EndEntity(NamedTuple):
+    """Entity end, once all its descendants have been streamed.
+
+    Attributes:
+        name (str): Entity name.
+        depth (int): Entity depth, 0 for the root one.
+    """
+    name: str
+    depth: int
+
+
+Event = Union[StartEntity, Attr, EndEntity]
+
+
+def iter_events(fd: BinaryIO, array_format: ArrayFormat = ArrayFormat.TUPLE,
+                numpy: bool = False) -> Iterator[Event]:
+    """Stream mug scene from `fd` file object, in file order.
+
+    Nothing but the names of the entities between the root and the current
+    one is kept in memory, and reading stops where the iteration does.
+
+    References of `FormatFlag.INSTANCED` files are streamed as their
+    instance, read again by seeking to it, which needs `fd` to be seekable.
+
+    Examples:
+        >>> with open("my_scene.mug", "rb") as fd:
+        ...     for event in iter_events(fd):
+        ...         if isinstance(event, Attr) and event.name == "xform":
+        ...             print(event.value)
+
+    Args:
+        fd: File object to read from.
+        array_format: Format to read numeric array attribute values as.
+        numpy: Shortcut for `array_format=ArrayFormat.NUMPY`.
+
+    Yields:
+        `StartEntity`, `Attr` and `EndEntity` events.
+    """
+    if numpy:
+        array_format = ArrayFormat.NUMPY
+
+    if array_format is ArrayFormat.NUMPY:
+        _numpy()  # fail early if missing
+
+    blocks = open_blocks(fd)
+
+    if blocks is not None:
+        with blocks:
+            yield from iter_events(blocks, array_format, numpy)
+
+        return
+
+    flags = header_read(fd)
+    strings = string_table_read(fd, flags)
+
+    readers = _value_readers(array_format)
+    sized = FormatFlag.SIZED in flags
+    streamed = FormatFlag.STREAMED in flags
+    instanced = FormatFlag.INSTANCED in flags
+
+    # Names of the started entities having children left to stream, and
+    # their remaining child count, in the current batch if streamed, after
+    # the root entity one.
+    names: List[str] = []
+    child_counts = [1]
+    # Instance and return offsets of `names` entities streamed through a
+    # reference, None for the others.
+    references: List[Optional[Tuple[int, int]]] = []
+    open_instances = set()  # instance offsets of `references`
+
+    while child_counts:
+        if not child_counts[-1]:
+            if streamed and names:
+                child_counts[-1] = suint_read(fd)  # next batch
+
+                if child_counts[-1]:
+                    continue
+
+            child_counts.pop()
+
+            if names:
+                name = names.pop()
+                reference = references.pop()
+
+                if reference is not None:
+                    open_instances.discard(reference[0])
+                    fd.seek(reference[1])
+
+                yield EndEntity(name, len(names))
+
+            continue
+
+        child_counts[-1] -= 1
+        reference = None
+
+        if instanced and tag_read(fd) == REFERENCE_TAG:
+            reference = instance_seek(fd, fd.tell() - 1)
+
+            if reference[0] in open_instances:
+                raise ValueError("invalid instance reference")
+
+        if sized:
+            suint_read(fd)  # entity byte count
+
+        name = str_read(fd) if strings is None \
+            else _string_at(strings, suint_read(fd))
+        yield StartEntity(name, len(names))
+
+        for _ in range(suint_read(fd)):
+            attr_name = str_read(fd) if strings is None \
+                else _string_at(strings, suint_read(fd))
+            attr_type = attr_type_read(fd)
+
+            if sized:
+                suint_read(fd)  # value byte count
+
+            yield Attr(attr_name, attr_type, readers[attr_type](fd))
+
+        child_count = suint_read(fd)
+
+        if child_count:
+            names.append(name)
+            child_counts.append(child_count)
+            references.append(reference)
+
+            if reference is not None:
+                open_instances.add(reference[0])
+        else:
+            if reference is not None:
+                fd.seek(reference[1])
+
+            yield EndEntity(name, len(names))
@@ -0,0 +1,837 @@
+"""
+Incremental writing, encoding again only the entities changed since the
+previous write.
+"""
+from bisect import bisect_right
+import hashlib
+from operator import itemgetter
+from typing import BinaryIO, Dict, Iterable, List, Optional, Set, Tuple, \
+    Union
+
+from .core import Entity, NamedList, FormatFlag, TocEntry, _Encoder, \
+    _scene_names, as_suint_bytes
+
+# Attribute value types that can't change in place. Entities having values
+# of other types, like arrays and lists, are encoded on each write.
+_IMMUTABLE_TYPES = frozenset((str, bytes, int, float, bool, tuple))
+
+
+# Parents of an entity: None, an entity, or a list of several entities.
+_Owners = Union[None, Entity, List[Entity]]
+
+
+def _owner_added(owners: _Owners, entity: Entity) -> _Owners:
+    if owners is None or owners is entity:
+        return entity
+
+    if not isinstance(owners, list):
+        return [owners, entity]
+
+    if not any(owner is entity for owner in owners):
+        owners.append(entity)
+
+    return owners
+
+
+def _owner_removed(owners: _Owners, entity: Entity) -> _Owners:
+    if owners is entity:
+        return None
+
+    if not isinstance(owners, list):
+        return owners
+
+    owners = [owner for owner in owners if owner is not entity]
+    return owners[0] if len(owners) == 1 else owners
+
+
+# Offset shift count of an entity before its children offsets are updated.
+_MAX_SHIFTS = 16
+
+
+class _Entry:
+    """Entity as last written with a cache.
+
+    Offsets are relative to the `parent` entity start, as written on the
+    `generation` write. Writes copying runs of unchanged children rather than
+    placing each again record how the runs moved in the parent `shifts`.
+
+    Attributes:
+        entity (Entity): Written entity.
+        parents (_Owners): Parent entities.
+        parent (Optional[Entity]): Parent `offset` is relative to, None for
+            the root entity.
+        offset (int): Entity offset from its `parent` start.
+        generation (int): Count of the write `offset` was set by.
+        size (int): Entity and descendants byte count, size prefixes
+            included.
+        prefix_size (int): Size prefix byte count, if sized.
+        head_size (int): Entity byte count, size prefix included, without its
+            descendants.
+        attr_offsets (Optional[Dict[str, int]]): Attribute name -> attribute
+            offset from the entity start, if in the table of contents.
+        name (str): Entity name, as written.
+        lists (tuple): Attribute and child lists.
+        states (tuple): Attribute list length and version, and child list
+            ones, if tracked.
+        values (tuple): Each attribute, and its name, type and value as
+            written.
+        children (tuple): Children.
+        untracked (bool): If some changes of the entity can't be detected,
+            as those of attribute values of mutable types, or of lists that
+            aren't `NamedList` ones.
+        tracked_children (bool): If child changes are detected, children
+            being a `NamedList` of distinct entities.
+        shifts (List[Tuple[int, List[int], List[int]]]): Write count, child
+            offsets and shift of the children from each offset, of the
+            writes moving children since they were placed.
+        digest (Optional[bytes]): Entity and descendants bytes hash, once
+            computed.
+    """
+
+    __slots__ = ('entity', 'parents', 'parent', 'offset', 'generation',
+                 'size', 'prefix_size', 'head_size', 'attr_offsets', 'name',
+                 'lists', 'states', 'values', 'children',
+                 'untracked', 'tracked_children', 'shifts', 'digest')
+
+    def __init__(self, entity: Entity):
+        self.entity = entity
+        self.parents: _Owners = None
+        self.parent: Optional[Entity] = None
+        self.offset = 0
+        self.generation = 0
+        self.size = 0
+        self.prefix_size = 0
+        self.head_size = 0
+        self.attr_offsets: Optional[Dict[str, int]] = None
+        self.name = entity.name
+        self.lists: tuple = ()
+        self.states: tuple = ()
+        self.values: tuple = ()
+        self.children: tuple = ()
+        self.untracked = False
+        self.tracked_children = False
+        self.shifts: List[Tuple[int, List[int], List[int]]] = []
+        self.digest: Optional[bytes] = None
+
+
+class _Changes:
+    """Entities changed since written with a cache.
+
+    Attributes:
+        changed (Set[int]): Ids of the entities changed since, or untracked.
+        moved (Set[int]): Ids of the `changed` entities whose children
+            changed.
+        dirty (Set[int]): Ids of `changed` entities and of their ancestors.
+        children (Dict[int, List[Entity]]): Entity id -> its `dirty`
+            children.
+        full (Set[int]): Ids of the entities having `dirty` children with
+            several parents.
+    """
+
+    __slots__ = ('changed', 'moved', 'dirty', 'children', 'full')
+
+    def __init__(self):
+        self.changed: Set[int] = set()
+        self.moved: Set[int] = set()
+        self.dirty: Set[int] = set()
+        self.children: Dict[int, List[Entity]] = {}
+        self.full: Set[int] = set()
+
+
+def _compare(entries: Iterable[_Entry]) -> _Changes:
+    """Return the entities of `entries` changed since written, without their
+    ancestors.
+
+    Run on each write over every written entity, so checks are inlined.
+    Entities new since have a changed parent.
+    """
+    changes = _Changes()
+    changed = changes.changed
+    moved = changes.moved
+
+    for entry in entries:
+        entity = entry.entity
+
+        if entry.untracked:
+            changed.add(id(entity))
+            moved.add(id(entity))
+            continue
+
+        attributes = entity.attributes
+        children = entity.children
+        lists = entry.lists
+        states = entry.states
+
+        if children is not lists[1] or len(children) != states[2] or \
+                children._version != states[3]:
+            changed.add(id(entity))
+            moved.add(id(entity))
+        elif entity.name is not entry.name or \
+                attributes is not lists[0] or \
+                len(attributes) != states[0] or \
+                attributes._version != states[1] or \
+                isinstance(entry.parents, list):
+            changed.add(id(entity))
+        else:
+            for attr, name, type_, value in entry.values:
+                if attr.name is not name or attr.type_ is not type_ or \
+                        attr.value is not value:
+                    changed.add(id(entity))
+                    break
+
+    return changes
+
+
+class WriteCache:
+    """Encoded bytes of the scene last written with it, see `write`.
+
+    Passed to `write` on each save of a scene, only entities changed since
+    the previous save are encoded again. Unchanged subtrees, and runs of
+    unchanged siblings, are copied from the previous bytes, so encoding time
+    scales with the changed entity count rather than the scene size, other
+    entities only being compared.
+
+    Changes are detected by comparing each entity to what the cache last
+    wrote: its name, its `attributes` and `children` lists, by length and
+    `NamedList` version, and the name, type and value of its attributes, by
+    identity. Written objects keep their class. Entities whose changes
+    can't be detected are encoded on each save: entities having attribute
+    values of types changing in place, like arrays, lists or NumPy arrays,
+    entities whose lists aren't `NamedList` ones, and entities having
+    several parents.
+
+    The cache holds the last written hierarchy bytes. With `string_table`,
+    the previous table is kept, new names being appended to it. A table of
+    contents is built walking every entity, without encoding them.
+
+    Examples:
+        >>> cache = WriteCache()
+        >>> write(fd, root, cache=cache)
+        >>> root.children[3].attributes[0].value = 42
+        >>> write(fd, root, cache=cache)  # encodes root and its 4th child
+    """
+
+    def __init__(self):
+        # Write options the cached bytes are encoded with.
+        self._options: Optional[Tuple[bool, bool, bool]] = None
+        self._data = bytearray()  # hierarchy bytes, from the root entity
+        self._root: Optional[Entity] = None
+        self._generation = 0  # write count
+        self._entries: Dict[int, _Entry] = {}  # entity id -> entry
+        # Name -> encoded string table index, with `string_table`.
+        self._strings: Optional[Dict[str, bytes]] = None
+
+    def clear(self):
+        """Forget the cached scene, so the next write encodes it all."""
+        self._options = None
+        self._data = bytearray()
+        self._root = None
+        self._entries = {}
+        self._strings = None
+
+    def content_hash(self, entity: Entity) -> Optional[bytes]:
+        """Return the hash of `entity` and its descendants encoded bytes.
+
+        The hash is computed from the bytes last written, once, and is only
+        returned while the subtree is unchanged since. Encoded bytes depend
+        on `write` options, and string table indices on the whole scene.
+
+        Args:
+            entity: Entity written with this cache.
+
+        Returns:
+            BLAKE2b digest, None if `entity` wasn't written with this cache,
+            or its subtree changed since or has untracked changes.
+        """
+        entries = self._entries
+        entry = entries.get(id(entity))
+
+        if entry is None:
+            return None
+
+        # New descendants change their parent children.
+        subtree = []
+        stack = [entity]
+
+        while stack:
+            descendant = stack.pop()
+            descendant_entry = entries.get(id(descendant))
+
+            if descendant_entry is not None:
+                subtree.append(descendant_entry)
+                stack.extend(descendant.children)
+
+        if _compare(subtree).changed:
+            return None
+
+        if entry.digest is None:
+            start = self._start(entry, {})
+            entry.digest = hashlib.blake2b(
+                self._data[start:start + entry.size],
+                digest_size=16).digest()
+
+        return entry.digest
+
+    def _changes(self) -> _Changes:
+        """Return the written entities changed since."""
+        entries = self._entries
+        changes = _compare(entries.values())
+        dirty = changes.dirty
+        children = changes.children
+        stack = [entries[key].entity for key in changes.changed]
+
+        while stack:
+            entity = stack.pop()
+            key = id(entity)
+
+            if key in dirty:
+                continue
+
+            dirty.add(key)
+            parents = entries[key].parents
+
+            if isinstance(parents, list):
+                changes.full.update(map(id, parents))
+                stack.extend(parents)
+            elif parents is not None:
+                children.setdefault(id(parents), []).append(entity)
+                stack.append(parents)
+
+        return changes
+
+    def _offset(self, entry: _Entry) -> int:
+        """Return `entry` entity offset from its parent in the cached
+        bytes."""
+        offset = entry.offset
+
+        for generation, offsets, shifts in \
+                self._entries[id(entry.parent)].shifts:
+            if generation > entry.generation:
+                index = bisect_right(offsets, offset)
+
+                if index:
+                    offset += shifts[index - 1]
+
+        return offset
+
+    def _start(self, entry: _Entry, starts: Dict[int, int]) -> int:
+        """Return `entry` entity offset in the cached bytes.
+
+        Args:
+            entry: Entity entry.
+            starts: Entity id -> offset, of the entities already located.
+        """
+        entries = self._entries
+        chain = []
+
+        while True:
+            start = starts.get(id(entry.entity))
+            if start is not None:
+                break
+
+            if entry.parent is None:
+                start = 0
+                break
+
+            chain.append(entry)
+            entry = entries[id(entry.parent)]
+
+        for entry in reversed(chain):
+            start += self._offset(entry)
+            starts[id(entry.entity)] = start
+
+        return start
+
+    def _update(self, entry: _Entry, orphans: List[Entity],
+                children_changed: bool):
+        """Record `entry` entity, encoded again, as written.
+
+        Args:
+            entry: Entity entry, holding what it had when previously written.
+            orphans: Filled with previous children it no longer has.
+            children_changed: If its children may have changed.
+        """
+        entity = entry.entity
+        attribute_list = entity.attributes
+        child_list = entity.children
+        attributes = tuple(attribute_list)
+
+        entry.name = entity.name
+        entry.lists = (attribute_list, child_list)
+        entry.values = tuple((attr, attr.name, attr.type_, attr.value)
+                             for attr in attributes)
+        entry.untracked = not isinstance(attribute_list, NamedList) or \
+            not isinstance(child_list, NamedList) or \
+            any(type(attr.value) not in _IMMUTABLE_TYPES
+                for attr in attributes)
+
+        if not entry.untracked:
+            # Versions are only set by list changes.
+            for items in entry.lists:
+                items._version = getattr(items, '_version', 0)
+
+            entry.states = (len(attribute_list), attribute_list._version,
+                            len(child_list), child_list._version)
+
+        if children_changed:
+            children = tuple(child_list)
+            kept = set(map(id, children))
+            entry.tracked_children = len(kept) == len(children) and \
+                isinstance(child_list, NamedList)
+
+            for child in entry.children:
+                child_entry = self._entries.get(id(child))
+
+                if child_entry is not None and id(child) not in kept:
+                    child_entry.parents = _owner_removed(child_entry.parents,
+                                                         entity)
+                    if child_entry.parents is None:
+                        orphans.append(child)
+
+            entry.children = children
+
+    def _prune(self, orphans: List[Entity]):
+        """Forget `orphans` and their descendants, if no longer written."""
+        entries = self._entries
+        stack = orphans
+
+        while stack:
+            entity = stack.pop()
+            entry = entries.get(id(entity))
+
+            if entry is None or entry.parents is not None or \
+                    entity is self._root:
+                continue
+
+            del entries[id(entity)]
+
+            for child in entry.children:
+                child_entry = entries.get(id(child))
+
+                if child_entry is not None:
+                    child_entry.parents = _owner_removed(child_entry.parents,
+                                                         entity)
+                    if child_entry.parents is None:
+                        stack.append(child)
+
+
+class _CacheEncoder(_Encoder):
+    """Encoder appending names missing from its string table to it."""
+
+    def name_bytes(self, name: str) -> bytes:
+        strings = self.strings
+
+        if strings is None:
+            return super().name_bytes(name)
+
+        index = strings.get(name)
+        if index is None:
+            index = strings[name] = as_suint_bytes(len(strings))
+
+        return index
+
+
+class _Copy:
+    """Bytes copied from the cached ones.
+
+    Attributes:
+        entry (Optional[_Entry]): Entry of the copied entity, placed again,
+            None for a run of children keeping their offset.
+        start (int): Copied bytes offset in the cached bytes.
+        end (int): Copied bytes end offset in the cached bytes.
+    """
+
+    __slots__ = ('entry', 'start', 'end')
+
+    def __init__(self, entry: Optional[_Entry], start: int, end: int):
+        self.entry = entry
+        self.start = start
+        self.end = end
+
+
+class _Node:
+    """Entity changed, or having changed descendants, written again.
+
+    Attributes:
+        entity (Entity): Written entity.
+        parent (Optional[Entity]): Parent entity, None for the root one.
+        entry (Optional[_Entry]): Entity entry, None if not written yet.
+        start (int): Entity offset in the cached bytes, if `entry`.
+        encoded (bool): If `head` is encoded again, rather than copied.
+        head (bytearray): Encoded name, attributes and child count.
+        attr_offsets (Optional[Dict[str, int]]): Attribute name -> offset in
+            `head`, if encoded again and in the table of contents.
+        prefix (bytes): Encoded entity byte count, if sized.
+        segments (List[Union[_Copy, _Node]]): Children, or runs of them, in
+            file order.
+        sparse (bool): If only changed children are nodes, copied runs of
+            the others keeping their offsets.
+        size (int): Entity encoded byte count, descendants included, once
+            known.
+        shift (Optional[Tuple[List[int], List[int]]]): Previous child offsets
+            and shift of the children from each offset, if `sparse`.
+    """
+
+    __slots__ = ('entity', 'parent', 'entry', 'start', 'encoded', 'head',
+                 'attr_offsets', 'prefix', 'segments', 'sparse', 'size',
+                 'shift')
+
+    def __init__(self, entity: Entity, parent: Optional[Entity],
+                 entry: Optional[_Entry], start: int):
+        self.entity = entity
+        self.parent = parent
+        self.entry = entry
+        self.start = start
+        self.encoded = False
+        self.head = bytearray()
+        self.attr_offsets: Optional[Dict[str, int]] = None
+        self.prefix = b''
+        self.segments: List[Union[_Copy, _Node]] = []
+        self.sparse = False
+        self.size = 0
+        self.shift: Optional[Tuple[List[int], List[int]]] = None
+
+
+def write_cached(fd: BinaryIO, entity: Entity, cache: WriteCache,
+                 chunk_size: int, sized: bool, toc: bool,
+                 toc_attributes: bool, string_table: bool):
+    """Write mug scene to `fd` file object as `write` does, encoding only
+    the entities changed since the previous write with `cache`.
+
+    Entities changed since are encoded again, and their ancestors too when
+    their child lists changed. Other entities, their subtrees and runs of
+    unchanged siblings are copied from the previous bytes.
+
+    Args:
+        fd: File object to write in.
+        entity: Root entity to write.
+        cache: Bytes and entities of the previous write.
+        chunk_size: Byte count to accumulate before writing to `fd`.
+        sized: See `write`.
+        toc: See `write`.
+        toc_attributes: See `write`.
+        string_table: See `write`.
+    """
+    from .parallel import _gc_paused  # imports multiprocessing
+
+    toc = toc or toc_attributes
+    options = (sized, string_table, toc_attributes)
+
+    if cache._options != options:
+        cache.clear()
+        cache._options = options
+
+    if string_table and cache._strings is None:
+        strings = cache._strings = {}
+
+        for name in _scene_names(entity):
+            strings[name] = as_suint_bytes(len(strings))
+
+    flags = FormatFlag(0)
+
+    if sized:
+        flags |= FormatFlag.SIZED
+
+    if string_table:
+        flags |= FormatFlag.STRING_TABLE
+
+    encoder = _CacheEncoder(flags, toc, toc_attributes, cache._strings)
+    changes = cache._changes()
+
+    with _gc_paused():
+        top, nodes = _encode_changes(entity, encoder, cache, changes)
+        _compute_sizes(nodes, sized)
+        data = _splice(top, cache)
+
+    encoder.header()
+
+    if string_table:
+        encoder.string_table(list(cache._strings))
+
+    buffer = encoder.buffer
+
+    if toc:
+        _add_toc(encoder, entity, cache._entries, len(buffer))
+
+    view = memoryview(data)
+
+    for start in range(0, len(data), chunk_size):
+        buffer += view[start:start + chunk_size]
+        encoder.flush(fd)
+
+    view.release()
+
+    if toc:
+        encoder.toc_footer()
+
+    encoder.flush(fd)
+
+
+def _encode_changes(entity: Entity, encoder: _Encoder, cache: WriteCache,
+                    changes: _Changes) -> Tuple[List[Union[_Copy, _Node]],
+                                                List[_Node]]:
+    """Encode `entity` and its descendants not written with `cache`, or
+    changed since.
+
+    Returns:
+        The root entity node, or copy if unchanged, and nodes in file order.
+    """
+    entries = cache._entries
+    previous = cache._data
+    dirty = changes.dirty
+    starts: Dict[int, int] = {}  # entity id -> offset in the cached bytes
+    entry = entries.get(id(entity))
+
+    if entry is not None and id(entity) not in dirty:
+        start = cache._start(entry, starts)
+        return [_Copy(entry, start, start + entry.size)], []
+
+    root = _Node(entity, None, entry,
+                 0 if entry is None else cache._start(entry, starts))
+    nodes = []
+    stack = [root]
+
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        entity = node.entity
+        entry = node.entry
+        key = id(entity)
+        start = node.start
+
+        if entry is None or key in changes.changed:
+            node.encoded = True
+            if encoder.toc_attributes:
+                node.attr_offsets = {}
+            encoder.entity_head(entity, node.head, node.attr_offsets)
+        else:
+            node.head = previous[start + entry.prefix_size:
+                                 start + entry.head_size]
+
+        segments = node.segments
+
+        if entry is not None and entry.tracked_children and \
+                key not in changes.full and key not in changes.moved:
+            # Same children: runs of unchanged ones keep their offset.
+            node.sparse = True
+            children = [(start + cache._offset(entries[id(child)]), child)
+                        for child in changes.children.get(key, ())]
+            children.sort(key=itemgetter(0))
+            position = start + entry.head_size
+
+            for child_start, child in children:
+                if position < child_start:
+                    segments.append(_Copy(None, position, child_start))
+
+                child_entry = entries[id(child)]
+                segments.append(_Node(child, entity, child_entry,
+                                      child_start))
+                position = child_start + child_entry.size
+
+            if position < start + entry.size:
+                segments.append(_Copy(None, position, start + entry.size))
+        else:
+            if entry is not None:
+                starts[key] = start
+
+            for child in entity.children:
+                child_entry = entries.get(id(child))
+
+                if child_entry is None:
+                    segments.append(_Node(child, entity, None, 0))
+                    continue
+
+                child_start = cache._start(child_entry, starts)
+
+                if id(child) in dirty:
+                    segments.append(_Node(child, entity, child_entry,
+                                          child_start))
+                else:
+                    segments.append(_Copy(child_entry, child_start,
+                                          child_start + child_entry.size))
+
+        stack.extend(segment for segment in reversed(segments)
+                     if isinstance(segment, _Node))
+
+    return [root], nodes
+
+
+def _compute_sizes(nodes: List[_Node], sized: bool):
+    """Set the encoded byte count of `nodes`, their size prefix if `sized`,
+    and the shift of their children.
+
+    Children follow their parent in file order, so reversed order gets
+    children sizes before their parent one.
+    """
+    for node in reversed(nodes):
+        size = len(node.head)
+
+        for segment in node.segments:
+            if isinstance(segment, _Node):
+                size += segment.size
+            else:
+                size += segment.end - segment.start
+
+        if sized:
+            node.prefix = as_suint_bytes(size)
+            size += len(node.prefix)
+
+        node.size = size
+
+        if node.sparse:
+            shift = len(node.prefix) + len(node.head) - node.entry.head_size
+            offsets = [0]
+            shifts = [shift]
+
+            for segment in node.segments:
+                if isinstance(segment, _Node):
+                    shift += segment.size - segment.entry.size
+                    offsets.append(segment.start - node.start +
+                                   segment.entry.size)
+                    shifts.append(shift)
+
+            if any(shifts):
+                node.shift = (offsets, shifts)
+
+
+def _splice(top: List[Union[_Copy, _Node]], cache: WriteCache) -> bytearray:
+    """Return hierarchy bytes of `top` root entity node or copy, and update
+    `cache` to them."""
+    entries = cache._entries
+    previous = memoryview(cache._data)
+    generation = cache._generation = cache._generation + 1
+    data = bytearray()
+    orphans: List[Entity] = []
+    updated: Set[int] = set()  # ids of the entities encoded again
+    compacted: List[_Entry] = []
+    # Nodes being written and their offset in `data`, and their segments.
+    parents: List[Tuple[_Node, int]] = []
+    segments_stack = [iter(top)]
+
+    while segments_stack:
+        for segment in segments_stack[-1]:
+            start = len(data)
+
+            if isinstance(segment, _Copy):
+                data += previous[segment.start:segment.end]
+                entry = segment.entry
+
+                if entry is None:
+                    continue
+            else:
+                node = segment
+                key = id(node.entity)
+                entry = entries.get(key)
+
+                if entry is None:
+                    entry = entries[key] = _Entry(node.entity)
+
+                if key not in updated:
+                    updated.add(key)
+
+                    if node.encoded:
+                        cache._update(entry, orphans, not node.sparse)
+
+                    if not node.sparse:
+                        entry.shifts = []
+                    elif node.shift is not None:
+                        entry.shifts.append((generation,) + node.shift)
+
+                        if len(entry.shifts) > _MAX_SHIFTS:
+                            compacted.append(entry)
+
+                prefix_size = len(node.prefix)
+
+                if node.attr_offsets is not None:
+                    entry.attr_offsets = {
+                        name: prefix_size + offset
+                        for name, offset in node.attr_offsets.items()}
+                elif entry.attr_offsets is not None and \
+                        prefix_size != entry.prefix_size:
+                    shift = prefix_size - entry.prefix_size
+                    entry.attr_offsets = {
+                        name: offset + shift
+                        for name, offset in entry.attr_offsets.items()}
+
+                entry.prefix_size = prefix_size
+                entry.head_size = prefix_size + len(node.head)
+                entry.size = node.size
+                entry.digest = None
+
+                data += node.prefix
+                data += node.head
+
+            if parents:
+                parent, parent_start = parents[-1]
+                entry.parent = parent.entity
+                entry.offset = start - parent_start
+                entry.parents = _owner_added(entry.parents, parent.entity)
+            else:
+                entry.parent = None
+                entry.offset = 0
+
+            entry.generation = generation
+
+            if isinstance(segment, _Node):
+                parents.append((segment, start))
+                segments_stack.append(iter(segment.segments))
+                break
+        else:
+            segments_stack.pop()
+
+            if parents:
+                parents.pop()
+
+    previous.release()
+    cache._data = data
+
+    for entry in compacted:
+        for child in entry.children:
+            child_entry = entries.get(id(child))
+
+            if child_entry is not None and child_entry.parent is entry.entity:
+                child_entry.offset = cache._offset(child_entry)
+                child_entry.generation = generation
+
+        entry.shifts = []
+
+    root = top[0].entry.entity if isinstance(top[0], _Copy) \
+        else top[0].entity
+
+    if cache._root is not root:
+        if cache._root is not None:
+            orphans.append(cache._root)
+        cache._root = root
+
+    cache._prune(orphans)
+
+    return data
+
+
+def _add_toc(encoder: _Encoder, entity: Entity, entries: Dict[int, _Entry],
+             base: int):
+    """Add the table of contents entries of `entity` and its descendants,
+    written at `base` offset from the file start."""
+    toc = encoder.toc
+    stack: List[Tuple[Entity, str, int]] = [(entity, '/' + entity.name,
+                                             base)]
+
+    while stack:
+        entity, path, start = stack.pop()
+        entry = entries[id(entity)]
+
+        attr_offsets = entry.attr_offsets
+        if attr_offsets is not None:
+            attr_offsets = {name: start + offset
+                            for name, offset in attr_offsets.items()}
+
+        toc.setdefault(path, TocEntry(start, attr_offsets))
+
+        children = []
+        start += entry.head_size
+
+        for child in entity.children:
+            children.append((child, path + '/' + child.name, start))
+            start += entries[id(child)].size
+
+        stack.extend(reversed(children))
@@ -0,0 +1,416 @@
+"""
+Random access to entities by path, for reading and patching.
+"""
+import io
+import os
+import shutil
+import tempfile
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple, Union
+
+from .core import Entity, ArrayFormat, FormatFlag, TocEntry, TOC_MAGIC, \
+    DEFAULT_BLOCK_SIZE, REFERENCE_TAG, _U64, _numpy, _string_at, \
+    _value_readers, _value_skippers, attr_type_read, attributes_skip, \
+    find_path, get_codec, header_read, hierarchy_skip, instance_seek, \
+    name_skip, open_blocks, read_hierarchy, str_read, string_table_read, \
+    suint_read, tag_read, write
+from .compression import COMPRESSED_MAGIC
+
+# u64 table of contents offset and magic number.
+_TRAILER_SIZE = 8 + len(TOC_MAGIC)
+
+
+def read_toc(fd: BinaryIO) -> Optional[Dict[str, TocEntry]]:
+    """Read the table of contents of the mug file starting at `fd` position.
+
+    `fd` position is restored before returning.
+
+    Args:
+        fd: Seekable file object to read from.
+
+    Returns:
+        Entity path -> entity table of contents entry, None if the file has
+        no table of contents.
+    """
+    start = fd.tell()
+
+    try:
+        blocks = open_blocks(fd)
+
+        if blocks is not None:
+            with blocks:
+                return read_toc(blocks)
+
+        end = fd.seek(0, io.SEEK_END)
+
+        if end - start < _TRAILER_SIZE:
+            return None
+
+        fd.seek(end - _TRAILER_SIZE)
+        trailer = fd.read(_TRAILER_SIZE)
+
+        if trailer[8:] != TOC_MAGIC:
+            return None
+
+        fd.seek(start + _U64.unpack_from(trailer)[0])
+
+        has_attributes = bool(fd.read(1)[0])
+        toc = {}
+
+        for _ in range(suint_read(fd)):
+            path = str_read(fd)
+            offset = suint_read(fd)
+            attributes = None
+
+            if has_attributes:
+                attributes = {}
+
+                for _ in range(suint_read(fd)):
+                    name = str_read(fd)
+                    attributes[name] = suint_read(fd)
+
+            toc[path] = TocEntry(offset, attributes)
+
+        return toc
+
+    finally:
+        fd.seek(start)
+
+
+def split_path(path: str) -> List[str]:
+    """Return entity names of `path`, from the root one.
+
+    Args:
+        path: Entity path, like "/root/child/grandchild".
+
+    Returns:
+        Entity names.
+
+    Raises:
+        ValueError: If `path` is not absolute.
+    """
+    if not path.startswith('/'):
+        raise ValueError("entity path must start with a slash")
+
+    return path[1:].split('/')
+
+
+def _find_entity(fd: BinaryIO, names: List[str], flags: FormatFlag,
+                 strings: Optional[List[str]]) -> Optional[int]:
+    """Return the offset of the first entity having `names` path.
+
+    The hierarchy at `fd` position is walked, skipping subtrees not matching
+    `names`. References of `FormatFlag.INSTANCED` files are walked through
+    their instance, whose offset is returned for entities below them.
+    """
+    skippers = _value_skippers()
+    sized = FormatFlag.SIZED in flags
+    streamed = FormatFlag.STREAMED in flags
+    instanced = FormatFlag.INSTANCED in flags
+    last_depth = len(names) - 1
+
+    # Entities left to visit at each depth of the walked branch, in the
+    # current batch if streamed, from the root one.
+    remaining_counts = [1]
+    # Instance and return offsets of the reference each depth is walked
+    # through, None for the others.
+    references: List[Optional[Tuple[int, int]]] = [None]
+    open_instances = set()  # instance offsets of `references`
+
+    while remaining_counts:
+        if not remaining_counts[-1]:
+            if streamed and len(remaining_counts) > 1:
+                remaining_counts[-1] = suint_read(fd)  # next batch
+
+                if remaining_counts[-1]:
+                    continue
+
+            remaining_counts.pop()
+            reference = references.pop()
+
+            if reference is not None:
+                open_instances.discard(reference[0])
+                fd.seek(reference[1])
+            continue
+
+        remaining_counts[-1] -= 1
+        depth = len(remaining_counts) - 1
+
+        offset = fd.tell()
+        reference = None
+
+        if instanced and tag_read(fd) == REFERENCE_TAG:
+            reference = instance_seek(fd, offset)
+            offset = reference[0]
+
+            if offset in open_instances:
+                raise ValueError("invalid instance reference")
+
+        if sized:
+            suint_read(fd)  # entity byte count
+
+        name = str_read(fd) if strings is None \
+            else _string_at(strings, suint_read(fd))
+
+        if name != names[depth]:
+            if reference is None:
+                fd.seek(offset)
+                hierarchy_skip(fd, skippers, sized, streamed, strings,
+                               instanced)
+            else:
+                fd.seek(reference[1])
+            continue
+
+        if depth == last_depth:
+            return offset
+
+        attributes_skip(fd, skippers, sized, strings)
+
+        child_count = suint_read(fd)
+        if child_count:
+            remaining_counts.append(child_count)
+            references.append(reference)
+
+            if reference is not None:
+                open_instances.add(reference[0])
+        elif reference is not None:
+            fd.seek(reference[1])
+
+    return None
+
+
+def read_entity(fd: BinaryIO, path: str,
+                array_format: ArrayFormat = ArrayFormat.TUPLE,
+                numpy: bool = False, copy_instances: bool = False) -> Entity:
+    """Read the entity at `path`, and its descendants, from `fd` file object.
+
+    With a table of contents (see `write`), `fd` seeks straight to the
+    entity, only decompressing the blocks it spans in a block compressed
+    container. Otherwise, the hierarchy is walked skipping subtrees not leading
+    to the entity, which is faster with a sized file.
+
+    Examples:
+        >>> with open("my_scene.mug", "rb") as fd:
+        ...     chair = read_entity(fd, "/world/props/chair_042")
+
+    Args:
+        fd: Seekable file object to read from, at the mug file start.
+        path: Entity path, made of entity names from the root one, each one
+            preceded by a slash. The first entity matching it is returned.
+        array_format: Format to read numeric array attribute values as.
+        numpy: Shortcut for `array_format=ArrayFormat.NUMPY`.
+        copy_instances: See `read`.
+
+    Returns:
+        Read entity.
+
+    Raises:
+        KeyError: If there is no entity at `path`.
+    """
+    if numpy:
+        array_format = ArrayFormat.NUMPY
+
+    if array_format is ArrayFormat.NUMPY:
+        _numpy()  # fail early if missing
+
+    blocks = open_blocks(fd)
+
+    if blocks is not None:
+        with blocks:
+            return read_entity(blocks, path, array_format, numpy,
+                               copy_instances)
+
+    start = fd.tell()
+    names = split_path(path)
+
+    toc = read_toc(fd)
+    flags = header_read(fd)
+    strings = string_table_read(fd, flags)
+
+    if toc is None:
+        offset = _find_entity(fd, names, flags, strings)
+    else:
+        entry = toc.get(path)
+        offset = None if entry is None else start + entry.offset
+
+    if offset is None:
+        raise KeyError(path)
+
+    fd.seek(offset)
+
+    return read_hierarchy(fd, _value_readers(array_format), flags, strings,
+                          copy_instances)
+
+
+def _find_value(fd: BinaryIO, path: str,
+                attr_name: str) -> Tuple[int, int, int]:
+    """Locate the value of the first `attr_name` attribute of the entity at
+    `path`, in the mug file at `fd` position.
+
+    Returns:
+        Attribute type code, value offset and value byte count.
+
+    Raises:
+        KeyError: If there is no entity at `path`, or no such attribute.
+    """
+    start = fd.tell()
+    names = split_path(path)
+
+    toc = read_toc(fd)
+    flags = header_read(fd)
+    strings = string_table_read(fd, flags)
+    sized = FormatFlag.SIZED in flags
+
+    if toc is None:
+        offset = _find_entity(fd, names, flags, strings)
+        entry = None
+    else:
+        entry = toc.get(path)
+        offset = None if entry is None else start + entry.offset
+
+    if offset is None:
+        raise KeyError(path)
+
+    if entry is not None and entry.attributes is not None:
+        if attr_name not in entry.attributes:
+            raise KeyError(attr_name)
+
+        fd.seek(start + entry.attributes[attr_name])
+        attr_count = 1
+    else:
+        fd.seek(offset)
+
+        if sized:
+            suint_read(fd)  # entity byte count
+
+        name_skip(fd, strings)
+        attr_count = suint_read(fd)
+
+    skippers = _value_skippers()
+
+    for _ in range(attr_count):
+        name = str_read(fd) if strings is None \
+            else _string_at(strings, suint_read(fd))
+        attr_type = attr_type_read(fd)
+        size = suint_read(fd) if sized else None
+        value_offset = fd.tell()
+
+        if name == attr_name:
+            if size is None:
+                skippers[attr_type](fd)
+                size = fd.tell() - value_offset
+
+            return attr_type, value_offset, size
+
+        if sized:
+            fd.seek(size, io.SEEK_CUR)
+        else:
+            skippers[attr_type](fd)
+
+    raise KeyError(attr_name)
+
+
+def _rewrite(path: Union[str, os.PathLike], entity_path: str,
+             attr_name: str, value: Any):
+    """Rewrite `path` mug file with a new attribute value, see `patch`."""
+    with open(path, 'rb') as fd:
+        compression = None
+        block_size = DEFAULT_BLOCK_SIZE
+
+        if fd.read(len(COMPRESSED_MAGIC)) == COMPRESSED_MAGIC:
+            compression = str_read(fd)
+            block_size = suint_read(fd)
+
+        fd.seek(0)
+        toc = read_toc(fd)
+        blocks = open_blocks(fd)
+
+        with blocks or fd as source:
+            flags = header_read(source)
+            strings = string_table_read(source, flags)
+            # Copied, so only the patched occurrence changes.
+            root = read_hierarchy(source, _value_readers(ArrayFormat.ARRAY),
+                                  flags, strings, copy_instances=True)
+
+    entity = find_path([root], split_path(entity_path))
+    if entity is None:
+        raise KeyError(entity_path)
+
+    attribute = entity.get_attribute(attr_name)
+    if attribute is None:
+        raise KeyError(attr_name)
+
+    attribute.value = value
+
+    # Written next to the file, and moved over it once complete, so the file
+    # is left untouched on failure.
+    temp_fd, temp_path = tempfile.mkstemp(
+        prefix='.mug_', dir=os.path.dirname(os.path.abspath(path)))
+
+    try:
+        with os.fdopen(temp_fd, 'wb') as fd:
+            write(fd, root, sized=FormatFlag.SIZED in flags,
+                  toc=toc is not None,
+                  toc_attributes=toc is not None and any(
+                      entry.attributes is not None for entry in toc.values()),
+                  string_table=FormatFlag.STRING_TABLE in flags,
+                  compression=compression, block_size=block_size,
+                  instances=FormatFlag.INSTANCED in flags)
+
+        shutil.copymode(path, temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def patch(path: Union[str, os.PathLike], entity_path: str, attr_name: str,
+          value: Any) -> bool:
+    """Set the value of an attribute in `path` mug file.
+
+    The attribute is located as `read_entity` locates entities, then its
+    value bytes are overwritten in place if the new value encodes to as many
+    bytes, like any value of a fixed size type. Otherwise, or if the file is
+    a block compressed container or instanced, the file is read and written
+    again with the same format features, streamed files being written
+    unstreamed. Instanced files are rewritten as patching an instance in
+    place would patch all its references.
+
+    Examples:
+        >>> patch("my_scene.mug", "/world/props/chair_042", "xform",
+        ...       (1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0,
+        ...        0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0))
+        True
+
+    Args:
+        path: Mug file path.
+        entity_path: Entity path, see `read_entity`.
+        attr_name: Attribute name, the first attribute having it is set.
+        value: New attribute value, of the attribute type.
+
+    Returns:
+        True if the value was patched in place, False if the file was
+        rewritten.
+
+    Raises:
+        KeyError: If there is no entity at `entity_path`, or if it has no
+            `attr_name` attribute.
+    """
+    with open(path, 'r+b') as fd:
+        in_place = fd.read(len(COMPRESSED_MAGIC)) != COMPRESSED_MAGIC
+
+        if in_place:
+            fd.seek(0)
+            in_place = FormatFlag.INSTANCED not in header_read(fd)
+
+        if in_place:
+            fd.seek(0)
+            attr_type, offset, size = _find_value(fd, entity_path, attr_name)
+            value_bytes = get_codec(attr_type).as_bytes(value)
+
+            if len(value_bytes) == size:
+                fd.seek(offset)
+                fd.write(value_bytes)
+                return True
+
+    _rewrite(path, entity_path, attr_name, value)
+    return False
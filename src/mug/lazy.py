@@ -0,0 +1,229 @@
+"""
+Lazy entity tree, parsed on demand from a memory-mapped file.
+"""
+import os
+import struct
+from typing import Dict, List, Optional, Union
+
+from .core import Entity, Attribute, ArrayFormat, FormatFlag, NamedList, \
+    ReadBuffer, TruncatedError, INSTANCE_TAG, REFERENCE_TAG, \
+    _buffer_value_readers, _buffer_value_skippers, _numpy, _string_at, \
+    reference_unpack_from, str_unpack_from, suint_unpack_from, \
+    tag_unpack_from
+from .mapped import map_file, read_mmap, skip_attributes, skip_hierarchy, \
+    unpack_attributes
+
+
+class _Source:
+    """Buffer lazy entities are parsed from, shared by a whole tree.
+
+    Attributes:
+        buffer (ReadBuffer): Mug scene bytes.
+        readers (Dict[int, Callable]): Attribute type code -> buffer value
+            reading function table.
+        skippers (Dict[int, Callable]): Attribute type code -> buffer value
+            skipping function table.
+        sized (bool): If entities and attribute values are prefixed by their
+            byte count.
+        streamed (bool): If children are written in batches, see
+            `FormatFlag.STREAMED`.
+        strings (Optional[List[str]]): File string table, names being inline
+            strings if None.
+        instanced (bool): If entities are preceded by a tag, see
+            `FormatFlag.INSTANCED`.
+        instances (Optional[Dict[int, LazyEntity]]): Instance offset ->
+            lazy entity shared by its references, None if each reference
+            gets its own lazy entity.
+    """
+
+    def __init__(self, buffer: ReadBuffer, array_format: ArrayFormat,
+                 flags: FormatFlag, strings: Optional[List[str]] = None,
+                 copy_instances: bool = False):
+        self.buffer = buffer
+        self.readers = _buffer_value_readers(array_format)
+        self.skippers = _buffer_value_skippers()
+        self.sized = FormatFlag.SIZED in flags
+        self.streamed = FormatFlag.STREAMED in flags
+        self.strings = strings
+        self.instanced = FormatFlag.INSTANCED in flags
+        self.instances: Optional[Dict[int, LazyEntity]] = \
+            None if copy_instances else {}
+
+
+class LazyEntity(Entity):
+    """Entity parsing its attributes and children on first access.
+
+    Only the entity name and the offset of its attributes are known until
+    then. Once parsed, `attributes` and `children` are plain lists, like
+    `Entity` ones.
+
+    Listing children skips their previous siblings, which is a single read
+    per sibling in files written with `sized=True`, but walks through the
+    whole sibling hierarchies otherwise.
+    """
+
+    __slots__ = ('_source', '_offset', '_child_count_offset', '_attributes',
+                 '_children')
+
+    def __init__(self, name: str, source: _Source, offset: int):
+        """Initialize lazy entity.
+
+        Args:
+            name (str): Entity name.
+            source (_Source): Buffer to parse the entity from.
+            offset (int): Offset of the entity attribute count in the buffer.
+        """
+        # `Entity.__init__` is not called as it would set empty lists.
+        self.name = name
+        self._source = source
+        self._offset = offset
+        self._child_count_offset: Optional[int] = None
+        self._attributes: Optional[List[Attribute]] = None
+        self._children: Optional[List[Entity]] = None
+
+    @property
+    def attributes(self) -> List[Attribute]:
+        if self._attributes is None:
+            source = self._source
+
+            try:
+                self._attributes, self._child_count_offset = \
+                    unpack_attributes(source.buffer, self._offset,
+                                      source.readers, source.sized,
+                                      source.strings)
+            except (IndexError, struct.error):
+                raise TruncatedError("unexpected end of file") from None
+
+        return self._attributes
+
+    @attributes.setter
+    def attributes(self, value: List[Attribute]):
+        self._attributes = value
+
+    @property
+    def children(self) -> List[Entity]:
+        if self._children is None:
+            try:
+                self._children = self._parse_children()
+            except (IndexError, struct.error):
+                raise TruncatedError("unexpected end of file") from None
+
+        return self._children
+
+    @children.setter
+    def children(self, value: List[Entity]):
+        self._children = value
+
+    def _parse_children(self) -> NamedList:
+        source = self._source
+        buffer = source.buffer
+
+        sized = source.sized
+        streamed = source.streamed
+        strings = source.strings
+
+        offset = self._child_count_offset
+        if offset is None:
+            offset = skip_attributes(buffer, self._offset, source.skippers,
+                                     sized, strings)
+
+        child_count, offset = suint_unpack_from(buffer, offset)
+
+        children = NamedList()
+
+        while child_count:
+            for i in range(child_count):
+                children.append(_unpack_lazy_entity(source, offset))
+
+                # The next batch child count follows the last child.
+                if streamed or i + 1 < child_count:
+                    offset = skip_hierarchy(buffer, offset, source.skippers,
+                                            sized, streamed, strings,
+                                            source.instanced)
+
+            if not streamed:
+                break
+
+            child_count, offset = suint_unpack_from(buffer, offset)
+
+        return children
+
+
+def _unpack_lazy_entity(source: _Source, offset: int) -> LazyEntity:
+    """Return the lazy entity at `offset` in `source` buffer."""
+    if source.instanced:
+        tag, tag_end = tag_unpack_from(source.buffer, offset)
+
+        if tag == REFERENCE_TAG:
+            offset, _ = reference_unpack_from(source.buffer, offset)
+            tag_end = offset + 1
+        elif tag != INSTANCE_TAG:
+            return _unpack_lazy_entity_head(source, tag_end)
+
+        if source.instances is None:
+            return _unpack_lazy_entity_head(source, tag_end)
+
+        entity = source.instances.get(offset)
+
+        if entity is None:
+            entity = source.instances[offset] = _unpack_lazy_entity_head(
+                source, tag_end)
+
+        return entity
+
+    return _unpack_lazy_entity_head(source, offset)
+
+
+def _unpack_lazy_entity_head(source: _Source, offset: int) -> LazyEntity:
+    """Return the lazy entity at `offset` in `source` buffer, past its tag
+    if any."""
+    if source.sized:
+        _, offset = suint_unpack_from(source.buffer, offset)
+
+    if source.strings is None:
+        name, offset = str_unpack_from(source.buffer, offset)
+    else:
+        string_index, offset = suint_unpack_from(source.buffer, offset)
+        name = _string_at(source.strings, string_index)
+
+    return LazyEntity(name, source, offset)
+
+
+def open(path: Union[str, os.PathLike], lazy: bool = False,
+         array_format: ArrayFormat = ArrayFormat.TUPLE,
+         numpy: bool = False, copy_instances: bool = False) -> Entity:
+    """Open mug scene from `path` file.
+
+    Examples:
+        >>> root = open("my_scene.mug", lazy=True)
+        >>> root.children[2].attributes  # Only parses what is needed.
+
+    Args:
+        path: Mug file path.
+        lazy: Return a `LazyEntity` root instead of reading the whole
+            hierarchy. The file stays mapped in memory until all its entities
+            are released.
+        array_format: Format to read numeric array attribute values as.
+        numpy: Shortcut for `array_format=ArrayFormat.NUMPY`.
+        copy_instances: See `read`. Lazy copies are distinct lazy entities,
+            parsing their instance again.
+
+    Returns:
+        Root entity.
+    """
+    if not lazy:
+        return read_mmap(path, array_format, numpy, copy_instances)
+
+    if numpy:
+        array_format = ArrayFormat.NUMPY
+
+    if array_format is ArrayFormat.NUMPY:
+        _numpy()  # fail early if missing
+
+    mapping, flags, strings, offset = map_file(path)
+
+    try:
+        return _unpack_lazy_entity(_Source(mapping, array_format, flags,
+                                           strings, copy_instances), offset)
+    except (IndexError, struct.error):
+        raise TruncatedError("unexpected end of file") from None
@@ -0,0 +1,475 @@
+"""
+Memory-mapped file reading.
+
+Values are decoded straight from the mapping by offset, without a read call
+and a bytes object per field.
+"""
+import mmap
+import os
+import struct
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+
+from .core import Entity, Attribute, ArrayFormat, FormatFlag, NamedList, \
+    ReadBuffer, TruncatedError, INSTANCE_TAG, REFERENCE_TAG, \
+    _REFERENCE_SIZE, _buffer_value_readers, _numpy, _string_at, \
+    attr_type_unpack_from, copy_hierarchy, header_unpack_from, \
+    reference_unpack_from, str_skip_from, str_unpack_from, \
+    string_table_unpack_from, suint_unpack_from
+from .compression import COMPRESSED_MAGIC, map_blocks
+
+
+def name_skip_from(buffer: ReadBuffer, offset: int,
+                   strings: Optional[List[str]]) -> int:
+    """Return the offset following the entity or attribute name at `offset`.
+
+    Args:
+        buffer: Buffer to read from.
+        offset: Offset of the name in `buffer`.
+        strings: File string table, names being inline strings if None.
+
+    Returns:
+        Offset following the name.
+    """
+    if strings is None:
+        return str_skip_from(buffer, offset)
+
+    return suint_unpack_from(buffer, offset)[1]
+
+
+def unpack_attributes(buffer: ReadBuffer, offset: int,
+                      readers: Dict[int, Callable], sized: bool = False,
+                      strings: Optional[List[str]] = None) \
+        -> Tuple[List[Attribute], int]:
+    """Read an attribute count and the attributes following it.
+
+    Args:
+        buffer: Buffer to read from.
+        offset: Offset of the attribute count in `buffer`.
+        readers: Attribute type code -> buffer value reading function table.
+        sized: If attribute values are prefixed by their byte count.
+        strings: File string table, names being inline strings if None.
+
+    Returns:
+        Read attributes and offset following them.
+    """
+    attributes = NamedList()
+
+    attr_count, offset = suint_unpack_from(buffer, offset)
+
+    for _ in range(attr_count):
+        if strings is None:
+            attr_name, offset = str_unpack_from(buffer, offset)
+        else:
+            string_index, offset = suint_unpack_from(buffer, offset)
+            attr_name = _string_at(strings, string_index)
+        attr_type, offset = attr_type_unpack_from(buffer, offset)
+
+        if sized:
+            _, offset = suint_unpack_from(buffer, offset)
+
+        attr_value, offset = readers[attr_type](buffer, offset)
+        attributes.append(Attribute(attr_name, attr_type, attr_value))
+
+    return attributes, offset
+
+
+def unpack_entity_head(buffer: ReadBuffer, offset: int,
+                       readers: Dict[int, Callable], sized: bool = False,
+                       strings: Optional[List[str]] = None) \
+        -> Tuple[Entity, int, int]:
+    """Buffer version of `core._read_entity_head`.
+
+    Args:
+        buffer: Buffer to read from.
+        offset: Offset of the entity in `buffer`.
+        readers: Attribute type code -> buffer value reading function table.
+        sized: If entity and attribute values are prefixed by their byte
+            count.
+        strings: File string table, names being inline strings if None.
+
+    Returns:
+        Read entity without children, its child count and offset following
+        its attributes.
+    """
+    if sized:
+        _, offset = suint_unpack_from(buffer, offset)
+
+    if strings is None:
+        name, offset = str_unpack_from(buffer, offset)
+    else:
+        string_index, offset = suint_unpack_from(buffer, offset)
+        name = _string_at(strings, string_index)
+
+    entity = Entity(name)
+
+    entity.attributes, offset = unpack_attributes(buffer, offset, readers,
+                                                  sized, strings)
+    child_count, offset = suint_unpack_from(buffer, offset)
+
+    return entity, child_count, offset
+
+
+def skip_attributes(buffer: ReadBuffer, offset: int,
+                    skippers: Dict[int, Callable], sized: bool = False,
+                    strings: Optional[List[str]] = None) -> int:
+    """Skip an attribute count and the attributes following it.
+
+    Args:
+        buffer: Buffer to read from.
+        offset: Offset of the attribute count in `buffer`.
+        skippers: Attribute type code -> buffer value skipping function table.
+        sized: If attribute values are prefixed by their byte count.
+        strings: File string table, names being inline strings if None.
+
+    Returns:
+        Offset following the attributes.
+    """
+    attr_count, offset = suint_unpack_from(buffer, offset)
+
+    for _ in range(attr_count):
+        offset = name_skip_from(buffer, offset, strings)
+        attr_type, offset = attr_type_unpack_from(buffer, offset)
+
+        if sized:
+            value_size, offset = suint_unpack_from(buffer, offset)
+            offset += value_size
+        else:
+            offset = skippers[attr_type](buffer, offset)
+
+    if offset > len(buffer):
+        raise TruncatedError("unexpected end of file")
+
+    return offset
+
+
+def skip_hierarchy(buffer: ReadBuffer, offset: int,
+                   skippers: Dict[int, Callable], sized: bool = False,
+                   streamed: bool = False,
+                   strings: Optional[List[str]] = None,
+                   instanced: bool = False) -> int:
+    """Skip an entity and its descendants, without decoding them.
+
+    Args:
+        buffer: Buffer to read from.
+        offset: Offset of the entity in `buffer`.
+        skippers: Attribute type code -> buffer value skipping function table.
+        sized: If entities are prefixed by their byte count, making skipping
+            a single read.
+        streamed: If children are written in batches, see
+            `FormatFlag.STREAMED`.
+        strings: File string table, names being inline strings if None.
+        instanced: If entities are preceded by a tag, see
+            `FormatFlag.INSTANCED`.
+
+    Returns:
+        Offset following the entity.
+    """
+    try:
+        if instanced:
+            remaining_count = 1  # records left to skip
+
+            while remaining_count:
+                remaining_count -= 1
+
+                if buffer[offset] == REFERENCE_TAG:
+                    offset += _REFERENCE_SIZE
+                elif sized:
+                    entity_size, offset = suint_unpack_from(buffer,
+                                                            offset + 1)
+                    offset += entity_size
+                else:
+                    offset = name_skip_from(buffer, offset + 1, strings)
+                    offset = skip_attributes(buffer, offset, skippers, False,
+                                             strings)
+                    child_count, offset = suint_unpack_from(buffer, offset)
+                    remaining_count += child_count
+
+            if offset > len(buffer):
+                raise TruncatedError("unexpected end of file")
+
+            return offset
+
+        if sized:
+            entity_size, offset = suint_unpack_from(buffer, offset)
+            offset += entity_size
+
+            if offset > len(buffer):
+                raise TruncatedError("unexpected end of file")
+
+            return offset
+
+        if not streamed:
+            remaining_count = 1  # entities left to skip
+
+            while remaining_count:
+                offset = name_skip_from(buffer, offset, strings)
+                offset = skip_attributes(buffer, offset, skippers, False,
+                                         strings)
+                child_count, offset = suint_unpack_from(buffer, offset)
+                remaining_count += child_count - 1
+
+            return offset
+
+        offset = name_skip_from(buffer, offset, strings)
+        offset = skip_attributes(buffer, offset, skippers, False, strings)
+        child_count, offset = suint_unpack_from(buffer, offset)
+
+        # Children left to skip in the current batch of each entity whose
+        # children are not all skipped.
+        child_counts = [child_count] if child_count else []
+
+        while child_counts:
+            if not child_counts[-1]:
+                child_count, offset = suint_unpack_from(buffer, offset)
+
+                if not child_count:
+                    child_counts.pop()
+                    continue
+
+                child_counts[-1] = child_count
+
+            child_counts[-1] -= 1
+
+            offset = name_skip_from(buffer, offset, strings)
+            offset = skip_attributes(buffer, offset, skippers, False,
+                                     strings)
+
+            child_count, offset = suint_unpack_from(buffer, offset)
+            if child_count:
+                child_counts.append(child_count)
+
+    except (IndexError, struct.error):
+        raise TruncatedError("unexpected end of file") from None
+
+    return offset
+
+
+def unpack_hierarchy(buffer: ReadBuffer, offset: int,
+                     readers: Dict[int, Callable],
+                     flags: FormatFlag = FormatFlag(0),
+                     strings: Optional[List[str]] = None,
+                     copy_instances: bool = False) -> Tuple[Entity, int]:
+    """Buffer version of `core.read_hierarchy`.
+
+    Args:
+        buffer: Buffer to read from.
+        offset: Offset of the entity in `buffer`.
+        readers: Attribute type code -> buffer value reading function table.
+        flags: File format features.
+        strings: File string table, see `core.string_table_read`.
+        copy_instances: See `core.read_hierarchy`.
+
+    Returns:
+        Read entity and offset following it.
+    """
+    if FormatFlag.INSTANCED in flags:
+        try:
+            return _unpack_instanced_hierarchy(
+                buffer, offset, readers, FormatFlag.SIZED in flags, strings,
+                copy_instances, {}, set())
+        except (IndexError, struct.error):
+            raise TruncatedError("unexpected end of file") from None
+
+    sized = FormatFlag.SIZED in flags
+    streamed = FormatFlag.STREAMED in flags
+
+    try:
+        root, child_count, offset = unpack_entity_head(buffer, offset,
+                                                       readers, sized,
+                                                       strings)
+
+        # Entities having children left to read and their remaining child
+        # count, in the current batch if streamed.
+        parents = []
+        child_counts = []
+
+        if child_count:
+            parents.append(root)
+            child_counts.append(child_count)
+
+        while parents:
+            child_count = child_counts[-1]
+
+            if not child_count:
+                if streamed:
+                    # Next batch.
+                    child_count, offset = suint_unpack_from(buffer, offset)
+
+                if not child_count:
+                    parents.pop()
+                    child_counts.pop()
+                    continue
+
+            child_counts[-1] = child_count - 1
+
+            entity, child_count, offset = unpack_entity_head(buffer, offset,
+                                                             readers, sized,
+                                                             strings)
+            parents[-1].children.append(entity)
+
+            if child_count:
+                parents.append(entity)
+                child_counts.append(child_count)
+
+    except (IndexError, struct.error):
+        raise TruncatedError("unexpected end of file") from None
+
+    return root, offset
+
+
+def _unpack_instanced_hierarchy(buffer: ReadBuffer, offset: int,
+                                readers: Dict[int, Callable], sized: bool,
+                                strings: Optional[List[str]],
+                                copy_instances: bool,
+                                instances: Dict[int, Entity],
+                                resolving: Set[int]) -> Tuple[Entity, int]:
+    """Buffer version of `core._read_instanced_hierarchy`."""
+    root = None
+    # Entities having children left to read, their remaining child count
+    # and their offset if instances, None otherwise.
+    parents = []
+    child_counts = []
+    offsets = []
+
+    while True:
+        if parents:
+            if not child_counts[-1]:
+                entity = parents.pop()
+                child_counts.pop()
+                instance_offset = offsets.pop()
+
+                if instance_offset is not None:
+                    instances[instance_offset] = entity
+                continue
+
+            child_counts[-1] -= 1
+        elif root is not None:
+            return root, offset
+
+        tag = buffer[offset]
+        instance_offset = None
+        child_count = 0
+
+        if tag == REFERENCE_TAG:
+            instance_offset, offset = reference_unpack_from(buffer, offset)
+            entity = instances.get(instance_offset)
+
+            if entity is None:
+                # Read from the middle of the buffer, or invalid.
+                if instance_offset in resolving:
+                    raise ValueError("invalid instance reference")
+
+                resolving.add(instance_offset)
+                entity, _ = _unpack_instanced_hierarchy(
+                    buffer, instance_offset, readers, sized, strings, False,
+                    instances, resolving)
+                resolving.discard(instance_offset)
+
+            if copy_instances:
+                entity = copy_hierarchy(entity)
+
+            instance_offset = None
+        elif tag > REFERENCE_TAG:
+            raise ValueError("invalid entity tag")
+        else:
+            if tag == INSTANCE_TAG:
+                instance_offset = offset
+
+            entity, child_count, offset = unpack_entity_head(
+                buffer, offset + 1, readers, sized, strings)
+
+            if instance_offset is not None and not child_count:
+                instances[instance_offset] = entity
+
+        if root is None:
+            root = entity
+        else:
+            parents[-1].children.append(entity)
+
+        if child_count:
+            parents.append(entity)
+            child_counts.append(child_count)
+            offsets.append(instance_offset)
+
+
+def map_file(path: Union[str, os.PathLike]) \
+        -> Tuple[mmap.mmap, FormatFlag, Optional[List[str]], int]:
+    """Map `path` mug file in memory, read only, and read its header.
+
+    The mug file of a block compressed container is decompressed in an
+    anonymous mapping instead.
+
+    Args:
+        path: Mug file path.
+
+    Returns:
+        File mapping, file format features, string table if any and root
+        entity offset.
+
+    Raises:
+        ValueError: If the file is not a mug file.
+    """
+    with open(path, 'rb') as fd:
+        if os.fstat(fd.fileno()).st_size < 4:
+            raise ValueError("not a valid mug file format")
+
+        if fd.read(4) == COMPRESSED_MAGIC:
+            mapping = map_blocks(fd)
+        else:
+            mapping = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        flags, offset = header_unpack_from(mapping)
+        strings, offset = string_table_unpack_from(mapping, offset, flags)
+    except ValueError:
+        mapping.close()
+        raise
+    except IndexError:
+        mapping.close()
+        raise TruncatedError("unexpected end of file") from None
+
+    return mapping, flags, strings, offset
+
+
+def read_mmap(path: Union[str, os.PathLike],
+              array_format: ArrayFormat = ArrayFormat.TUPLE,
+              numpy: bool = False, copy_instances: bool = False) -> Entity:
+    """Read mug scene from memory-mapped `path` file.
+
+    Returns the same hierarchy as `read`, with fewer allocations. In
+    `ArrayFormat.MEMORYVIEW` and `ArrayFormat.NUMPY` formats, numeric array
+    values reference the mapping instead of copying it, keeping it open until
+    they are all released.
+
+    Args:
+        path: Mug file path.
+        array_format: Format to read numeric array attribute values as.
+        numpy: Shortcut for `array_format=ArrayFormat.NUMPY`.
+        copy_instances: See `read`.
+
+    Returns:
+        Root entity.
+    """
+    if numpy:
+        array_format = ArrayFormat.NUMPY
+
+    if array_format is ArrayFormat.NUMPY:
+        _numpy()  # fail early if missing
+
+    mapping, flags, strings, offset = map_file(path)
+
+    try:
+        root, _ = unpack_hierarchy(mapping, offset,
+                                   _buffer_value_readers(array_format), flags,
+                                   strings, copy_instances)
+    except BaseException:
+        try:
+            mapping.close()
+        except BufferError:
+            pass  # referenced by values already read, closed with them
+        raise
+
+    if array_format in (ArrayFormat.TUPLE, ArrayFormat.ARRAY):
+        mapping.close()  # nothing references it
+
+    return root
@@ -0,0 +1,397 @@
+"""
+Parallel encoding and decoding, of independent subtrees in worker processes.
+"""
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+import gc
+import io
+import multiprocessing
+import struct
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple, \
+    Union
+
+from .core import Entity, ArrayFormat, FormatFlag, TocEntry, \
+    TruncatedError, _Encoder, _buffer_value_readers, _buffer_value_skippers, \
+    as_suint_bytes, suint_unpack_from
+from .mapped import skip_hierarchy, unpack_entity_head, unpack_hierarchy
+from .table import SceneTable, read_table
+
+# Forked workers inherit the scene from the parent process memory, instead
+# of unpickling each subtree, which is slower than encoding it.
+_FORK = 'fork' in multiprocessing.get_all_start_methods()
+
+# Scene, or scene bytes, and encoder or decoder arguments of worker
+# processes, see `_init_worker`.
+_worker_scene: Union[Entity, bytes, None] = None
+_worker_args: Tuple[Any, ...] = ()
+
+
+def _init_worker(scene: Union[Entity, bytes, None], *args: Any):
+    """Set the scene and the encoding or decoding arguments of a worker
+    process.
+
+    Args:
+        scene: Root entity to encode, or bytes to decode, inherited from the
+            parent process if forked. None if subtrees are sent to workers.
+        args: `_Encoder` arguments, or file format features and string
+            table.
+    """
+    global _worker_scene, _worker_args
+
+    _worker_scene = scene
+    _worker_args = args
+
+
+def _encode_subtree(subtree: Union[Entity, Tuple[int, ...]]) \
+        -> Tuple[bytes, Optional[Dict[str, TocEntry]]]:
+    """Return `subtree` encoded bytes and its table of contents.
+
+    Run in worker processes. The encoding of a subtree doesn't depend on its
+    offset in the file, its table of contents offsets being relative to the
+    subtree start and its paths to the subtree parent.
+
+    Args:
+        subtree: Subtree root entity, or its child indices from the worker
+            scene root.
+    """
+    if not isinstance(subtree, Entity):
+        indices = subtree
+        subtree = _worker_scene
+
+        for index in indices:
+            subtree = subtree.children[index]
+
+    encoder = _Encoder(*_worker_args)
+
+    for _ in encoder.hierarchy(subtree):
+        pass
+
+    return bytes(encoder.buffer), encoder.toc
+
+
+class _Head:
+    """Entity above the split depth, encoded in the main process.
+
+    Attributes:
+        entity (Entity): Encoded entity.
+        path (str): Entity path.
+        head (bytearray): Encoded name, attributes and child count.
+        attr_offsets (Optional[Dict[str, int]]): Attribute name -> offset in
+            `head`, if in the table of contents.
+        size (int): Entity encoded byte count, descendants included, once
+            known.
+    """
+
+    __slots__ = ('entity', 'path', 'head', 'attr_offsets', 'size')
+
+    def __init__(self, entity: Entity, path: str):
+        self.entity = entity
+        self.path = path
+        self.head = bytearray()
+        self.attr_offsets: Optional[Dict[str, int]] = None
+        self.size = 0
+
+
+class _Subtree:
+    """Entity at the split depth, encoded with its descendants by a worker.
+
+    Attributes:
+        entity (Entity): Encoded entity.
+        parent_path (str): Path of the entity parent.
+        future (Optional[Future]): Encoded bytes and table of contents, None
+            once written.
+    """
+
+    __slots__ = ('entity', 'parent_path', 'future')
+
+    def __init__(self, entity: Entity, parent_path: str, future: Future):
+        self.entity = entity
+        self.parent_path = parent_path
+        self.future: Optional[Future] = future
+
+
+def write_parallel(fd: BinaryIO, entity: Entity, encoder: _Encoder,
+                   chunk_size: int, workers: int, split_depth: int):
+    """Write `entity` and its descendants, encoding subtrees in parallel.
+
+    Entities down to `split_depth` are encoded in this process, and their
+    descendants in `workers` processes, one task per entity at
+    `split_depth`. Encoded subtrees are written in file order as they
+    complete.
+
+    Args:
+        fd: File object to write in.
+        entity: Root entity.
+        encoder: Encoder holding bytes not written yet.
+        chunk_size: Byte count to accumulate before writing to `fd`.
+        workers: Worker process count.
+        split_depth: Depth of the entities encoded by workers, 0 for the root
+            one.
+    """
+    if split_depth < 0:
+        raise ValueError("split depth must not be negative")
+
+    sized = FormatFlag.SIZED in encoder.flags
+    toc = encoder.toc is not None
+    toc_attributes = toc and encoder.toc_attributes
+
+    if _FORK:
+        executor = ProcessPoolExecutor(
+            workers, multiprocessing.get_context('fork'), _init_worker,
+            (entity, encoder.flags, toc, toc_attributes, encoder.strings))
+    else:
+        executor = ProcessPoolExecutor(
+            workers, None, _init_worker,
+            (None, encoder.flags, toc, toc_attributes, encoder.strings))
+
+    with executor:
+        # Entities in file order, subtrees submitted as they are reached.
+        items: List[Union[_Head, _Subtree]] = []
+        stack = [(entity, (), '', 0)]
+
+        while stack:
+            entity, indices, parent_path, depth = stack.pop()
+
+            if depth == split_depth:
+                items.append(_Subtree(entity, parent_path, executor.submit(
+                    _encode_subtree, indices if _FORK else entity)))
+                continue
+
+            item = _Head(entity, parent_path + '/' + entity.name)
+            if toc_attributes:
+                item.attr_offsets = {}
+            encoder.entity_head(entity, item.head, item.attr_offsets)
+            items.append(item)
+
+            stack.extend((child, indices + (i,), item.path, depth + 1)
+                         for i, child in reversed(list(enumerate(
+                             entity.children))))
+
+        if sized:
+            _compute_sizes(items)
+
+        buffer = encoder.buffer
+
+        for item in items:
+            if isinstance(item, _Subtree):
+                data, subtree_toc = item.future.result()
+                item.future = None  # releases bytes once written
+
+                if toc:
+                    _merge_toc(encoder, item.parent_path, subtree_toc)
+
+                buffer += data
+            else:
+                offset = encoder.tell()
+
+                if sized:
+                    buffer += as_suint_bytes(item.size)
+
+                if toc:
+                    attr_offsets = item.attr_offsets
+                    if attr_offsets is not None:
+                        base = encoder.tell()
+                        attr_offsets = {name: base + attr_offset
+                                        for name, attr_offset
+                                        in attr_offsets.items()}
+
+                    encoder.toc.setdefault(item.path,
+                                           TocEntry(offset, attr_offsets))
+
+                buffer += item.head
+
+            if len(buffer) >= chunk_size:
+                encoder.flush(fd)
+
+    encoder.flush(fd)
+
+
+def _compute_sizes(items: List[Union[_Head, _Subtree]]):
+    """Set the encoded byte count of `items` heads, waiting for subtrees.
+
+    Children follow their parent in file order, so reversed order gets
+    children sizes before their parent one.
+    """
+    sizes: Dict[int, int] = {}  # entity id -> size prefixed byte count
+
+    for item in reversed(items):
+        if isinstance(item, _Subtree):
+            data, _ = item.future.result()
+            sizes[id(item.entity)] = len(data)  # size prefixed already
+            continue
+
+        size = len(item.head)
+
+        for child in item.entity.children:
+            size += sizes[id(child)]
+
+        item.size = size
+        sizes[id(item.entity)] = len(as_suint_bytes(size)) + size
+
+
+def _merge_toc(encoder: _Encoder, parent_path: str,
+               subtree_toc: Dict[str, TocEntry]):
+    """Add `subtree_toc` entries of a subtree encoded at `encoder` end."""
+    base = encoder.tell()
+    toc = encoder.toc
+
+    for path, entry in subtree_toc.items():
+        attr_offsets = entry.attributes
+        if attr_offsets is not None:
+            attr_offsets = {name: base + offset
+                            for name, offset in attr_offsets.items()}
+
+        toc.setdefault(parent_path + path,
+                       TocEntry(base + entry.offset, attr_offsets))
+
+
+@contextmanager
+def _gc_paused() -> Iterator[None]:
+    """Pause the cyclic garbage collector, if enabled.
+
+    Building millions of acyclic entities otherwise triggers collections
+    walking the whole heap, taking most of the conversion time.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _decode_subtree(subtree: Union[Tuple[int, int], bytes]) -> SceneTable:
+    """Return `subtree` decoded as a scene table.
+
+    Run in worker processes. Tables are sent back as a few arrays, much
+    faster to transfer than pickled `Entity` objects.
+
+    Args:
+        subtree: Subtree start and end offsets in the worker scene bytes, or
+            subtree bytes.
+    """
+    if isinstance(subtree, tuple):
+        start, end = subtree
+        subtree = _worker_scene[start:end]
+
+    return read_table(io.BytesIO(subtree), *_worker_args)
+
+
+def read_parallel(fd: BinaryIO, flags: FormatFlag,
+                  strings: Optional[List[str]], array_format: ArrayFormat,
+                  workers: int, split_depth: int,
+                  copy_instances: bool = False) -> Entity:
+    """Read an entity and its descendants, decoding subtrees in parallel.
+
+    The hierarchy is read in memory. Entities down to `split_depth` are
+    decoded in this process, which skips the subtrees below, in a single
+    step per subtree in sized files. Subtrees are decoded in `workers`
+    processes as `SceneTable`, then converted to entities.
+
+    `FormatFlag.INSTANCED` files are decoded in this process, subtrees
+    referencing entities out of them.
+
+    Args:
+        fd: File object to read from, past the header.
+        flags: File format features.
+        strings: File string table, see `string_table_read`.
+        array_format: Format to read numeric array attribute values as.
+        workers: Worker process count.
+        split_depth: Depth of the entities decoded by workers, 0 for the root
+            one.
+        copy_instances: See `read`.
+
+    Returns:
+        Read entity.
+    """
+    if split_depth < 0:
+        raise ValueError("split depth must not be negative")
+
+    data = fd.read()
+    sized = FormatFlag.SIZED in flags
+    streamed = FormatFlag.STREAMED in flags
+    readers = _buffer_value_readers(array_format)
+
+    if FormatFlag.INSTANCED in flags:
+        return unpack_hierarchy(data, 0, readers, flags, strings,
+                                copy_instances)[0]
+    skippers = _buffer_value_skippers()
+
+    if _FORK:
+        executor = ProcessPoolExecutor(
+            workers, multiprocessing.get_context('fork'), _init_worker,
+            (data, flags, strings))
+    else:
+        executor = ProcessPoolExecutor(workers, None, _init_worker,
+                                       (None, flags, strings))
+
+    def submit(start: int) -> Tuple[Future, int]:
+        """Decode the subtree at `start` in a worker, return its end."""
+        end = skip_hierarchy(data, start, skippers, sized, streamed, strings)
+        subtree = (start, end) if _FORK else data[start:end]
+        return executor.submit(_decode_subtree, subtree), end
+
+    with executor:
+        try:
+            if not split_depth:
+                future, _ = submit(0)
+
+                with _gc_paused():
+                    return future.result().to_entity(array_format)
+
+            # Parents and child indices of subtrees decoded by workers.
+            subtrees: List[Tuple[Entity, int, Future]] = []
+
+            root, child_count, offset = unpack_entity_head(data, 0, readers,
+                                                           sized, strings)
+
+            # Entities having children left to read and their remaining
+            # child count, in the current batch if streamed.
+            parents = []
+            child_counts = []
+
+            if child_count:
+                parents.append(root)
+                child_counts.append(child_count)
+
+            while parents:
+                child_count = child_counts[-1]
+
+                if not child_count:
+                    if streamed:
+                        # Next batch.
+                        child_count, offset = suint_unpack_from(data, offset)
+
+                    if not child_count:
+                        parents.pop()
+                        child_counts.pop()
+                        continue
+
+                child_counts[-1] = child_count - 1
+                children = parents[-1].children
+
+                if len(parents) == split_depth:
+                    future, offset = submit(offset)
+                    subtrees.append((parents[-1], len(children), future))
+                    children.append(None)  # replaced once decoded
+                    continue
+
+                entity, child_count, offset = unpack_entity_head(
+                    data, offset, readers, sized, strings)
+                children.append(entity)
+
+                if child_count:
+                    parents.append(entity)
+                    child_counts.append(child_count)
+
+        except (IndexError, struct.error):
+            raise TruncatedError("unexpected end of file") from None
+
+        with _gc_paused():
+            for parent, index, future in subtrees:
+                parent.children[index] = future.result().to_entity(
+                    array_format)
+
+    return root
@@ -0,0 +1,336 @@
+"""
+Summary and integrity check of a mug file, without decoding values.
+"""
+import heapq
+import io
+import mmap
+import struct
+from typing import Any, BinaryIO, Dict, List, NamedTuple, Optional, Tuple
+
+from .core import AttributeType, ArrayCodec, FormatFlag, ReadBuffer, \
+    TruncatedError, INSTANCE_TAG, REFERENCE_TAG, TOC_MAGIC, _CODECS, _U64, \
+    _buffer_value_skippers, header_unpack_from, open_blocks, \
+    reference_unpack_from, str_skip_from, str_unpack_from, \
+    string_table_unpack_from, suint_unpack_from, tag_unpack_from
+
+# u64 table of contents offset and magic number.
+_TRAILER_SIZE = 8 + len(TOC_MAGIC)
+
+
+class LargeAttribute(NamedTuple):
+    """Attribute among the largest ones of a scanned file.
+
+    Attributes:
+        path (str): Path of the attribute entity, see `read_entity`.
+        name (str): Attribute name.
+        type (int): Attribute type code.
+        size (int): Attribute value byte count.
+    """
+    path: str
+    name: str
+    type: int
+    size: int
+
+
+class ScanResult:
+    """Summary of a mug file, see `scan`.
+
+    Attributes:
+        flags (FormatFlag): File format features.
+        bytes (int): Mug file byte count, table of contents included.
+        entities (int): Entity count, references excluded.
+        references (int): Count of the references of an instanced file,
+            see `FormatFlag.INSTANCED`.
+        attributes (int): Attribute count.
+        max_depth (int): Depth of the deepest entity, 0 for the root one.
+        type_counts (Dict[int, int]): Attribute type code -> value count.
+        type_bytes (Dict[int, int]): Attribute type code -> value byte count.
+        array_bytes (int): Byte count of numeric array values.
+        has_toc (bool): If the file has a table of contents.
+        largest (List[LargeAttribute]): Largest attributes, the largest
+            first.
+    """
+
+    def __init__(self, flags: FormatFlag):
+        self.flags = flags
+        self.bytes = 0
+        self.entities = 0
+        self.references = 0
+        self.attributes = 0
+        self.max_depth = 0
+        self.type_counts: Dict[int, int] = {}
+        self.type_bytes: Dict[int, int] = {}
+        self.array_bytes = 0
+        self.has_toc = False
+        self.largest: List[LargeAttribute] = []
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return summary as a dict, for serialization.
+
+        Attribute types are keyed by `AttributeType` name, or by type code
+        for custom types.
+        """
+        return {
+            'flags': int(self.flags),
+            'bytes': self.bytes,
+            'entities': self.entities,
+            'references': self.references,
+            'attributes': self.attributes,
+            'max_depth': self.max_depth,
+            'types': {_type_name(type_code): {
+                'count': count, 'bytes': self.type_bytes[type_code]}
+                for type_code, count in sorted(self.type_counts.items())},
+            'array_bytes': self.array_bytes,
+            'has_toc': self.has_toc,
+            'largest': [attr._asdict() for attr in self.largest],
+        }
+
+
+def _type_name(type_code: int) -> str:
+    try:
+        return AttributeType(type_code).name
+    except ValueError:
+        return str(type_code)
+
+
+def _map(fd: BinaryIO) -> Tuple[ReadBuffer, int, Optional[mmap.mmap]]:
+    """Return a buffer of `fd` file content, its offset of `fd` position
+    and the mapping to close, if mapped."""
+    try:
+        fileno = fd.fileno()
+        offset = fd.tell()
+        mapping = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        return fd.read(), 0, None  # not a file, or an empty one
+
+    return mapping, offset, mapping
+
+
+def scan(fd: BinaryIO, largest_count: int = 10) -> ScanResult:
+    """Summarize the mug file at `fd` position and check its structure,
+    without decoding values.
+
+    Values are skipped as readers do when skipping, fixed size ones by their
+    size and numeric arrays by their count, and only the names of the
+    largest attributes and their entities are decoded. Files are memory
+    mapped when possible, read otherwise, and block compressed containers
+    are decompressed.
+
+    Examples:
+        >>> with open("my_scene.mug", "rb") as fd:
+        ...     result = scan(fd)
+        >>> result.entities, result.largest[0].path
+
+    Args:
+        fd: File object to read from.
+        largest_count: Count of the largest attributes to report.
+
+    Returns:
+        File summary.
+
+    Raises:
+        ValueError: If the file is truncated, not a mug file, or has an
+            unknown attribute type, an invalid string index, sizes not
+            matching contents in sized files, references not pointing to a
+            previous instance in instanced files, or unexpected trailing
+            bytes.
+    """
+    blocks = open_blocks(fd)
+
+    if blocks is not None:
+        with blocks:
+            return scan(blocks, largest_count)
+
+    buffer, start, mapping = _map(fd)
+
+    try:
+        return _scan(buffer, start, largest_count)
+    except (IndexError, struct.error):
+        raise TruncatedError("unexpected end of file") from None
+    finally:
+        if mapping is not None:
+            mapping.close()
+
+
+def _scan(buffer: ReadBuffer, start: int, largest_count: int) -> ScanResult:
+    """Scan the mug file at `start` in `buffer`, see `scan`."""
+    flags, offset = header_unpack_from(buffer, start)
+    strings, offset = string_table_unpack_from(buffer, offset, flags)
+
+    result = ScanResult(flags)
+    sized = FormatFlag.SIZED in flags
+    streamed = FormatFlag.STREAMED in flags
+    instanced = FormatFlag.INSTANCED in flags
+    string_count = -1 if strings is None else len(strings)
+    skippers = _buffer_value_skippers()
+    array_types = frozenset(type_code for type_code, codec in _CODECS.items()
+                            if isinstance(codec, ArrayCodec))
+    type_counts = result.type_counts
+    type_bytes = result.type_bytes
+    buffer_size = len(buffer)
+
+    def name_at(name: int) -> str:
+        """Return the name of a string index, or at an inline string
+        offset."""
+        return strings[name] if strings is not None \
+            else str_unpack_from(buffer, name)[0]
+
+    # Largest attributes as (value byte count, negated attribute order,
+    # entity names, attribute name, type code), the smallest and last first,
+    # so the first of equal sizes are kept.
+    largest = []
+    min_size = 0 if largest_count > 0 else float('inf')
+    order = 0  # scanned attribute count
+
+    # Names, as string indices or inline string offsets, end offsets if
+    # sized and children left to scan, in the current batch if streamed, of
+    # the entities down to the current one.
+    names: List[int] = []
+    ends: List[int] = []
+    child_counts = [1]
+    # Offsets of the instances down to the current entity, None for other
+    # entities, and of the instances scanned with their descendants.
+    instance_offsets: List[Optional[int]] = []
+    instances = set()
+
+    while child_counts:
+        if not child_counts[-1]:
+            if streamed and names:
+                child_counts[-1], offset = suint_unpack_from(buffer, offset)
+
+                if child_counts[-1]:
+                    continue
+
+            child_counts.pop()
+
+            if names:
+                names.pop()
+
+                if sized and ends.pop() != offset:
+                    raise ValueError("invalid entity size")
+
+                if instanced:
+                    instances.add(instance_offsets.pop())
+
+            continue
+
+        child_counts[-1] -= 1
+
+        if instanced:
+            tag, tag_end = tag_unpack_from(buffer, offset)
+
+            if tag == REFERENCE_TAG:
+                instance_offset, offset = reference_unpack_from(buffer,
+                                                                offset)
+
+                if instance_offset not in instances:
+                    raise ValueError("invalid instance reference")
+
+                result.references += 1
+                continue
+
+            instance_offsets.append(offset if tag == INSTANCE_TAG else None)
+            offset = tag_end
+
+        if sized:
+            entity_size, offset = suint_unpack_from(buffer, offset)
+            ends.append(offset + entity_size)
+
+        if strings is None:
+            names.append(offset)
+            offset = str_skip_from(buffer, offset)
+        else:
+            name, offset = suint_unpack_from(buffer, offset)
+            names.append(name)
+
+            if name >= string_count:
+                raise ValueError("invalid string table index")
+
+        result.entities += 1
+        if len(names) > result.max_depth + 1:
+            result.max_depth = len(names) - 1
+
+        attr_count, offset = suint_unpack_from(buffer, offset)
+        result.attributes += attr_count
+
+        for _ in range(attr_count):
+            if strings is None:
+                attr_name = offset
+                offset = str_skip_from(buffer, offset)
+            else:
+                attr_name, offset = suint_unpack_from(buffer, offset)
+
+                if attr_name >= string_count:
+                    raise ValueError("invalid string table index")
+
+            attr_type = buffer[offset]
+            skipper = skippers.get(attr_type)
+            if skipper is None:
+                raise ValueError("unknown attribute type")
+
+            offset += 1
+
+            if sized:
+                value_size, offset = suint_unpack_from(buffer, offset)
+
+            value_start = offset
+            offset = skipper(buffer, offset)
+            size = offset - value_start
+
+            if sized and size != value_size:
+                raise ValueError("invalid attribute value size")
+
+            type_counts[attr_type] = type_counts.get(attr_type, 0) + 1
+            type_bytes[attr_type] = type_bytes.get(attr_type, 0) + size
+
+            if attr_type in array_types:
+                result.array_bytes += size
+
+            order += 1
+
+            if size > min_size:
+                heapq.heappush(largest, (size, -order, names[:], attr_name,
+                                         attr_type))
+
+                if len(largest) > largest_count:
+                    heapq.heappop(largest)
+
+                if len(largest) == largest_count:
+                    min_size = largest[0][0]
+
+        if offset > buffer_size:
+            raise TruncatedError("unexpected end of file")
+
+        child_count, offset = suint_unpack_from(buffer, offset)
+
+        if child_count:
+            child_counts.append(child_count)
+        else:
+            names.pop()
+
+            if sized and ends.pop() != offset:
+                raise ValueError("invalid entity size")
+
+            if instanced:
+                instances.add(instance_offsets.pop())
+
+    if offset > buffer_size:
+        raise TruncatedError("unexpected end of file")
+
+    if offset < buffer_size:
+        trailer_offset = buffer_size - _TRAILER_SIZE
+
+        if buffer[trailer_offset + 8:] != TOC_MAGIC or \
+                _U64.unpack_from(buffer, trailer_offset)[0] != offset - start:
+            raise ValueError("unexpected bytes after the root entity")
+
+        result.has_toc = True
+
+    result.bytes = buffer_size - start
+    result.largest = [
+        LargeAttribute('/' + '/'.join(map(name_at, entity_names)),
+                       name_at(attr_name), attr_type, size)
+        for size, _, entity_names, attr_name, attr_type
+        in sorted(largest, key=lambda item: (-item[0], -item[1]))]
+
+    return result
@@ -0,0 +1,277 @@
+"""
+Read and write statistics, per attribute type.
+"""
+import io
+from functools import partial
+from time import perf_counter
+from typing import Any, BinaryIO, Callable, Dict, Union
+
+from .core import Entity, AttributeType, ArrayFormat, FormatFlag, \
+    _scene_encoder, _seekable, _value_readers, header_read, read_hierarchy, \
+    str_read, string_table_read, suint_read, write_hierarchy
+
+
+class Measure:
+    """Count, byte count and time of a kind of read or written item.
+
+    Attributes:
+        count (int): Item count.
+        bytes (int): Item byte count.
+        seconds (float): Time spent reading or writing items.
+    """
+
+    __slots__ = ('count', 'bytes', 'seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def as_dict(self) -> Dict[str, Union[int, float]]:
+        """Return measure as a dict, for serialization."""
+        return {'count': self.count, 'bytes': self.bytes,
+                'seconds': self.seconds}
+
+
+class Stats:
+    """Statistics of the scenes read or written with it.
+
+    Passed to `read` or `write`, each attribute value, name and size read or
+    written is counted and timed, adding up over calls. Timing slows reading
+    and writing down, but not without a `Stats`.
+
+    Examples:
+        >>> stats = Stats()
+        >>> with open("my_scene.mug", "rb") as fd:
+        ...     root = read(fd, stats=stats)
+        >>> stats.types[AttributeType.STR].seconds
+        0.042
+
+    Attributes:
+        seconds (float): Time spent reading or writing scenes.
+        bytes (int): Mug file byte count read or written, before
+            compression.
+        entities (int): Entity count, entities shared by several parents
+            of a read scene counted once.
+        max_depth (int): Depth of the deepest entity, 0 for the root one.
+        types (Dict[int, Measure]): Attribute type code -> value measure.
+        names (Measure): Inline entity and attribute names read by
+            `str_read`. Not measured when writing, names being cached.
+        suints (Measure): Sizes, counts and string table indices read by
+            `suint_read`. Not measured when writing.
+    """
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.bytes = 0
+        self.entities = 0
+        self.max_depth = 0
+        self.types: Dict[int, Measure] = {}
+        self.names = Measure()
+        self.suints = Measure()
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return statistics as a dict of numbers, for serialization.
+
+        Attribute types are keyed by `AttributeType` name, or by type code
+        for custom types.
+        """
+        return {
+            'seconds': self.seconds,
+            'bytes': self.bytes,
+            'entities': self.entities,
+            'max_depth': self.max_depth,
+            'types': {_type_name(type_code): measure.as_dict()
+                      for type_code, measure in sorted(self.types.items())},
+            'names': self.names.as_dict(),
+            'suints': self.suints.as_dict(),
+        }
+
+    def _type(self, type_code: int) -> Measure:
+        measure = self.types.get(type_code)
+        if measure is None:
+            measure = self.types[type_code] = Measure()
+        return measure
+
+
+def _type_name(type_code: int) -> str:
+    try:
+        return AttributeType(type_code).name
+    except ValueError:
+        return str(type_code)
+
+
+class _CountingFile:
+    """Read only file object wrapper counting bytes read."""
+
+    def __init__(self, fd: BinaryIO):
+        self._fd = fd
+        self.count = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._fd.read(size)
+        self.count += len(data)
+        return data
+
+    def readinto(self, b) -> int:
+        readinto = getattr(self._fd, 'readinto', None)
+
+        if readinto is None:
+            data = self.read(len(b))
+            b[:len(data)] = data
+            return len(data)
+
+        read_count = readinto(b)
+        self.count += read_count or 0
+        return read_count
+
+    def seekable(self) -> bool:
+        return _seekable(self._fd)
+
+    def tell(self) -> int:
+        return self._fd.tell()
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self._fd.seek(offset, whence)
+
+
+def _timed(function: Callable[[BinaryIO], Any],
+           get_measure: Callable[[], Measure],
+           fd: _CountingFile) -> Callable[[BinaryIO], Any]:
+    """Return `function` adding its calls on `fd` to the measure returned by
+    `get_measure`, called after each call so only types read get one."""
+    def timed(_) -> Any:
+        count = fd.count
+        start = perf_counter()
+        value = function(fd)
+        measure = get_measure()
+        measure.seconds += perf_counter() - start
+        measure.bytes += fd.count - count
+        measure.count += 1
+        return value
+
+    return timed
+
+
+def _add_entities(stats: Stats, root: Entity, distinct: bool):
+    """Add `root` and its descendants to `stats` entity count and depth.
+
+    Args:
+        stats: Statistics to add to.
+        root: Root entity.
+        distinct: Count entities shared by several parents once, at their
+            first occurrence in file order.
+    """
+    visited = set()
+    stack = [(root, 0)]
+
+    while stack:
+        entity, depth = stack.pop()
+
+        if distinct:
+            if id(entity) in visited:
+                continue
+
+            visited.add(id(entity))
+
+        stats.entities += 1
+        stats.max_depth = max(stats.max_depth, depth)
+        stack.extend((child, depth + 1)
+                     for child in reversed(entity.children))
+
+
+def read_stats(fd: BinaryIO, array_format: ArrayFormat, stats: Stats,
+               copy_instances: bool = False) -> Entity:
+    """Read mug scene from `fd` file object as `read` does, adding what is
+    read to `stats`.
+
+    Args:
+        fd: File object to read from, at the mug file start.
+        array_format: Format to read numeric array attribute values as.
+        stats: Statistics to add to.
+        copy_instances: See `read`.
+
+    Returns:
+        Root entity.
+    """
+    start = perf_counter()
+    file_fd = fd = _CountingFile(fd)
+
+    try:
+        flags = header_read(fd)
+        strings = string_table_read(fd, flags)
+
+        if FormatFlag.INSTANCED in flags and not fd.seekable():
+            # As `read` does, counted once by `file_fd`.
+            fd = _CountingFile(io.BytesIO(fd.read()))
+
+        readers = {type_code: _timed(reader,
+                                     partial(stats._type, type_code), fd)
+                   for type_code, reader
+                   in _value_readers(array_format).items()}
+
+        root = read_hierarchy(fd, readers, flags, strings, copy_instances,
+                              _timed(str_read, lambda: stats.names, fd),
+                              _timed(suint_read, lambda: stats.suints, fd))
+    finally:
+        stats.seconds += perf_counter() - start
+        stats.bytes += file_fd.count
+
+    # References read as copies count as entities of their own.
+    _add_entities(stats, root, True)
+
+    return root
+
+
+def _timed_writer(writer: Callable[[Any], bytes],
+                  get_measure: Callable[[], Measure]) \
+        -> Callable[[Any], bytes]:
+    """Return `writer` adding its calls to the measure returned by
+    `get_measure`, see `_timed`."""
+    def timed(value: Any) -> bytes:
+        start = perf_counter()
+        data = writer(value)
+        measure = get_measure()
+        measure.seconds += perf_counter() - start
+        measure.bytes += len(data)
+        measure.count += 1
+        return data
+
+    return timed
+
+
+def write_stats(fd: BinaryIO, entity: Entity, chunk_size: int, sized: bool,
+                toc: bool, toc_attributes: bool, string_table: bool,
+                stats: Stats, instances: bool = False):
+    """Write mug scene to `fd` file object as `write` does, adding what is
+    written to `stats`.
+
+    Args:
+        fd: File object to write in.
+        entity: Root entity to write.
+        chunk_size: Byte count to accumulate before writing to `fd`.
+        sized: See `write`.
+        toc: See `write`.
+        toc_attributes: See `write`.
+        string_table: See `write`.
+        stats: Statistics to add to.
+        instances: See `write`.
+    """
+    start = perf_counter()
+
+    def wrap_writer(type_code: int, writer: Callable[[Any], bytes]) \
+            -> Callable[[Any], bytes]:
+        return _timed_writer(writer, partial(stats._type, type_code))
+
+    encoder = _scene_encoder(entity, sized, toc, toc_attributes,
+                             string_table, instances, wrap_writer)
+
+    write_hierarchy(fd, entity, encoder, chunk_size)
+
+    if encoder.toc is not None:
+        encoder.toc_footer()
+        encoder.flush(fd)
+
+    stats.seconds += perf_counter() - start
+    stats.bytes += encoder.tell()
+    _add_entities(stats, entity, False)
@@ -0,0 +1,221 @@
+"""
+Incremental writing, one entity at a time.
+"""
+from typing import Any, BinaryIO, List, Optional, Union
+
+from .core import AttributeType, FormatFlag, DEFAULT_CHUNK_SIZE, MAX_U8, \
+    MAX_U32, _Encoder, _U32, _flush, _seekable, as_str_bytes, \
+    as_suint_bytes
+
+
+# Child count slot written before the entity children, patched once it's
+# known: a 32 bits suint, whatever the count is.
+_CHILD_COUNT_SLOT = bytes((MAX_U8,) * 7)
+
+
+def _child_count_slot_bytes(child_count: int) -> bytes:
+    """Return `child_count` as a `_CHILD_COUNT_SLOT` sized suint."""
+    if child_count >= MAX_U32:
+        raise ValueError("too many children")
+
+    return _CHILD_COUNT_SLOT[:3] + _U32.pack(child_count)
+
+
+class StreamWriter:
+    """Write a mug scene one entity at a time, without building it first.
+
+    Entities are begun and ended in file order, parents first. Attributes
+    must be added to an entity before its first child is begun. Only the
+    branch being written is kept in memory.
+
+    On a seekable file object, a version 1 file is written: the child count
+    of each entity having children is written as a 7 bytes suint and patched
+    once the entity ends. Otherwise, a version 2 file with
+    `FormatFlag.STREAMED` is written, each child being prefixed by a batch
+    child count of 1 and the children followed by a zero count.
+
+    Examples:
+        >>> with open("my_scene.mug", "wb") as fd, StreamWriter(fd) as writer:
+        ...     writer.begin_entity("root")
+        ...     writer.add_attribute("id", AttributeType.U32, 42)
+        ...     writer.begin_entity("child")
+        ...     writer.end_entity()
+        ...     writer.end_entity()
+    """
+
+    def __init__(self, fd: BinaryIO, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 streamed: Optional[bool] = None):
+        """Initialize stream writer.
+
+        Args:
+            fd (BinaryIO): File object to write in.
+            chunk_size (int): Byte count to accumulate before writing to
+                `fd`.
+            streamed (Optional[bool]): Write a `FormatFlag.STREAMED` file,
+                which doesn't need to seek. Defaults to `fd` not being
+                seekable.
+        """
+        if streamed is None:
+            streamed = not _seekable(fd)
+
+        self._fd = fd
+        self._chunk_size = chunk_size
+        self._streamed = streamed
+        self._encoder = _Encoder(FormatFlag.STREAMED if streamed
+                                 else FormatFlag(0))
+        # Child count slot offsets are relative to the file start.
+        self._start = 0 if streamed else fd.tell()
+        self._encoder.header()
+
+        # Name and encoded attributes of the last begun entity, encoded once
+        # its attribute count is known, at its first child or its end.
+        self._head_name: Optional[str] = None
+        self._head_attributes = bytearray()
+        self._head_attr_count = 0
+
+        # Child count and child count slot offset of each begun entity, the
+        # slot being None until its first child.
+        self._child_counts: List[int] = []
+        self._slot_offsets: List[Optional[int]] = []
+
+        self._root_ended = False
+        self._closed = False
+
+    def __enter__(self) -> 'StreamWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Leave a failed scene as is, without hiding the error.
+        if exc_type is None:
+            self.close()
+
+    def begin_entity(self, name: str):
+        """Begin an entity, child of the last begun one not ended yet.
+
+        Args:
+            name: Entity name.
+
+        Raises:
+            ValueError: If the root entity is already ended.
+        """
+        if self._closed or self._root_ended:
+            raise ValueError("root entity already ended")
+
+        if self._child_counts:
+            encoder = self._encoder
+
+            if self._head_name is not None:
+                self._encode_head()
+
+                if not self._streamed:
+                    self._slot_offsets[-1] = encoder.tell()
+                    encoder.buffer += _CHILD_COUNT_SLOT
+
+            if self._streamed:
+                encoder.buffer.append(1)  # batch child count
+
+            self._child_counts[-1] += 1
+
+        self._head_name = name
+        self._child_counts.append(0)
+        self._slot_offsets.append(None)
+
+        self._flush_chunk()
+
+    def add_attribute(self, name: str, type_: Union[AttributeType, int],
+                      value: Any):
+        """Add an attribute to the last begun entity.
+
+        Args:
+            name: Attribute name.
+            type_: Attribute type.
+            value: Attribute value.
+
+        Raises:
+            ValueError: If there is no entity to add the attribute to, if its
+                children are already begun or if `type_` is unknown.
+        """
+        if self._head_name is None:
+            if self._child_counts:
+                raise ValueError("attributes must be added before children")
+
+            raise ValueError("no entity to add attributes to")
+
+        self._encoder.attribute(self._head_attributes, name, type_, value)
+        self._head_attr_count += 1
+
+    def end_entity(self):
+        """End the last begun entity, once all its children are ended.
+
+        Raises:
+            ValueError: If there is no entity to end.
+        """
+        if not self._child_counts:
+            raise ValueError("no entity to end")
+
+        child_count = self._child_counts.pop()
+        slot_offset = self._slot_offsets.pop()
+
+        buffer = self._encoder.buffer
+
+        if self._head_name is not None:
+            self._encode_head()
+            buffer.append(0)  # child count
+        elif self._streamed:
+            buffer.append(0)  # last batch
+        else:
+            self._patch(slot_offset, _child_count_slot_bytes(child_count))
+
+        if not self._child_counts:
+            self._root_ended = True
+
+        self._flush_chunk()
+
+    def close(self):
+        """Write the bytes still buffered, the file object staying open.
+
+        Raises:
+            ValueError: If entities are not ended.
+        """
+        if self._closed:
+            return
+
+        if self._child_counts:
+            raise ValueError("entities not ended")
+
+        if not self._root_ended:
+            raise ValueError("no entity written")
+
+        self._encoder.flush(self._fd)
+        self._closed = True
+
+    def _encode_head(self):
+        """Encode the pending entity name and attributes."""
+        buffer = self._encoder.buffer
+
+        buffer += as_str_bytes(self._head_name)
+        buffer += as_suint_bytes(self._head_attr_count)
+        buffer += self._head_attributes
+
+        self._head_name = None
+        self._head_attributes.clear()
+        self._head_attr_count = 0
+
+    def _patch(self, offset: int, data: bytes):
+        """Overwrite bytes at `offset` from the file start with `data`."""
+        encoder = self._encoder
+        buffer_offset = offset - encoder.flushed_count
+
+        if buffer_offset >= 0:
+            encoder.buffer[buffer_offset:buffer_offset + len(data)] = data
+            return
+
+        fd = self._fd
+        fd.seek(self._start + offset)
+        _flush(fd, bytearray(data))
+        fd.seek(self._start + encoder.flushed_count)
+
+    def _flush_chunk(self):
+        """Write the buffered bytes if they reach the chunk size."""
+        if len(self._encoder.buffer) >= self._chunk_size:
+            self._encoder.flush(self._fd)
@@ -0,0 +1,718 @@
+"""
+Columnar scene, packing entities and attribute values in arrays.
+"""
+import struct
+from array import array
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, \
+    Union
+
+from .core import Entity, Attribute, AttributeType, AttributeCodec, \
+    ArrayCodec, ArrayFormat, FormatFlag, NamedList, ScalarCodec, \
+    TruncatedError, VectorCodec, _ATTR_TYPES, _Encoder, \
+    _NATIVE_LITTLE_ENDIAN, _array_typecode, _numpy, _string_at, \
+    as_suint_bytes, attr_type_read, get_codec, read_hierarchy, suint_read
+
+
+class ValueColumn:
+    """Attribute values of a single type.
+
+    Numeric components are packed in an `array.array`, half floats being
+    widened to 32 bits floats. Other values are kept in a list.
+
+    Attributes:
+        values (Union[array, list]): Packed components, or values.
+        width (Optional[int]): Component count of each value, None if
+            variable.
+        offsets (Optional[array]): Index of the first component of each
+            value in `values`, followed by the component count, for variable
+            component count numeric values.
+    """
+
+    def __init__(self, typecode: Optional[str] = None,
+                 width: Optional[int] = 1):
+        """Initialize value column.
+
+        Args:
+            typecode (Optional[str]): `array.array` typecode of numeric
+                components, None to keep values in a list.
+            width (Optional[int]): Component count of numeric values, None if
+                variable.
+        """
+        self.values: Union[array, list] = array(typecode) if typecode else []
+        self.width = width
+        self.offsets: Optional[array] = None
+
+        if typecode and width is None:
+            self.offsets = array('Q', (0,))
+
+    def __len__(self) -> int:
+        if self.offsets is not None:
+            return len(self.offsets) - 1
+        elif isinstance(self.values, list):
+            return len(self.values)
+
+        return len(self.values) // self.width
+
+    def __getitem__(self, row: int) -> Any:
+        """Return the value at `row`.
+
+        Fixed component count values are returned as tuples and variable
+        ones as `array.array`, like `read` does with `ArrayFormat.ARRAY`.
+        """
+        values = self.values
+
+        if self.offsets is not None:
+            return values[self.offsets[row]:self.offsets[row + 1]]
+        elif isinstance(values, list) or self.width == 1:
+            return values[row]
+
+        start = row * self.width
+        return tuple(values[start:start + self.width])
+
+    def to_list(self, codec: AttributeCodec,
+                array_format: ArrayFormat = ArrayFormat.ARRAY) -> list:
+        """Return all the values, as `read` does with `array_format`.
+
+        Numeric components are converted in bulk, much faster than getting
+        values one at a time.
+
+        Args:
+            codec: Codec of the column attribute type.
+            array_format: Format of numeric array values, and of numeric
+                vectors with `ArrayFormat.NUMPY`.
+
+        Returns:
+            Values, in row order.
+        """
+        values = self.values
+
+        if isinstance(values, list):
+            return list(values)
+
+        offsets = self.offsets
+        width = self.width
+
+        if array_format is ArrayFormat.NUMPY and width != 1:
+            components = _numpy().array(values, codec.dtype)
+
+            if offsets is None:
+                return list(components.reshape(-1, width))
+
+            return [components[start:end]
+                    for start, end in zip(offsets, offsets[1:])]
+
+        if offsets is not None:
+            arrays = [values[start:end]
+                      for start, end in zip(offsets, offsets[1:])]
+
+            if array_format is ArrayFormat.TUPLE:
+                return list(map(tuple, arrays))
+            elif array_format is ArrayFormat.MEMORYVIEW:
+                return list(map(memoryview, arrays))
+
+            return arrays
+
+        if width == 1:
+            return values.tolist()
+
+        return list(zip(*[iter(values)] * width))
+
+    def append(self, value: Any):
+        """Append `value` to the column.
+
+        Args:
+            value: Value to append.
+
+        Raises:
+            ValueError: If `value` component count doesn't match `width`.
+        """
+        values = self.values
+
+        if self.offsets is not None:
+            values.extend(value)
+            self.offsets.append(len(values))
+        elif isinstance(values, list) or self.width == 1:
+            values.append(value)
+        else:
+            if len(value) != self.width:
+                raise ValueError("invalid component count")
+
+            values.extend(value)
+
+    def reader(self, codec: AttributeCodec) -> Callable[[BinaryIO], None]:
+        """Return the function reading a value from a file object into the
+        column.
+
+        Args:
+            codec: Codec of the column attribute type.
+
+        Returns:
+            Function reading a value from a file object and appending it.
+        """
+        values = self.values
+
+        if isinstance(values, list):
+            read = codec.read
+
+            def read_value(fd: BinaryIO):
+                values.append(read(fd))
+
+            return read_value
+
+        # Components are copied as is when their layout matches.
+        raw = _NATIVE_LITTLE_ENDIAN and codec.format == values.typecode
+
+        if self.offsets is not None:
+            offsets = self.offsets
+            item_size = codec.item_size
+
+            def read_array_value(fd: BinaryIO):
+                if raw:
+                    _extend_from(values, fd, item_size * suint_read(fd))
+                else:
+                    values.extend(codec.read(fd))
+
+                offsets.append(len(values))
+
+            return read_array_value
+
+        if raw:
+            size = codec.size
+
+            def read_raw_value(fd: BinaryIO):
+                _extend_from(values, fd, size)
+
+            return read_raw_value
+
+        read = codec.read
+
+        if self.width == 1:
+            def read_scalar_value(fd: BinaryIO):
+                values.append(read(fd))
+
+            return read_scalar_value
+
+        def read_vector_value(fd: BinaryIO):
+            values.extend(read(fd))
+
+        return read_vector_value
+
+    def encoder(self, codec: AttributeCodec) -> Callable[[int], bytes]:
+        """Return the function encoding the value at a row of the column.
+
+        Args:
+            codec: Codec of the column attribute type.
+
+        Returns:
+            Function returning the encoded value at a row.
+        """
+        values = self.values
+
+        if isinstance(values, list) or not _NATIVE_LITTLE_ENDIAN or \
+                codec.format != values.typecode:
+            as_bytes = codec.as_bytes
+
+            def encode_value(row: int) -> bytes:
+                return as_bytes(self[row])
+
+            return encode_value
+
+        # Components are copied as is.
+        if self.offsets is not None:
+            offsets = self.offsets
+
+            def encode_raw_array_value(row: int) -> bytes:
+                start = offsets[row]
+                end = offsets[row + 1]
+                return as_suint_bytes(end - start) + \
+                    values[start:end].tobytes()
+
+            return encode_raw_array_value
+
+        width = self.width
+
+        def encode_raw_value(row: int) -> bytes:
+            start = row * width
+            return values[start:start + width].tobytes()
+
+        return encode_raw_value
+
+
+def _extend_from(values: array, fd: BinaryIO, size: int):
+    """Append `size` bytes of components read from `fd` to `values`."""
+    data = fd.read(size)
+
+    if len(data) != size:
+        raise TruncatedError("unexpected end of file")
+
+    values.frombytes(data)
+
+
+def _new_column(type_code: int) -> ValueColumn:
+    """Return an empty column for `type_code` attribute values."""
+    codec = get_codec(type_code)
+
+    if isinstance(codec, ScalarCodec):
+        width = 1
+    elif isinstance(codec, VectorCodec):
+        width = codec.count
+    elif isinstance(codec, ArrayCodec):
+        width = None
+    else:
+        return ValueColumn()
+
+    typecode = _array_typecode(codec.format, struct.calcsize(codec.format))
+
+    return ValueColumn(typecode or 'f', width)  # half floats widened
+
+
+class SceneTable:
+    """Columnar mug scene.
+
+    Entities are stored in file order, parents before their children, the
+    root one first. Each entity and attribute is a row in a few arrays, and
+    attribute values are packed in a column per attribute type, which costs
+    far less memory than `Entity` and `Attribute` objects.
+
+    Examples:
+        >>> table = SceneTable()
+        >>> root = table.add_entity("root")
+        >>> table.add_attribute("id", AttributeType.U32, 42)
+        >>> child = table.add_entity("child", root)
+        >>> table.root.children[0].name
+        'child'
+
+    Attributes:
+        names (List[str]): Distinct entity and attribute names.
+        entity_names (array): Index in `names` of each entity name.
+        entity_parents (array): Index of the parent of each entity, -1 for
+            the root one.
+        attr_starts (array): Index of the first attribute of each entity,
+            followed by the attribute count.
+        attr_names (array): Index in `names` of each attribute name.
+        attr_types (array): Type code of each attribute.
+        attr_rows (array): Row of each attribute value in its type column.
+        columns (Dict[int, ValueColumn]): Attribute type code -> values.
+    """
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.entity_names = array('L')
+        self.entity_parents = array('q')
+        self.attr_starts = array('Q', (0,))
+        self.attr_names = array('L')
+        self.attr_types = array('B')
+        self.attr_rows = array('Q')
+        self.columns: Dict[int, ValueColumn] = {}
+        self._name_indices: Dict[str, int] = {}
+        self._subtree_ends: Optional[array] = None
+
+    def __len__(self) -> int:
+        """Return the entity count."""
+        return len(self.entity_names)
+
+    def name_index(self, name: str) -> int:
+        """Return the index of `name` in `names`, adding it if missing."""
+        index = self._name_indices.get(name)
+
+        if index is None:
+            index = self._name_indices[name] = len(self.names)
+            self.names.append(name)
+
+        return index
+
+    def add_entity(self, name: str, parent: int = -1) -> int:
+        """Append an entity, child of `parent`.
+
+        Entities must be added in file order: `parent` is the last added
+        entity or one of its ancestors.
+
+        Args:
+            name: Entity name.
+            parent: Index of the parent entity, -1 for the root one.
+
+        Returns:
+            Entity index.
+
+        Raises:
+            ValueError: If adding a second root entity or if `parent` is out
+                of range.
+        """
+        index = len(self.entity_names)
+
+        if parent < 0:
+            if index:
+                raise ValueError("scene table already has a root entity")
+        elif parent >= index:
+            raise ValueError("parent entity index out of range")
+
+        self.entity_names.append(self.name_index(name))
+        self.entity_parents.append(parent)
+        self.attr_starts.append(self.attr_starts[-1])
+        self._subtree_ends = None
+
+        return index
+
+    def add_attribute(self, name: str, type_: Union[AttributeType, int],
+                      value: Any):
+        """Append an attribute to the last added entity.
+
+        Args:
+            name: Attribute name.
+            type_: Attribute type.
+            value: Attribute value.
+
+        Raises:
+            ValueError: If there is no entity or `type_` is unknown.
+        """
+        if not self.entity_names:
+            raise ValueError("no entity to add attributes to")
+
+        column = self.columns.get(type_)
+        if column is None:
+            column = self.columns[type_] = _new_column(type_)
+
+        self.attr_names.append(self.name_index(name))
+        self.attr_types.append(type_)
+        self.attr_rows.append(len(column))
+        self.attr_starts[-1] += 1
+        column.append(value)
+
+    def attribute_value(self, attr_index: int) -> Any:
+        """Return the value of the attribute at `attr_index`."""
+        return self.columns[self.attr_types[attr_index]][
+            self.attr_rows[attr_index]]
+
+    def attributes(self, index: int) -> List[Attribute]:
+        """Return the attributes of the entity at `index`, as new objects."""
+        names = self.names
+
+        return [Attribute(names[self.attr_names[i]],
+                          _ATTR_TYPES[self.attr_types[i]],
+                          self.attribute_value(i))
+                for i in range(self.attr_starts[index],
+                               self.attr_starts[index + 1])]
+
+    def child_indices(self, index: int) -> Iterator[int]:
+        """Iterate over the indices of the children of the entity at
+        `index`."""
+        ends = self._subtree_ends
+        if ends is None:
+            ends = self._subtree_ends = self._compute_subtree_ends()
+
+        child = index + 1
+        end = ends[index]
+
+        while child < end:
+            yield child
+            child = ends[child]
+
+    def child_counts(self) -> array:
+        """Return the child count of each entity."""
+        counts = array('Q', (0,)) * len(self.entity_parents)
+
+        for parent in self.entity_parents:
+            if parent >= 0:
+                counts[parent] += 1
+
+        return counts
+
+    def _compute_subtree_ends(self) -> array:
+        """Return the index following the descendants of each entity."""
+        parents = self.entity_parents
+        ends = array('Q', range(1, len(parents) + 1))
+
+        # Children follow their parent, so reversed order gets children ends
+        # before their parent one.
+        for index in range(len(parents) - 1, 0, -1):
+            parent = parents[index]
+            if ends[index] > ends[parent]:
+                ends[parent] = ends[index]
+
+        return ends
+
+    def entity(self, index: int) -> 'TableEntity':
+        """Return a view of the entity at `index`."""
+        if not 0 <= index < len(self.entity_names):
+            raise IndexError("entity index out of range")
+
+        return TableEntity(self, index)
+
+    @property
+    def root(self) -> 'TableEntity':
+        """View of the root entity."""
+        return self.entity(0)
+
+    def to_entity(self,
+                  array_format: ArrayFormat = ArrayFormat.ARRAY) -> Entity:
+        """Return the scene as `Entity` objects.
+
+        Args:
+            array_format: Format of numeric array attribute values, see
+                `ValueColumn.to_list`.
+
+        Returns:
+            Root entity.
+        """
+        names = self.names
+        columns = {type_code: column.to_list(get_codec(type_code),
+                                             array_format)
+                   for type_code, column in self.columns.items()}
+
+        attributes = list(map(
+            Attribute, map(names.__getitem__, self.attr_names),
+            map(_ATTR_TYPES.__getitem__, self.attr_types),
+            [columns[type_code][row]
+             for type_code, row in zip(self.attr_types, self.attr_rows)]))
+
+        attr_starts = self.attr_starts
+        entities: List[Entity] = []
+
+        for index, (name_index, parent) in enumerate(
+                zip(self.entity_names, self.entity_parents)):
+            entity = Entity(names[name_index])
+            entity.attributes = NamedList(
+                attributes[attr_starts[index]:attr_starts[index + 1]])
+            entities.append(entity)
+
+            if parent >= 0:
+                entities[parent].children.append(entity)
+
+        return entities[0]
+
+    @classmethod
+    def from_entity(cls, entity: Entity) -> 'SceneTable':
+        """Return a table of `entity` and its descendants.
+
+        Args:
+            entity: Root entity.
+
+        Returns:
+            Scene table.
+        """
+        table = cls()
+        # Parents are stacked with their children, which can be shared.
+        stack = [(entity, -1)]
+
+        while stack:
+            entity, parent = stack.pop()
+            index = table.add_entity(entity.name, parent)
+
+            for attr in entity.attributes:
+                table.add_attribute(attr.name, attr.type_, attr.value)
+
+            stack.extend((child, index)
+                         for child in reversed(entity.children))
+
+        return table
+
+
+class TableEntity(Entity):
+    """Read only `Entity` view of a `SceneTable` entity.
+
+    `attributes` and `children` are built on each access.
+    """
+
+    __slots__ = ('_table', '_index')
+
+    def __init__(self, table: SceneTable, index: int):
+        """Initialize table entity.
+
+        Args:
+            table (SceneTable): Table holding the entity.
+            index (int): Entity index in `table`.
+        """
+        # `Entity.__init__` is not called as it would set the slots.
+        self._table = table
+        self._index = index
+
+    @property
+    def name(self) -> str:
+        return self._table.names[self._table.entity_names[self._index]]
+
+    @property
+    def attributes(self) -> List[Attribute]:
+        return self._table.attributes(self._index)
+
+    @property
+    def children(self) -> List[Entity]:
+        return [TableEntity(self._table, child)
+                for child in self._table.child_indices(self._index)]
+
+
+def read_table(fd: BinaryIO, flags: FormatFlag = FormatFlag(0),
+               strings: Optional[List[str]] = None) -> SceneTable:
+    """Read an entity and its descendants as a `SceneTable`, without the file
+    header.
+
+    Names are decoded once per distinct name and values are appended to their
+    column without building `Entity` nor `Attribute` objects, but for
+    `FormatFlag.INSTANCED` files whose references are read as the rows of
+    their instance.
+
+    Args:
+        fd: File object to read from.
+        flags: File format features.
+        strings: File string table, see `string_table_read`.
+
+    Returns:
+        Scene table.
+    """
+    if FormatFlag.INSTANCED in flags:
+        return SceneTable.from_entity(read_hierarchy(fd, None, flags,
+                                                     strings))
+
+    sized = FormatFlag.SIZED in flags
+    streamed = FormatFlag.STREAMED in flags
+
+    table = SceneTable()
+    entity_names = table.entity_names
+    entity_parents = table.entity_parents
+    attr_starts = table.attr_starts
+    attr_names = table.attr_names
+    attr_types = table.attr_types
+    attr_rows = table.attr_rows
+    columns = table.columns
+    column_readers: Dict[int, Callable[[BinaryIO], None]] = {}
+
+    # Encoded name, or string table index, -> index in `names`.
+    name_indices: Dict[Union[bytes, int], int] = {}
+
+    def read_string_index() -> int:
+        string_index = suint_read(fd)
+        index = name_indices.get(string_index)
+
+        if index is None:
+            index = name_indices[string_index] = table.name_index(
+                _string_at(strings, string_index))
+
+        return index
+
+    def read_inline_name_index() -> int:
+        size = suint_read(fd)
+        name_bytes = fd.read(size)
+        index = name_indices.get(name_bytes)
+
+        if index is None:
+            if len(name_bytes) != size:
+                raise TruncatedError("unexpected end of file")
+
+            index = name_indices[name_bytes] = table.name_index(
+                name_bytes.decode())
+
+        return index
+
+    read_name_index = read_inline_name_index if strings is None \
+        else read_string_index
+
+    # Entities having children left to read and their remaining child count,
+    # in the current batch if streamed.
+    parents = [-1]
+    child_counts = [1]
+
+    while child_counts:
+        child_count = child_counts[-1]
+
+        if not child_count:
+            if streamed and len(child_counts) > 1:
+                child_count = suint_read(fd)  # next batch
+
+            if not child_count:
+                parents.pop()
+                child_counts.pop()
+                continue
+
+        child_counts[-1] = child_count - 1
+
+        if sized:
+            suint_read(fd)  # entity byte count
+
+        index = len(entity_names)
+        entity_names.append(read_name_index())
+        entity_parents.append(parents[-1])
+
+        attr_count = suint_read(fd)
+        attr_starts.append(attr_starts[-1] + attr_count)
+
+        for _ in range(attr_count):
+            attr_names.append(read_name_index())
+            attr_type = attr_type_read(fd)
+            attr_types.append(attr_type)
+
+            if sized:
+                suint_read(fd)  # value byte count
+
+            column_reader = column_readers.get(attr_type)
+            if column_reader is None:
+                column = columns[attr_type] = _new_column(attr_type)
+                column_reader = column_readers[attr_type] = \
+                    column.reader(get_codec(attr_type))
+
+            attr_rows.append(len(columns[attr_type]))
+            column_reader(fd)
+
+        child_count = suint_read(fd)
+
+        if child_count:
+            parents.append(index)
+            child_counts.append(child_count)
+
+    return table
+
+
+def encode_table(encoder: _Encoder, table: SceneTable) -> Iterator[int]:
+    """Encode `table` entities, in file order.
+
+    Each entity index is yielded before its encoding, letting the caller
+    flush the encoder buffer.
+
+    Args:
+        encoder: Encoder without `FormatFlag.SIZED` nor table of contents.
+        table: Scene table to encode.
+
+    Yields:
+        Index of the entity about to be encoded.
+
+    Raises:
+        ValueError: If `table` is empty or not in file order.
+    """
+    if not len(table):
+        raise ValueError("scene table has no entity")
+
+    buffer = encoder.buffer
+    name_bytes = [encoder.name_bytes(name) for name in table.names]
+    attr_starts = table.attr_starts
+    attr_names = table.attr_names
+    attr_types = table.attr_types
+    attr_rows = table.attr_rows
+    child_counts = table.child_counts()
+    value_encoders = {type_code: column.encoder(get_codec(type_code))
+                      for type_code, column in table.columns.items()}
+
+    branch: List[int] = []  # entities from the root to the last one
+
+    for index, (name_index, parent) in enumerate(
+            zip(table.entity_names, table.entity_parents)):
+        while branch and branch[-1] != parent:
+            branch.pop()
+
+        if not branch and index:
+            raise ValueError("scene table entities not in file order")
+
+        branch.append(index)
+
+        yield index
+
+        buffer += name_bytes[name_index]
+
+        start = attr_starts[index]
+        end = attr_starts[index + 1]
+        buffer += as_suint_bytes(end - start)
+
+        for attr_index in range(start, end):
+            attr_type = attr_types[attr_index]
+            buffer += name_bytes[attr_names[attr_index]]
+            buffer.append(attr_type)
+            buffer += value_encoders[attr_type](attr_rows[attr_index])
+
+        buffer += as_suint_bytes(child_counts[index])
@@ -0,0 +1,56 @@
+"""
+Scene shared by tests.
+"""
+import mug
+
+
+def scene(child_count: int = 3, grandchild_count: int = 2,
+          point_count: int = 10) -> mug.Entity:
+    """Return a "root" entity having `child_count` "child<i>" children, each
+    having `grandchild_count` "grandchild<j>" children.
+
+    The root has a "name" attribute, children have "xform", "points" and
+    "tags" ones, the numeric ones filled with the child index, and
+    grandchildren have an "index" one, valued `i * 10 + j`.
+    """
+    root = mug.Entity("root")
+    root.attributes.append(mug.Attribute("name", mug.AttributeType.STR,
+                                         "root"))
+
+    for i in range(child_count):
+        child = mug.Entity("child{}".format(i))
+        child.attributes.append(mug.Attribute("xform",
+                                              mug.AttributeType.F32X16,
+                                              (float(i),) * 16))
+        child.attributes.append(mug.Attribute("points",
+                                              mug.AttributeType.F32_ARRAY,
+                                              (float(i),) * point_count))
+        child.attributes.append(mug.Attribute("tags",
+                                              mug.AttributeType.STR_ARRAY,
+                                              ["a", "b"]))
+
+        for j in range(grandchild_count):
+            grandchild = mug.Entity("grandchild{}".format(j))
+            grandchild.attributes.append(
+                mug.Attribute("index", mug.AttributeType.U16, i * 10 + j))
+            child.children.append(grandchild)
+
+        root.children.append(child)
+
+    return root
+
+
+def invalid_string_index(data: bytes, attribute: bool = False) -> bytes:
+    """Return `data`, an unsized string table mug file of `scene`, with the
+    string index of the root name, or of its first attribute name if
+    `attribute`, out of the string table.
+    """
+    strings, offset = mug.core.string_table_unpack_from(
+        data, 5, mug.FormatFlag.STRING_TABLE)
+
+    if attribute:
+        offset += 2  # root name index and attribute count
+
+    data = bytearray(data)
+    data[offset] = len(strings)
+    return bytes(data)
@@ -0,0 +1,212 @@
+import asyncio
+import unittest
+
+import mug
+import mug.aio
+
+from scenes import invalid_string_index, scene
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class _Writer:
+    """Stream writer collecting written bytes."""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.drain_count = 0
+
+    def write(self, data: bytes):
+        self.data += data
+
+    async def drain(self):
+        self.drain_count += 1
+
+
+class _CountingReader:
+    """Stream reader over bytes, counting reads."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.read_count = 0
+
+    async def read(self, n: int) -> bytes:
+        self.read_count += 1
+        chunk, self.data = self.data[:n], self.data[n:]
+        return chunk
+
+
+def _reader(data: bytes, chunk_size: int = 7) -> asyncio.StreamReader:
+    reader = asyncio.StreamReader()
+
+    for i in range(0, len(data), chunk_size):
+        reader.feed_data(data[i:i + chunk_size])
+
+    reader.feed_eof()
+    return reader
+
+
+class TestRead(unittest.TestCase):
+
+    def setUp(self):
+        self.scene = scene(child_count=20, point_count=100)
+
+    def _read(self, data: bytes, **options):
+        async def main():
+            return await mug.aio.read(_reader(data), read_size=16,
+                                      **options)
+
+        return asyncio.run(main())
+
+    def test_read(self):
+        for options in ({}, {"sized": True}, {"string_table": True},
+                        {"toc": True}, {"instances": True}):
+            with self.subTest(**options):
+                data = mug.dumps(self.scene, **options)
+                self.assertEqual(mug.dumps(self._read(data)),
+                                 mug.dumps(self.scene))
+
+    def test_streamed(self):
+        data = bytearray()
+
+        class _Pipe:
+            def write(self, b):
+                data.extend(b)
+
+        with mug.StreamWriter(_Pipe()) as writer:
+            writer.begin_entity("root")
+            writer.begin_entity("child")
+            writer.add_attribute("index", mug.AttributeType.U8, 1)
+            writer.end_entity()
+            writer.begin_entity("child")
+            writer.end_entity()
+            writer.end_entity()
+
+        root = self._read(bytes(data))
+        self.assertEqual([c.name for c in root.children], ["child", "child"])
+        self.assertEqual(root.children[0].attributes[0].value, 1)
+
+    def test_instanced(self):
+        root = self.scene
+        root.children.extend(root.children[:10])
+        data = mug.dumps(root, instances=True)
+
+        read_root = self._read(data)
+        self.assertIs(read_root.children[0], read_root.children[20])
+        self.assertEqual(mug.dumps(read_root), mug.dumps(root))
+
+        read_root = self._read(data, copy_instances=True)
+        self.assertIsNot(read_root.children[0], read_root.children[20])
+
+    def test_array_format(self):
+        root = self._read(mug.dumps(self.scene),
+                          array_format=mug.ArrayFormat.MEMORYVIEW)
+        value = root.children[3].attributes[1].value
+
+        self.assertIsInstance(value, memoryview)
+        self.assertEqual(value.tolist(), [3.0] * 100)
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_numpy(self):
+        root = self._read(mug.dumps(self.scene), numpy=True)
+
+        self.assertEqual(root.children[3].attributes[0].value.tolist(),
+                         [3.0] * 16)
+        self.assertEqual(root.children[3].attributes[1].value.tolist(),
+                         [3.0] * 100)
+
+    def test_table(self):
+        table = self._read(mug.dumps(self.scene), table=True)
+
+        self.assertIsInstance(table, mug.SceneTable)
+        self.assertEqual(mug.dumps(table), mug.dumps(self.scene))
+
+    def test_large_value(self):
+        root = mug.Entity("root")
+        root.attributes.append(mug.Attribute(
+            "data", mug.AttributeType.U8_ARRAY, bytes(100000)))
+
+        async def main():
+            return await mug.aio.read(_reader(mug.dumps(root), 4096),
+                                      read_size=16)
+
+        self.assertEqual(len(asyncio.run(main()).attributes[0].value),
+                         100000)
+
+    def test_errors(self):
+        data = mug.dumps(self.scene)
+
+        with self.assertRaisesRegex(ValueError, "unexpected end of file"):
+            self._read(data[:100])
+
+        with self.assertRaisesRegex(ValueError, "not a valid mug"):
+            self._read(b'FOOS' + data[4:])
+
+        data = mug.dumps(self.scene, string_table=True)
+        for attribute in (False, True):
+            with self.assertRaisesRegex(ValueError, "invalid string table"):
+                self._read(invalid_string_index(data, attribute))
+
+    def test_invalid_not_buffered(self):
+        reader = _CountingReader(b'FOOS' + bytes(1 << 20))
+
+        with self.assertRaisesRegex(ValueError, "not a valid mug"):
+            asyncio.run(mug.aio.read(reader, read_size=16))
+
+        self.assertEqual(reader.read_count, 1)
+
+        data = mug.dumps(self.scene)
+        type_offset = data.index(b'\x04name') + 5
+        reader = _CountingReader(data[:type_offset] + b'\xfe' +
+                                 data[type_offset + 1:])
+
+        with self.assertRaisesRegex(ValueError, "unknown attribute type"):
+            asyncio.run(mug.aio.read(reader, read_size=16))
+
+        self.assertGreater(len(reader.data), len(data) // 2)
+
+    def test_interleave(self):
+        data = mug.dumps(self.scene)
+        ticks = []
+
+        async def tick():
+            while True:
+                ticks.append(None)
+                await asyncio.sleep(0)
+
+        async def main():
+            task = asyncio.ensure_future(tick())
+            await asyncio.sleep(0)
+            await mug.aio.read(_reader(data, len(data)), read_size=64)
+            task.cancel()
+
+        asyncio.run(main())
+        self.assertGreater(len(ticks), 20)
+
+
+class TestWrite(unittest.TestCase):
+
+    def setUp(self):
+        self.scene = scene(child_count=20, point_count=100)
+
+    def test_write(self):
+        for options in ({}, {"sized": True}, {"string_table": True},
+                        {"toc_attributes": True}, {"instances": True}):
+            with self.subTest(**options):
+                writer = _Writer()
+                asyncio.run(mug.aio.write(writer, self.scene, chunk_size=64,
+                                          **options))
+
+                self.assertEqual(bytes(writer.data),
+                                 mug.dumps(self.scene, **options))
+                self.assertGreater(writer.drain_count, 20)
+
+    def test_scene_table(self):
+        writer = _Writer()
+        asyncio.run(mug.aio.write(writer,
+                                  mug.SceneTable.from_entity(self.scene)))
+
+        self.assertEqual(bytes(writer.data), mug.dumps(self.scene))
@@ -0,0 +1,169 @@
+import io
+import os
+import tempfile
+import unittest
+import zlib
+
+import mug
+from mug.compression import BlockReader, BlockWriter, open_blocks
+
+from scenes import scene
+
+
+class _CountingCodec(mug.CompressionCodec):
+
+    def __init__(self):
+        self.decompress_count = 0
+
+    def compress(self, data):
+        return zlib.compress(data)
+
+    def decompress(self, data):
+        self.decompress_count += 1
+        return zlib.decompress(data)
+
+
+class _Pipe(io.RawIOBase):
+    """Non seekable file object over bytes."""
+
+    def __init__(self, data: bytes):
+        self._fd = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        return self._fd.readinto(b)
+
+
+class TestCompression(unittest.TestCase):
+
+    def setUp(self):
+        self.scene = scene(child_count=50)
+
+    def test_header(self):
+        data = mug.dumps(mug.Entity("foo"), compression="zlib",
+                         block_size=64)
+
+        self.assertEqual(data[:4], b'MUGZ')
+        self.assertEqual(data[4:10], b'\x04zlib\x40')
+        self.assertEqual(data[-1:], b'\x00')
+
+    def test_write_read(self):
+        expected = mug.dumps(self.scene)
+
+        for compression in ("zlib", "bz2", "lzma"):
+            for block_size in (61, 1 << 20):
+                with self.subTest(compression=compression,
+                                  block_size=block_size):
+                    data = mug.dumps(self.scene, compression=compression,
+                                     block_size=block_size)
+                    self.assertEqual(mug.dumps(mug.loads(data)), expected)
+
+                    fd = io.BytesIO()
+                    mug.write(fd, self.scene, compression=compression,
+                              block_size=block_size)
+                    self.assertEqual(fd.getvalue(), data)
+
+        self.assertLess(len(mug.dumps(self.scene, compression="zlib")),
+                        len(expected) / 4)
+
+    def test_options(self):
+        for options in ({"sized": True}, {"string_table": True},
+                        {"toc": True}):
+            with self.subTest(**options):
+                expected = mug.dumps(self.scene, **options)
+                data = mug.dumps(self.scene, compression="zlib",
+                                 block_size=100, **options)
+
+                with open_blocks(io.BytesIO(data)) as fd:
+                    self.assertEqual(fd.read(), expected)
+
+    def test_not_seekable(self):
+        data = mug.dumps(self.scene, compression="zlib", block_size=100)
+        root = mug.read(io.BufferedReader(_Pipe(data)))
+
+        self.assertEqual(mug.dumps(root), mug.dumps(self.scene))
+
+        events = mug.iter_events(io.BufferedReader(_Pipe(data)))
+        expected = mug.iter_events(io.BytesIO(mug.dumps(self.scene)))
+        self.assertEqual(list(events), list(expected))
+
+    def test_block_reader_seek(self):
+        expected = mug.dumps(self.scene)
+        data = mug.dumps(self.scene, compression="zlib", block_size=100)
+
+        with open_blocks(io.BytesIO(data)) as reader:
+            self.assertEqual(reader.seek(0, io.SEEK_END), len(expected))
+            reader.seek(250)
+            self.assertEqual(reader.read(120), expected[250:370])
+            reader.seek(-10, io.SEEK_CUR)
+            self.assertEqual(reader.read(20), expected[360:380])
+            reader.seek(len(expected) - 5)
+            self.assertEqual(reader.read(100), expected[-5:])
+            self.assertEqual(reader.read(100), b'')
+
+    def test_read_entity(self):
+        codec = _CountingCodec()
+        mug.register_compression("counting", codec)
+
+        fd = io.BytesIO()
+        mug.write(fd, self.scene, toc=True, compression="counting",
+                  block_size=256)
+        block_count = len(mug.dumps(self.scene, toc=True)) // 256 + 1
+
+        fd.seek(0)
+        entity = mug.read_entity(fd, "/root/child25")
+
+        self.assertEqual(entity.attributes[1].value, (25.0,) * 10)
+        self.assertLess(codec.decompress_count, block_count)
+
+    def test_selective_read(self):
+        data = mug.dumps(self.scene, sized=True, compression="zlib",
+                         block_size=128)
+        root = mug.read(io.BytesIO(data), max_depth=1,
+                        attributes={"tags"})
+
+        self.assertEqual(len(root.children), 50)
+        self.assertEqual(root.children[10].attributes[0].value, ["a", "b"])
+        self.assertEqual(root.children[10].children, [])
+
+    def test_mmap(self):
+        fd, path = tempfile.mkstemp(suffix=".mug")
+        os.close(fd)
+
+        try:
+            with open(path, 'wb') as fd:
+                mug.write(fd, self.scene, compression="bz2", block_size=500)
+
+            self.assertEqual(mug.dumps(mug.read_mmap(path)),
+                             mug.dumps(self.scene))
+            root = mug.open(path, lazy=True)
+            self.assertEqual(root.children[49].name, "child49")
+        finally:
+            os.remove(path)
+
+    def test_unknown_compression(self):
+        with self.assertRaises(ValueError):
+            mug.dumps(self.scene, compression="foo")
+
+        data = mug.dumps(self.scene, compression="zlib")
+        data = data[:4] + b'\x04foo_' + data[9:]
+
+        with self.assertRaises(ValueError):
+            mug.loads(data)
+
+    def test_block_writer(self):
+        fd = io.BytesIO()
+
+        with BlockWriter(fd, "zlib", 4, workers=2) as writer:
+            for i in range(10):
+                writer.write(bytes((i,)) * 3)
+
+        fd.seek(4)  # magic number
+        with io.BufferedReader(BlockReader(fd, workers=3)) as reader:
+            self.assertEqual(reader.read(), b''.join(bytes((i,)) * 3
+                                                     for i in range(10)))
+
+        with self.assertRaises(ValueError):
+            BlockWriter(io.BytesIO(), block_size=0)
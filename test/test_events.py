@@ -0,0 +1,114 @@
+import io
+import sys
+import unittest
+
+import mug
+
+from scenes import invalid_string_index, scene
+
+
+def _expected_events(entity, depth=0):
+    yield mug.StartEntity(entity.name, depth)
+
+    for attr in entity.attributes:
+        yield mug.Attr(attr.name, attr.type_, attr.value)
+
+    for child in entity.children:
+        yield from _expected_events(child, depth + 1)
+
+    yield mug.EndEntity(entity.name, depth)
+
+
+class TestIterEvents(unittest.TestCase):
+
+    options = {}
+
+    def _fd(self, entity=None, **options) -> io.BytesIO:
+        if entity is None:
+            entity = scene()
+
+        return io.BytesIO(mug.dumps(entity, **self.options, **options))
+
+    def test_events(self):
+        events = list(mug.iter_events(self._fd()))
+
+        self.assertEqual(events, list(_expected_events(scene())))
+
+    def test_single_entity(self):
+        events = list(mug.iter_events(self._fd(mug.Entity("root"))))
+
+        self.assertEqual(events, [mug.StartEntity("root", 0),
+                                  mug.EndEntity("root", 0)])
+
+    def test_early_stop(self):
+        fd = self._fd()
+        size = len(fd.getvalue())
+
+        for event in mug.iter_events(fd):
+            if isinstance(event, mug.StartEntity) and \
+                    event.name == "child0":
+                break
+
+        self.assertLess(fd.tell(), size // 2)
+
+    def test_array_format(self):
+        for event in mug.iter_events(self._fd(), mug.ArrayFormat.ARRAY):
+            if isinstance(event, mug.Attr) and event.name == "points":
+                self.assertEqual(event.value.typecode, 'f')
+                break
+        else:
+            self.fail("no points attribute")
+
+    def test_trailing_toc(self):
+        events = list(mug.iter_events(self._fd(toc=True)))
+
+        self.assertEqual(events[-1], mug.EndEntity("root", 0))
+
+    def test_deep(self):
+        depth = sys.getrecursionlimit() * 2
+        root = entity = mug.Entity("0")
+
+        for i in range(1, depth):
+            child = mug.Entity(str(i))
+            entity.children.append(child)
+            entity = child
+
+        events = list(mug.iter_events(self._fd(root)))
+
+        self.assertEqual(len(events), depth * 2)
+        self.assertEqual(events[depth - 1],
+                         mug.StartEntity(str(depth - 1), depth - 1))
+        self.assertEqual(events[-1], mug.EndEntity("0", 0))
+
+
+class TestIterEventsSized(TestIterEvents):
+
+    options = {'sized': True}
+
+
+class TestIterEventsStringTable(TestIterEvents):
+
+    options = {'string_table': True}
+
+    def test_invalid_index(self):
+        for attribute in (False, True):
+            with self.subTest(attribute=attribute):
+                data = invalid_string_index(self._fd().getvalue(),
+                                            attribute)
+
+                with self.assertRaisesRegex(ValueError,
+                                            "invalid string table"):
+                    list(mug.iter_events(io.BytesIO(data)))
+
+
+class TestIterEventsInstanced(TestIterEvents):
+
+    options = {'instances': True}
+
+    def test_shared(self):
+        root = scene()
+        root.children.append(root.children[0])
+        root.children[1].children.append(root.children[0])
+        events = list(mug.iter_events(self._fd(root)))
+
+        self.assertEqual(events, list(_expected_events(root)))
@@ -0,0 +1,264 @@
+from array import array
+import copy
+import io
+import pickle
+import unittest
+from unittest import mock
+
+import mug
+from mug.core import _Encoder
+
+from scenes import scene
+
+
+def _scene() -> mug.Entity:
+    root = scene()
+
+    # Lists change in place, so entities having list values aren't tracked.
+    for child in root.children:
+        tags = child.attributes.get("tags")
+        tags.value = tuple(tags.value)
+
+    return root
+
+
+class TestWriteCache(unittest.TestCase):
+
+    options = {}
+
+    def setUp(self):
+        self.root = _scene()
+        self.cache = mug.WriteCache()
+        self._write()
+
+    def _write(self) -> bytes:
+        fd = io.BytesIO()
+        mug.write(fd, self.root, cache=self.cache, **self.options)
+        return fd.getvalue()
+
+    def _assert_write(self, encoded_count: int):
+        """Assert written bytes are the `write` ones, `encoded_count`
+        entities being encoded."""
+        with mock.patch.object(_Encoder, 'entity_head', autospec=True,
+                               side_effect=_Encoder.entity_head) as head:
+            data = self._write()
+
+        self._assert_data(data)
+        self.assertEqual(head.call_count, encoded_count)
+
+    def _assert_data(self, data: bytes):
+        self.assertEqual(data, mug.dumps(self.root, **self.options))
+
+    def test_unchanged(self):
+        self._assert_write(0)
+        self._assert_write(0)
+
+    def test_value(self):
+        self.root.children[1].children[0].attributes[0].value = 42
+        self._assert_write(1)
+
+        self.root.children[1].attributes[0].value = (1.0,) * 16
+        self._assert_write(1)
+
+    def test_attributes(self):
+        attributes = self.root.children[2].children[1].attributes
+        attributes.append(mug.Attribute("new", mug.AttributeType.STR, "new"))
+        self._assert_write(1)
+
+        attributes[0].name = "renamed"
+        self._assert_write(1)
+
+        attributes[0].type_ = mug.AttributeType.U32
+        self._assert_write(1)
+
+        del attributes[:]
+        self._assert_write(1)
+
+    def test_children(self):
+        self.root.children[0].children.append(mug.Entity("new"))
+        self._assert_write(2)
+
+        self.root.children[1].children.reverse()
+        self._assert_write(1)
+
+        # Moved with its unchanged subtree.
+        self.root.children.append(self.root.children.pop(0))
+        self._assert_write(1)
+
+        leaf = self.root.children[0].children.pop()
+        self.root.children[1].children.insert(0, leaf)
+        self._assert_write(2)
+
+    def test_rename(self):
+        self.root.children[0].children[0].name = "renamed"
+        self._assert_write(1)
+
+        self.root.name = "renamed"
+        self._assert_write(1)
+
+    def test_shared(self):
+        shared = self.root.children[0]
+        self.root.children.append(shared)
+        self._assert_write(1)
+
+        shared.children[0].attributes[0].value = 42
+        self._assert_write(2)  # encoded at each occurrence
+
+        self.root.children[1].attributes[0].value = (2.0,) * 16
+        self._assert_write(1)
+
+    def test_mutable_value(self):
+        attr = self.root.children[1].children[0].attributes[0]
+        attr.type_ = mug.AttributeType.U16_ARRAY
+        attr.value = array('H', [1, 2, 3])
+        self._assert_write(1)
+        self._assert_write(1)  # not tracked
+
+        attr.value[0] = 42
+        self._assert_write(1)
+
+    def test_removed(self):
+        child = self.root.children.pop(1)
+        self._assert_write(1)
+
+        # Changes of removed entities aren't written.
+        child.children[0].attributes[0].value = 42
+        self._assert_write(0)
+
+        self.root.children.insert(0, child)
+        self._assert_write(4)
+
+    def test_root(self):
+        root = mug.Entity("new_root")
+        root.children.append(self.root.children[2])
+        self.root = root
+        self._assert_write(1)
+
+    def test_list_value(self):
+        attr = self.root.children[1].attributes.get("tags")
+        attr.value = ["a", "b"]
+        self._assert_write(1)
+        self._assert_write(1)  # not tracked
+
+        attr.value.append("c")
+        self._assert_write(1)
+
+    def test_plain_lists(self):
+        child = self.root.children[1]
+        child.children = list(child.children)
+        self._assert_write(1)
+        self._assert_write(1)  # not tracked
+
+        child.children[0] = mug.Entity("replaced")
+        self._assert_write(2)
+
+    def test_types(self):
+        child = self.root.children[0]
+
+        self.assertIs(type(child), mug.Entity)
+        self.assertIs(type(child.children), mug.NamedList)
+        self.assertIs(type(child.attributes[0]), mug.Attribute)
+
+    def test_copy(self):
+        for copied in (copy.deepcopy(self.root),
+                       pickle.loads(pickle.dumps(self.root))):
+            with self.subTest(copied=copied):
+                self.assertIs(type(copied), mug.Entity)
+                self.assertIs(type(copied.children), mug.NamedList)
+                self.assertIs(type(copied.attributes[0]), mug.Attribute)
+                self.assertEqual(mug.dumps(copied), mug.dumps(self.root))
+
+    def test_options(self):
+        self.root.children[0].attributes[0].value = (3.0,) * 16
+
+        for options in ({}, {'sized': True}, {'toc_attributes': True},
+                        {'string_table': True}):
+            with self.subTest(**options):
+                fd = io.BytesIO()
+                mug.write(fd, self.root, cache=self.cache, **options)
+
+                self.assertEqual(fd.getvalue(), mug.dumps(self.root,
+                                                          **options))
+
+    def test_compressed(self):
+        self.root.children[0].name = "renamed"
+        fd = io.BytesIO()
+        mug.write(fd, self.root, compression='zlib', cache=self.cache,
+                  **self.options)
+
+        self.assertEqual(mug.dumps(mug.loads(fd.getvalue()), **self.options),
+                         mug.dumps(self.root, **self.options))
+
+    def test_clear(self):
+        self.cache.clear()
+        self._assert_write(10)
+
+    def test_content_hash(self):
+        children = self.root.children
+        digest = self.cache.content_hash(children[0])
+
+        self.assertEqual(len(digest), 16)
+        self.assertIsNot(self.cache.content_hash(self.root), None)
+        self.assertNotEqual(self.cache.content_hash(children[1]), digest)
+        self.assertIs(self.cache.content_hash(mug.Entity("root")), None)
+
+        children[0].children[1].attributes[0].value = 42
+        self.assertIs(self.cache.content_hash(children[0]), None)
+        self.assertIs(self.cache.content_hash(self.root), None)
+        self.assertIsNot(self.cache.content_hash(children[1]), None)
+
+        self._write()
+        self.assertNotEqual(self.cache.content_hash(children[0]), digest)
+
+        children[0].children[1].attributes[0].value = 1  # as initially
+        self._write()
+        self.assertEqual(self.cache.content_hash(children[0]), digest)
+
+    def test_invalid_options(self):
+        for options in ({'workers': 1}, {'stats': mug.Stats()}):
+            with self.subTest(options=options):
+                with self.assertRaises(ValueError):
+                    mug.write(io.BytesIO(), self.root, cache=self.cache,
+                              **options)
+
+
+class TestWriteCacheSized(TestWriteCache):
+
+    options = {'sized': True}
+
+
+class TestWriteCacheToc(TestWriteCache):
+
+    options = {'toc_attributes': True}
+
+    def test_read_entity(self):
+        self.root.children[2].children[0].attributes[0].value = 42
+        self.root.children.append(self.root.children.pop(0))
+        data = self._write()
+
+        grandchild = mug.read_entity(io.BytesIO(data),
+                                     "/root/child2/grandchild0")
+        self.assertEqual(grandchild.attributes[0].value, 42)
+
+        toc = mug.read_toc(io.BytesIO(data))
+        self.assertEqual(toc, mug.read_toc(io.BytesIO(mug.dumps(
+            self.root, toc_attributes=True))))
+
+
+class TestWriteCacheStringTable(TestWriteCache):
+
+    options = {'string_table': True}
+
+    def _assert_data(self, data: bytes):
+        # New names are appended to the table of the first write.
+        self.assertEqual(mug.dumps(mug.loads(data)), mug.dumps(self.root))
+
+    def test_new_names(self):
+        leaf = self.root.children[0].children[0]
+        leaf.attributes.append(mug.Attribute("new_name", mug.AttributeType.U8,
+                                             1))
+        leaf.children.append(mug.Entity("new_entity"))
+        self._assert_write(2)
+
+        self.root.children[1].name = "new_child"
+        self._assert_write(1)
@@ -0,0 +1,269 @@
+import io
+import os
+import tempfile
+import unittest
+
+import mug
+
+from scenes import invalid_string_index, scene
+
+
+def _scene() -> mug.Entity:
+    """Return the shared scene with a second "child1" child, having a
+    "chair" child the first one hasn't."""
+    root = scene()
+    duplicate = scene().children[1]
+    duplicate.children.append(mug.Entity("chair"))
+    root.children.append(duplicate)
+
+    return root
+
+
+class TestReadEntity(unittest.TestCase):
+
+    options = {}
+
+    def _fd(self, **options) -> io.BytesIO:
+        return io.BytesIO(mug.dumps(_scene(), **self.options, **options))
+
+    def test_toc(self):
+        toc = mug.read_toc(self._fd(toc=True))
+
+        self.assertEqual(len(toc), 1 + 3 + 6 + 1)
+        self.assertIn("/root/child1/grandchild1", toc)
+        self.assertIsNone(toc["/root"].attributes)
+
+    def test_toc_attributes(self):
+        fd = self._fd(toc_attributes=True)
+        toc = mug.read_toc(fd)
+
+        attributes = toc["/root/child2"].attributes
+        self.assertEqual(sorted(attributes), ["points", "tags", "xform"])
+
+        fd.seek(0)
+        strings = mug.core.string_table_read(fd, mug.core.header_read(fd))
+
+        fd.seek(attributes["tags"])
+        if strings is None:
+            self.assertEqual(mug.core.str_read(fd), "tags")
+        else:
+            self.assertEqual(strings[mug.core.suint_read(fd)], "tags")
+
+    def test_no_toc(self):
+        self.assertIsNone(mug.read_toc(self._fd()))
+
+    def test_read_entity(self):
+        for toc in (False, True):
+            with self.subTest(toc=toc):
+                child = mug.read_entity(self._fd(toc=toc), "/root/child2")
+                self.assertEqual(child.name, "child2")
+                self.assertEqual(child.attributes[0].value, (2.0,) * 16)
+                self.assertEqual(child.children[0].name, "grandchild0")
+
+                root = mug.read_entity(self._fd(toc=toc), "/root")
+                self.assertEqual(len(root.children), 4)
+
+    def test_second_match(self):
+        for toc in (False, True):
+            with self.subTest(toc=toc):
+                chair = mug.read_entity(self._fd(toc=toc),
+                                        "/root/child1/chair")
+                self.assertEqual(chair.name, "chair")
+
+    def test_first_match(self):
+        for toc in (False, True):
+            with self.subTest(toc=toc):
+                child = mug.read_entity(self._fd(toc=toc), "/root/child1")
+                self.assertEqual(len(child.children), 2)
+
+    def test_missing(self):
+        for toc in (False, True):
+            with self.subTest(toc=toc):
+                with self.assertRaises(KeyError):
+                    mug.read_entity(self._fd(toc=toc), "/root/nope")
+
+                with self.assertRaises(KeyError):
+                    mug.read_entity(self._fd(toc=toc), "/nope")
+
+    def test_relative_path(self):
+        with self.assertRaises(ValueError):
+            mug.read_entity(self._fd(), "root")
+
+    def test_not_at_file_start(self):
+        fd = io.BytesIO(b'garbage' + mug.dumps(_scene(), toc=True,
+                                               **self.options))
+        fd.seek(7)
+
+        grandchild = mug.read_entity(fd, "/root/child1/grandchild1")
+
+        self.assertEqual(grandchild.name, "grandchild1")
+
+    def test_read_ignores_toc(self):
+        root = mug.read(self._fd(toc_attributes=True))
+
+        self.assertEqual(len(root.children), 4)
+
+    def test_read_mmap_ignores_toc(self):
+        data = mug.dumps(_scene(), toc=True, **self.options)
+
+        self.assertEqual(mug.dumps(mug.loads(data)),
+                         mug.dumps(_scene()))
+
+
+class TestReadEntitySized(TestReadEntity):
+
+    options = {'sized': True}
+
+
+class TestReadEntityStringTable(TestReadEntity):
+
+    options = {'string_table': True}
+
+    def test_invalid_index(self):
+        data = invalid_string_index(mug.dumps(_scene(), **self.options))
+
+        with self.assertRaisesRegex(ValueError, "invalid string table"):
+            mug.read_entity(io.BytesIO(data), "/root/child1")
+
+
+class TestReadEntityInstanced(TestReadEntity):
+
+    options = {'instances': True}
+
+    def test_reference(self):
+        root = _scene()
+        copies = mug.Entity("copies")
+        copies.children.extend(root.children[:2])
+        root.children.append(copies)
+
+        for options in ({}, {'sized': True}, {'toc': True}):
+            with self.subTest(**options):
+                fd = io.BytesIO(mug.dumps(root, **self.options, **options))
+                entity = mug.read_entity(fd, "/root/copies/child1")
+
+                self.assertEqual(entity.attributes[0].value, (1.0,) * 16)
+                self.assertEqual(entity.children[0].name, "grandchild0")
+
+
+class TestPatch(unittest.TestCase):
+
+    options = {}
+    in_place = True
+
+    def setUp(self):
+        fd, self.temp_file_name = tempfile.mkstemp(prefix="mug_")
+        self.addCleanup(os.remove, self.temp_file_name)
+
+        with os.fdopen(fd, 'wb') as fd:
+            mug.write(fd, _scene(), **self.options)
+
+    def _read(self, path: str) -> mug.Entity:
+        with open(self.temp_file_name, 'rb') as fd:
+            return mug.read_entity(fd, path)
+
+    def test_in_place(self):
+        xform = tuple(float(i) for i in range(16))
+        size = os.path.getsize(self.temp_file_name)
+
+        patched = mug.patch(self.temp_file_name, "/root/child1", "xform",
+                            xform)
+
+        self.assertEqual(patched, self.in_place)
+        self.assertEqual(self._read("/root/child1").attributes[0].value,
+                         xform)
+        self.assertEqual(self._read("/root/child2").attributes[0].value,
+                         (2.0,) * 16)
+
+        if patched:
+            self.assertEqual(os.path.getsize(self.temp_file_name), size)
+
+    def test_rewrite(self):
+        self.assertFalse(mug.patch(self.temp_file_name, "/root/child0",
+                                   "tags", ["a", "b", "c"]))
+
+        expected = _scene()
+        expected.children[0].attributes[2].value = ["a", "b", "c"]
+        with open(self.temp_file_name, 'rb') as fd:
+            self.assertEqual(fd.read(), mug.dumps(expected, **self.options))
+
+    def test_same_size(self):
+        self.assertEqual(mug.patch(self.temp_file_name, "/root/child0",
+                                   "tags", ["c", "d"]),
+                         self.in_place)
+
+        self.assertEqual(self._read("/root/child0").attributes[2].value,
+                         ["c", "d"])
+
+    def test_first_match(self):
+        mug.patch(self.temp_file_name, "/root/child1/grandchild0", "index",
+                  42)
+
+        # First "child1" entity having a "grandchild0" child.
+        self.assertEqual(self._read("/root/child1").children[0]
+                         .attributes[0].value, 42)
+
+    def test_missing(self):
+        with open(self.temp_file_name, 'rb') as fd:
+            data = fd.read()
+
+        for path, attr_name in (("/root/nope", "xform"),
+                                ("/nope", "xform"),
+                                ("/root/child1/chair", "xform"),
+                                ("/root/child0", "nope")):
+            with self.subTest(path=path, attr_name=attr_name):
+                with self.assertRaises(KeyError):
+                    mug.patch(self.temp_file_name, path, attr_name,
+                              (0.0,) * 16)
+
+        with open(self.temp_file_name, 'rb') as fd:
+            self.assertEqual(fd.read(), data)
+
+
+class TestPatchSized(TestPatch):
+
+    options = {'sized': True}
+
+
+class TestPatchStringTable(TestPatch):
+
+    options = {'string_table': True}
+
+    def test_invalid_index(self):
+        with open(self.temp_file_name, 'rb') as fd:
+            data = invalid_string_index(fd.read(), attribute=True)
+
+        with open(self.temp_file_name, 'wb') as fd:
+            fd.write(data)
+
+        with self.assertRaisesRegex(ValueError, "invalid string table"):
+            mug.patch(self.temp_file_name, "/root", "name", "toor")
+
+
+class TestPatchTocAttributes(TestPatch):
+
+    options = {'sized': True, 'toc_attributes': True}
+
+
+class TestPatchCompressed(TestPatch):
+
+    options = {'toc': True, 'compression': 'zlib', 'block_size': 100}
+    in_place = False
+
+
+class TestPatchInstanced(TestPatch):
+
+    options = {'instances': True}
+    in_place = False
+
+    def test_instance(self):
+        mug.patch(self.temp_file_name, "/root/child1/grandchild1", "index",
+                  42)
+
+        with open(self.temp_file_name, 'rb') as fd:
+            root = mug.read(fd)
+
+        # The second "child1" entity referenced the first one children.
+        self.assertEqual(root.children[1].children[1].attributes[0].value,
+                         42)
+        self.assertEqual(root.children[3].children[1].attributes[0].value,
+                         11)
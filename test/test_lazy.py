@@ -0,0 +1,145 @@
+import os
+import tempfile
+import unittest
+
+import mug
+
+from scenes import invalid_string_index, scene
+
+
+class TestLazy(unittest.TestCase):
+
+    options = {}
+
+    def setUp(self):
+        _, self.temp_file_name = tempfile.mkstemp(prefix="mug_")
+
+        root = scene(child_count=5, grandchild_count=3, point_count=100)
+
+        with open(self.temp_file_name, 'wb') as fd:
+            mug.write(fd, root, **self.options)
+
+    def tearDown(self):
+        os.remove(self.temp_file_name)
+
+    def test_not_lazy(self):
+        root = mug.open(self.temp_file_name)
+
+        self.assertNotIsInstance(root, mug.LazyEntity)
+        self.assertEqual(len(root.children), 5)
+
+    def test_lazy(self):
+        root = mug.open(self.temp_file_name, lazy=True)
+
+        self.assertIsInstance(root, mug.Entity)
+        self.assertEqual(root.name, "root")
+        self.assertEqual([c.name for c in root.children],
+                         ["child{}".format(i) for i in range(5)])
+
+        grandchild = root.children[3].children[2]
+        self.assertEqual(grandchild.name, "grandchild2")
+        self.assertEqual(grandchild.attributes[0].value, 32)
+
+        self.assertEqual(root.children[3].attributes[1].value, (3.0,) * 100)
+        self.assertEqual(root.attributes[0].value, "root")
+
+    def test_children_before_attributes(self):
+        root = mug.open(self.temp_file_name, lazy=True)
+
+        child = root.children[4]
+        self.assertEqual(child.children[0].attributes[0].value, 40)
+        self.assertEqual(child.attributes[2].value, ["a", "b"])
+
+    def test_untouched_not_parsed(self):
+        root = mug.open(self.temp_file_name, lazy=True)
+
+        child = root.children[1]
+
+        self.assertIsNone(child._attributes)
+        self.assertIsNone(child._children)
+
+    def test_mutation(self):
+        root = mug.open(self.temp_file_name, lazy=True)
+
+        root.children.append(mug.Entity("new"))
+        root.children[0].attributes = []
+
+        data = mug.dumps(root)
+        root = mug.loads(data)
+
+        self.assertEqual(len(root.children), 6)
+        self.assertEqual(root.children[0].attributes, [])
+        self.assertEqual(root.children[1].children[1].attributes[0].value, 11)
+
+    def test_array_format(self):
+        root = mug.open(self.temp_file_name, lazy=True,
+                        array_format=mug.ArrayFormat.MEMORYVIEW)
+
+        points = root.children[2].attributes[1].value
+
+        self.assertIsInstance(points, memoryview)
+        self.assertEqual(points.tolist(), [2.0] * 100)
+
+    def test_truncated(self):
+        with open(self.temp_file_name, 'rb') as fd:
+            data = fd.read()
+
+        with open(self.temp_file_name, 'wb') as fd:
+            fd.write(data[:len(data) // 2])
+
+        root = mug.open(self.temp_file_name, lazy=True)
+
+        with self.assertRaises(ValueError):
+            root.children[4].children
+
+
+class TestLazySized(TestLazy):
+
+    options = {'sized': True}
+
+
+class TestLazyStringTable(TestLazy):
+
+    options = {'string_table': True}
+
+    def test_invalid_index(self):
+        with open(self.temp_file_name, 'rb') as fd:
+            data = invalid_string_index(fd.read())
+
+        with open(self.temp_file_name, 'wb') as fd:
+            fd.write(data)
+
+        with self.assertRaisesRegex(ValueError, "invalid string table"):
+            mug.open(self.temp_file_name, lazy=True)
+
+
+class TestLazySizedStringTable(TestLazy):
+
+    options = {'sized': True, 'string_table': True}
+
+
+class TestLazyInstanced(TestLazy):
+
+    options = {'instances': True}
+
+    def test_shared(self):
+        root = scene(child_count=5, grandchild_count=3, point_count=100)
+        root.children.append(root.children[1])
+
+        with open(self.temp_file_name, 'wb') as fd:
+            mug.write(fd, root, **self.options)
+
+        root = mug.open(self.temp_file_name, lazy=True)
+        self.assertIs(root.children[1], root.children[5])
+        self.assertEqual(root.children[5].children[2].attributes[0].value,
+                         12)
+
+        root = mug.open(self.temp_file_name, lazy=True, copy_instances=True)
+        self.assertIsNot(root.children[1], root.children[5])
+        self.assertEqual(root.children[5].children[2].attributes[0].value,
+                         12)
+
+
+class TestLazySizedInstanced(TestLazyInstanced):
+
+    options = {'sized': True, 'instances': True}
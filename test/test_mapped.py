@@ -0,0 +1,218 @@
+import array
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import mug
+
+from scenes import invalid_string_index, scene
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class _BoolCodec(mug.AttributeCodec):
+
+    size = 1
+
+    def as_bytes(self, value) -> bytes:
+        return b'\x01' if value else b'\x00'
+
+    def read(self, fd):
+        return fd.read(1) != b'\x00'
+
+
+mug.register_codec(249, _BoolCodec())
+
+
+class TestReadMmap(unittest.TestCase):
+
+    options = {}
+
+    def setUp(self):
+        _, self.temp_file_name = tempfile.mkstemp(prefix="mug_")
+
+        root = scene(child_count=10, point_count=300)
+        root.attributes.append(mug.Attribute("label", mug.AttributeType.STR,
+                                             "héllo" + "b" * 300))
+        root.attributes.append(mug.Attribute("half",
+                                             mug.AttributeType.F16_ARRAY,
+                                             (0.5, 2.5)))
+        root.attributes.append(mug.Attribute("count", mug.AttributeType.U64,
+                                             10))
+
+        with open(self.temp_file_name, 'wb') as fd:
+            mug.write(fd, root, **self.options)
+
+    def tearDown(self):
+        os.remove(self.temp_file_name)
+
+    def assertEntityEqual(self, e1: mug.Entity, e2: mug.Entity):
+        self.assertEqual(e1.name, e2.name)
+        self.assertEqual([(a.name, a.type_, a.value) for a in e1.attributes],
+                         [(a.name, a.type_, a.value) for a in e2.attributes])
+        self.assertEqual(len(e1.children), len(e2.children))
+
+        for c1, c2 in zip(e1.children, e2.children):
+            self.assertEntityEqual(c1, c2)
+
+    def test_same_as_read(self):
+        with open(self.temp_file_name, 'rb') as fd:
+            e1 = mug.read(fd)
+
+        self.assertEntityEqual(mug.read_mmap(self.temp_file_name), e1)
+
+    def test_array(self):
+        root = mug.read_mmap(self.temp_file_name, mug.ArrayFormat.ARRAY)
+
+        points = root.children[3].attributes[1].value
+        self.assertIsInstance(points, array.array)
+        self.assertEqual(points.tolist(), [3.0] * 300)
+
+        half = root.attributes[2].value
+        self.assertEqual(half.tolist(), [0.5, 2.5])
+
+    def test_memoryview(self):
+        root = mug.read_mmap(self.temp_file_name, mug.ArrayFormat.MEMORYVIEW)
+
+        points = root.children[3].attributes[1].value
+        self.assertIsInstance(points, memoryview)
+        self.assertEqual(points.tolist(), [3.0] * 300)
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_numpy(self):
+        root = mug.read_mmap(self.temp_file_name, numpy=True)
+
+        xform = root.children[3].attributes[0].value
+        self.assertEqual(xform.tolist(), [3.0] * 16)
+
+        points = root.children[3].attributes[1].value
+        self.assertEqual(points.dtype, numpy.dtype('<f4'))
+        self.assertEqual(points.tolist(), [3.0] * 300)
+
+    def test_registered_codec(self):
+        e1 = mug.Entity("foo")
+        e1.attributes.append(mug.Attribute("on", 249, True))
+        e1.attributes.append(mug.Attribute("toto", mug.AttributeType.U8, 42))
+
+        with open(self.temp_file_name, 'wb') as fd:
+            mug.write(fd, e1, **self.options)
+
+        e2 = mug.read_mmap(self.temp_file_name)
+
+        self.assertIs(e2.attributes[0].value, True)
+        self.assertEqual(e2.attributes[1].value, 42)
+
+    def test_truncated(self):
+        with open(self.temp_file_name, 'rb') as fd:
+            data = fd.read()
+
+        for size in (len(data) - 1, len(data) // 2, 7):
+            with open(self.temp_file_name, 'wb') as fd:
+                fd.write(data[:size])
+
+            with self.assertRaises(ValueError):
+                mug.read_mmap(self.temp_file_name)
+
+    def test_truncated_unmapped(self):
+        with open(self.temp_file_name, 'rb') as fd:
+            data = fd.read()
+
+        with open(self.temp_file_name, 'wb') as fd:
+            fd.write(data[:len(data) - 1])
+
+        map_file = mug.mapped.map_file
+        mappings = []
+
+        def recording_map_file(path):
+            result = map_file(path)
+            mappings.append(result[0])
+            return result
+
+        with mock.patch.object(mug.mapped, 'map_file', recording_map_file):
+            with self.assertRaises(ValueError):
+                mug.read_mmap(self.temp_file_name)
+
+        self.assertTrue(mappings[0].closed)
+
+        # Not closed under values already read, without hiding the error.
+        with self.assertRaises(ValueError):
+            mug.read_mmap(self.temp_file_name,
+                          array_format=mug.ArrayFormat.MEMORYVIEW)
+
+    def test_empty(self):
+        with open(self.temp_file_name, 'wb'):
+            pass
+
+        with self.assertRaises(ValueError):
+            mug.read_mmap(self.temp_file_name)
+
+    def test_deep_chain(self):
+        root = entity = mug.Entity("0")
+        for i in range(1, 10000):
+            child = mug.Entity(str(i))
+            entity.children.append(child)
+            entity = child
+
+        with open(self.temp_file_name, 'wb') as fd:
+            mug.write(fd, root, **self.options)
+
+        entity = mug.read_mmap(self.temp_file_name)
+        depth = 0
+        while entity.children:
+            entity = entity.children[0]
+            depth += 1
+
+        self.assertEqual(depth, 9999)
+
+
+class TestReadMmapSized(TestReadMmap):
+
+    options = {'sized': True}
+
+
+class TestReadMmapStringTable(TestReadMmap):
+
+    options = {'string_table': True}
+
+    def test_invalid_index(self):
+        for attribute in (False, True):
+            with open(self.temp_file_name, 'wb') as fd:
+                fd.write(invalid_string_index(
+                    mug.dumps(scene(), **self.options), attribute))
+
+            with self.subTest(attribute=attribute):
+                with self.assertRaisesRegex(ValueError,
+                                            "invalid string table"):
+                    mug.read_mmap(self.temp_file_name)
+
+
+class TestReadMmapSizedStringTable(TestReadMmap):
+
+    options = {'sized': True, 'string_table': True}
+
+
+class TestReadMmapInstanced(TestReadMmap):
+
+    options = {'instances': True}
+
+    def test_shared(self):
+        root = scene()
+        root.children.append(root.children[1])
+
+        with open(self.temp_file_name, 'wb') as fd:
+            mug.write(fd, root, **self.options)
+
+        root = mug.read_mmap(self.temp_file_name)
+        self.assertIs(root.children[1], root.children[3])
+
+        root = mug.read_mmap(self.temp_file_name, copy_instances=True)
+        self.assertIsNot(root.children[1], root.children[3])
+
+
+class TestReadMmapSizedInstanced(TestReadMmapInstanced):
+
+    options = {'sized': True, 'instances': True}
@@ -1,10 +1,20 @@
+import array
+import io
 import os
+import sys
 import tempfile
 import unittest
 from typing import Any
 
 import mug
 
+from scenes import invalid_string_index, scene
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class TestWriteRead(unittest.TestCase):
 
@@ -449,3 +459,948 @@ class TestWriteReadAttr(unittest.TestCase):
                                 (42.42, 43.43, 44.44, 45.45, 46.46,
                                  47.47, 48.48, 49.49, 50.50, 51.51,
                                  52.52, 53.53, 54.54, 55.55, 56.56))
+
+
+class _BoolCodec(mug.AttributeCodec):
+
+    size = 1
+
+    def as_bytes(self, value: Any) -> bytes:
+        return b'\x01' if value else b'\x00'
+
+    def read(self, fd) -> Any:
+        return fd.read(1) != b'\x00'
+
+
+mug.register_codec(250, _BoolCodec())
+
+
+class TestCodec(unittest.TestCase):
+
+    def setUp(self):
+        _, self.temp_file_name = tempfile.mkstemp(prefix="mug_")
+
+    def tearDown(self):
+        os.remove(self.temp_file_name)
+
+    def _write_read(self, entity: mug.Entity) -> mug.Entity:
+
+        with open(self.temp_file_name, 'wb') as fd:
+            mug.write(fd, entity)
+
+        with open(self.temp_file_name, 'rb') as fd:
+            return mug.read(fd)
+
+    def test_registered_codec(self):
+        e1 = mug.Entity("foo")
+        e1.attributes.append(mug.Attribute("on", 250, True))
+        e1.attributes.append(mug.Attribute("off", 250, False))
+
+        e2 = self._write_read(e1)
+
+        self.assertEqual(e2.attributes[0].type_, 250)
+        self.assertIs(e2.attributes[0].value, True)
+        self.assertIs(e2.attributes[1].value, False)
+
+    def test_register_builtin_code(self):
+        with self.assertRaises(ValueError):
+            mug.register_codec(mug.AttributeType.U8, _BoolCodec())
+
+    def test_register_out_of_range_code(self):
+        with self.assertRaises(ValueError):
+            mug.register_codec(256, _BoolCodec())
+
+    def test_unknown_type(self):
+        e1 = mug.Entity("foo")
+        e1.attributes.append(mug.Attribute("toto", 251, 0))
+
+        with self.assertRaises(ValueError):
+            self._write_read(e1)
+
+    def test_u64_max(self):
+        e1 = mug.Entity("foo")
+        e1.attributes.append(mug.Attribute("toto", mug.AttributeType.U64,
+                                           2 ** 64 - 1))
+
+        e2 = self._write_read(e1)
+
+        self.assertEqual(e2.attributes[0].value, 2 ** 64 - 1)
+
+    def test_fixed_sizes(self):
+        self.assertEqual(mug.get_codec(mug.AttributeType.U8).size, 1)
+        self.assertEqual(mug.get_codec(mug.AttributeType.F16X3).size, 6)
+        self.assertEqual(mug.get_codec(mug.AttributeType.F64X16).size, 128)
+        self.assertIsNone(mug.get_codec(mug.AttributeType.STR).size)
+        self.assertIsNone(mug.get_codec(mug.AttributeType.F32_ARRAY).size)
+
+
+class TestArrayFormat(unittest.TestCase):
+
+    _ARRAY_TYPES = (mug.AttributeType.U8_ARRAY, mug.AttributeType.U16_ARRAY,
+                    mug.AttributeType.U32_ARRAY, mug.AttributeType.U64_ARRAY,
+                    mug.AttributeType.I8_ARRAY, mug.AttributeType.I16_ARRAY,
+                    mug.AttributeType.I32_ARRAY, mug.AttributeType.I64_ARRAY,
+                    mug.AttributeType.F32_ARRAY, mug.AttributeType.F64_ARRAY)
+
+    def setUp(self):
+        _, self.temp_file_name = tempfile.mkstemp(prefix="mug_")
+
+    def tearDown(self):
+        os.remove(self.temp_file_name)
+
+    def _write_read(self, entity: mug.Entity,
+                    array_format: mug.ArrayFormat) -> mug.Entity:
+
+        with open(self.temp_file_name, 'wb') as fd:
+            mug.write(fd, entity)
+
+        with open(self.temp_file_name, 'rb') as fd:
+            return mug.read(fd, array_format)
+
+    def _array_entity(self) -> mug.Entity:
+        e1 = mug.Entity("foo")
+
+        for type_ in self._ARRAY_TYPES:
+            e1.attributes.append(mug.Attribute(type_.name, type_,
+                                               (42, 43, 44, 45)))
+
+        return e1
+
+    def test_array(self):
+        e2 = self._write_read(self._array_entity(), mug.ArrayFormat.ARRAY)
+
+        for attr in e2.attributes:
+            self.assertIsInstance(attr.value, array.array)
+            self.assertEqual(attr.value.tolist(), [42, 43, 44, 45])
+
+    def test_memoryview(self):
+        e2 = self._write_read(self._array_entity(),
+                              mug.ArrayFormat.MEMORYVIEW)
+
+        for attr in e2.attributes:
+            self.assertIsInstance(attr.value, memoryview)
+            self.assertEqual(attr.value.tolist(), [42, 43, 44, 45])
+
+    def test_empty_array(self):
+        e1 = mug.Entity("foo")
+        e1.attributes.append(mug.Attribute("toto",
+                                           mug.AttributeType.F32_ARRAY, ()))
+
+        e2 = self._write_read(e1, mug.ArrayFormat.ARRAY)
+
+        self.assertEqual(len(e2.attributes[0].value), 0)
+
+    def test_f16_array_widened(self):
+        e1 = mug.Entity("foo")
+        e1.attributes.append(mug.Attribute("toto",
+                                           mug.AttributeType.F16_ARRAY,
+                                           (0.5, 1.5)))
+
+        e2 = self._write_read(e1, mug.ArrayFormat.ARRAY)
+
+        self.assertEqual(e2.attributes[0].value.typecode, 'f')
+        self.assertEqual(e2.attributes[0].value.tolist(), [0.5, 1.5])
+
+    def test_vector_stays_tuple(self):
+        e1 = mug.Entity("foo")
+        e1.attributes.append(mug.Attribute("toto", mug.AttributeType.F32X3,
+                                           (0.5, 1.5, 2.5)))
+
+        e2 = self._write_read(e1, mug.ArrayFormat.ARRAY)
+
+        self.assertEqual(e2.attributes[0].value, (0.5, 1.5, 2.5))
+
+    def test_write_read_back(self):
+        e2 = self._write_read(self._array_entity(), mug.ArrayFormat.ARRAY)
+        e3 = self._write_read(e2, mug.ArrayFormat.MEMORYVIEW)
+        e4 = self._write_read(e3, mug.ArrayFormat.TUPLE)
+
+        for attr in e4.attributes:
+            self.assertEqual(attr.value, (42, 43, 44, 45))
+
+    def test_truncated(self):
+        with open(self.temp_file_name, 'wb') as fd:
+            mug.write(fd, self._array_entity())
+
+        with open(self.temp_file_name, 'rb') as fd:
+            data = fd.read()
+
+        with open(self.temp_file_name, 'wb') as fd:
+            fd.write(data[:-4])
+
+        with open(self.temp_file_name, 'rb') as fd:
+            with self.assertRaises(ValueError):
+                mug.read(fd, mug.ArrayFormat.ARRAY)
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestNumpy(unittest.TestCase):
+
+    def setUp(self):
+        _, self.temp_file_name = tempfile.mkstemp(prefix="mug_")
+
+    def tearDown(self):
+        os.remove(self.temp_file_name)
+
+    def _write_read(self, type_: mug.AttributeType, value: Any) -> Any:
+        e1 = mug.Entity("foo")
+        e1.attributes.append(mug.Attribute("toto", type_, value))
+
+        with open(self.temp_file_name, 'wb') as fd:
+            mug.write(fd, e1)
+
+        with open(self.temp_file_name, 'rb') as fd:
+            return mug.read(fd, numpy=True).attributes[0].value
+
+    def test_vector(self):
+        value = numpy.array((1.5, 2.5, 3.5), numpy.float32)
+
+        read_value = self._write_read(mug.AttributeType.F32X3, value)
+
+        self.assertEqual(read_value.dtype, numpy.dtype('<f4'))
+        numpy.testing.assert_array_equal(read_value, value)
+
+    def test_matrix(self):
+        value = numpy.arange(16, dtype=numpy.float64).reshape(4, 4)
+
+        read_value = self._write_read(mug.AttributeType.F32X16, value)
+
+        self.assertEqual(read_value.dtype, numpy.dtype('<f4'))
+        numpy.testing.assert_array_equal(read_value, value.ravel())
+
+    def test_vector_count_mismatch(self):
+        with self.assertRaises(ValueError):
+            self._write_read(mug.AttributeType.F32X3, numpy.zeros(4))
+
+    def test_array(self):
+        value = numpy.arange(1000, dtype=numpy.uint32)
+
+        read_value = self._write_read(mug.AttributeType.U32_ARRAY, value)
+
+        self.assertEqual(read_value.dtype, numpy.dtype('<u4'))
+        numpy.testing.assert_array_equal(read_value, value)
+
+    def test_f16_array(self):
+        value = numpy.array((0.5, 1.5, 2.5), numpy.float16)
+
+        read_value = self._write_read(mug.AttributeType.F16_ARRAY, value)
+
+        self.assertEqual(read_value.dtype, numpy.dtype('<f2'))
+        numpy.testing.assert_array_equal(read_value, value)
+
+    def test_flattened_array(self):
+        value = numpy.ones((10, 3), numpy.float32)
+
+        read_value = self._write_read(mug.AttributeType.F32_ARRAY, value)
+
+        self.assertEqual(read_value.shape, (30,))
+
+    def test_cast_array(self):
+        value = numpy.array((1, 2, 255))
+
+        read_value = self._write_read(mug.AttributeType.U8_ARRAY, value)
+
+        self.assertEqual(read_value.dtype, numpy.dtype('<u1'))
+        numpy.testing.assert_array_equal(read_value, value)
+
+    def test_float_to_int_array(self):
+        with self.assertRaises(ValueError):
+            self._write_read(mug.AttributeType.U8_ARRAY,
+                             numpy.array((300.7, -1.0)))
+
+    def test_array_out_of_range(self):
+        for value in (numpy.array((-1, 2)), numpy.array((1, 256))):
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    self._write_read(mug.AttributeType.U8_ARRAY, value)
+
+    def test_vector_out_of_range(self):
+        with self.assertRaises(ValueError):
+            self._write_read(mug.AttributeType.U32X3,
+                             numpy.array((-1, 2 ** 40, 3), numpy.int64))
+
+    def test_float_vector_out_of_range(self):
+        with self.assertRaises(ValueError):
+            self._write_read(mug.AttributeType.F16X3,
+                             numpy.array((1.0, 1e10, 3.0)))
+
+    def test_tuple_array(self):
+        read_value = self._write_read(mug.AttributeType.I16_ARRAY, (1, -2, 3))
+
+        self.assertEqual(read_value.tolist(), [1, -2, 3])
+
+    def test_writable(self):
+        read_value = self._write_read(mug.AttributeType.F64_ARRAY, (1.0, 2.0))
+
+        read_value[0] = 3.0
+
+        self.assertEqual(read_value.tolist(), [3.0, 2.0])
+
+    def test_scalar(self):
+        read_value = self._write_read(mug.AttributeType.F32,
+                                      numpy.float32(1.5))
+
+        self.assertEqual(read_value, 1.5)
+
+
+class _ChunkRecorder:
+
+    def __init__(self, partial: bool = False):
+        self.chunks = []
+        self._partial = partial
+
+    def write(self, data) -> int:
+        if self._partial and len(data) > 1:
+            data = data[:len(data) // 2]
+
+        self.chunks.append(bytes(data))
+        return len(data)
+
+
+class TestBufferedWrite(unittest.TestCase):
+
+    def _scene(self) -> mug.Entity:
+        root = mug.Entity("root")
+
+        for i in range(100):
+            child = mug.Entity("child{}".format(i))
+            child.attributes.append(mug.Attribute("translate",
+                                                  mug.AttributeType.F32X3,
+                                                  (i, i, i)))
+            child.attributes.append(mug.Attribute("name",
+                                                  mug.AttributeType.STR,
+                                                  "child{}".format(i)))
+            root.children.append(child)
+
+        return root
+
+    def test_dumps_loads(self):
+        data = mug.dumps(self._scene())
+
+        self.assertTrue(data.startswith(b'MUGS'))
+
+        root = mug.loads(data)
+
+        self.assertEqual(len(root.children), 100)
+        self.assertEqual(root.children[42].attributes[0].value,
+                         (42.0, 42.0, 42.0))
+        self.assertEqual(root.children[42].attributes[1].value, "child42")
+
+    def test_single_write(self):
+        fd = _ChunkRecorder()
+        mug.write(fd, self._scene())
+
+        self.assertEqual(len(fd.chunks), 1)
+        self.assertEqual(fd.chunks[0], mug.dumps(self._scene()))
+
+    def test_chunks(self):
+        fd = _ChunkRecorder()
+        mug.write(fd, self._scene(), chunk_size=256)
+
+        self.assertGreater(len(fd.chunks), 1)
+        self.assertEqual(b''.join(fd.chunks), mug.dumps(self._scene()))
+
+    def test_partial_write(self):
+        fd = _ChunkRecorder(partial=True)
+        mug.write(fd, self._scene(), chunk_size=256)
+
+        self.assertEqual(b''.join(fd.chunks), mug.dumps(self._scene()))
+
+
+class TestDeepHierarchy(unittest.TestCase):
+
+    def test_deep_chain(self):
+        depth = sys.getrecursionlimit() * 10
+
+        root = entity = mug.Entity("0")
+        for i in range(1, depth):
+            child = mug.Entity(str(i))
+            entity.children.append(child)
+            entity = child
+
+        data = mug.dumps(root)
+
+        fd = _ChunkRecorder()
+        mug.write(fd, root, chunk_size=4096)
+        self.assertEqual(b''.join(fd.chunks), data)
+
+        entity = mug.loads(data)
+        for i in range(depth):
+            self.assertEqual(entity.name, str(i))
+            entity = entity.children[0] if entity.children else None
+
+        self.assertIsNone(entity)
+
+
+class TestSized(unittest.TestCase):
+
+    def _scene(self) -> mug.Entity:
+        root = mug.Entity("root")
+        root.attributes.append(mug.Attribute("name", mug.AttributeType.STR,
+                                             "root"))
+
+        for i in range(300):
+            child = mug.Entity("child{}".format(i))
+            child.attributes.append(mug.Attribute("points",
+                                                  mug.AttributeType.F32_ARRAY,
+                                                  (1.5,) * i))
+            child.children.append(mug.Entity("grandchild"))
+            root.children.append(child)
+
+        return root
+
+    def test_header(self):
+        self.assertTrue(mug.dumps(mug.Entity("foo")).startswith(b'MUGS'))
+        self.assertTrue(mug.dumps(mug.Entity("foo"),
+                                  sized=True).startswith(b'MUG2\x01'))
+
+    def test_write_read(self):
+        root = mug.loads(mug.dumps(self._scene(), sized=True))
+
+        self.assertEqual(root.attributes[0].value, "root")
+        self.assertEqual(len(root.children), 300)
+        self.assertEqual(root.children[299].attributes[0].value,
+                         (1.5,) * 299)
+        self.assertEqual(root.children[299].children[0].name, "grandchild")
+
+    def test_same_as_v1(self):
+        data = mug.dumps(mug.loads(mug.dumps(self._scene(), sized=True)))
+
+        self.assertEqual(data, mug.dumps(self._scene()))
+
+    def test_chunks(self):
+        fd = _ChunkRecorder()
+        mug.write(fd, self._scene(), chunk_size=256, sized=True)
+
+        self.assertGreater(len(fd.chunks), 1)
+        self.assertEqual(b''.join(fd.chunks),
+                         mug.dumps(self._scene(), sized=True))
+
+    def test_sizes(self):
+        root = mug.Entity("foo")
+        root.attributes.append(mug.Attribute("bar", mug.AttributeType.U16, 1))
+        root.children.append(mug.Entity("baz"))
+
+        self.assertEqual(mug.dumps(root, sized=True),
+                         b'MUG2\x01'
+                         b'\x15'  # root byte count
+                         b'\x03foo\x01'
+                         b'\x03bar\x01\x02\x01\x00'
+                         b'\x01'
+                         b'\x06'  # child byte count
+                         b'\x03baz\x00\x00')
+
+    def test_unsupported_flags(self):
+        with self.assertRaises(ValueError):
+            mug.loads(b'MUG2\x80\x03foo\x00\x00')
+
+    def test_not_mug(self):
+        with self.assertRaises(ValueError):
+            mug.loads(b'ABCD\x03foo\x00\x00')
+
+
+class TestSelectiveRead(unittest.TestCase):
+
+    def _dumps(self, entity: mug.Entity) -> bytes:
+        return mug.dumps(entity)
+
+    def _read(self, **options) -> mug.Entity:
+        root = mug.Entity("root")
+        root.attributes.append(mug.Attribute("name", mug.AttributeType.STR,
+                                             "root"))
+
+        for i in range(5):
+            child = mug.Entity("child{}".format(i))
+            child.attributes.append(mug.Attribute("points",
+                                                  mug.AttributeType.F32_ARRAY,
+                                                  (1.5,) * i))
+            child.attributes.append(mug.Attribute("visible",
+                                                  mug.AttributeType.U8,
+                                                  i % 2))
+            child.attributes.append(mug.Attribute("tags",
+                                                  mug.AttributeType.STR_ARRAY,
+                                                  ["a"] * i))
+
+            for j in range(i):
+                grandchild = mug.Entity("grandchild{}".format(j))
+                grandchild.attributes.append(
+                    mug.Attribute("visible", mug.AttributeType.U8, 1))
+                grandchild.children.append(mug.Entity("leaf"))
+                child.children.append(grandchild)
+
+            root.children.append(child)
+
+        return mug.read(io.BytesIO(self._dumps(root)), **options)
+
+    def test_max_depth(self):
+        root = self._read(max_depth=1)
+
+        self.assertEqual(len(root.children), 5)
+        self.assertEqual(len(root.children[4].attributes), 3)
+        self.assertTrue(all(not c.children for c in root.children))
+
+        root = self._read(max_depth=0)
+
+        self.assertEqual(root.attributes[0].value, "root")
+        self.assertEqual(root.children, [])
+
+        root = self._read(max_depth=2)
+
+        self.assertEqual(len(root.children[4].children), 4)
+        self.assertEqual(root.children[4].children[3].children, [])
+
+    def test_attributes(self):
+        root = self._read(attributes={"visible"})
+
+        self.assertEqual(root.attributes, [])
+
+        for i, child in enumerate(root.children):
+            self.assertEqual([(a.name, a.value) for a in child.attributes],
+                             [("visible", i % 2)])
+            self.assertEqual(len(child.children), i)
+
+        self.assertEqual(root.children[3].children[2].children[0].name,
+                         "leaf")
+
+    def test_attribute_list(self):
+        root = self._read(attributes=["points", "name"])
+
+        self.assertEqual(root.attributes[0].value, "root")
+        self.assertEqual(root.children[3].attributes[0].value, (1.5,) * 3)
+
+    def test_entity_filter(self):
+        root = self._read(entity_filter=lambda e: e.name != "grandchild1")
+
+        self.assertEqual([c.name for c in root.children[3].children],
+                         ["grandchild0", "grandchild2"])
+        self.assertEqual(len(root.children[3].children[1].children), 1)
+
+    def test_entity_filter_attributes(self):
+        root = self._read(
+            attributes={"visible"},
+            entity_filter=lambda e: all(a.value for a in e.attributes))
+
+        self.assertEqual([c.name for c in root.children],
+                         ["child1", "child3"])
+        self.assertEqual(len(root.children[1].children), 3)
+
+    def test_all(self):
+        root = self._read(max_depth=2, attributes={"tags"},
+                          entity_filter=lambda e: not e.name.endswith("0"))
+
+        self.assertEqual(len(root.children), 4)
+        self.assertEqual([c.name for c in root.children[3].children],
+                         ["grandchild1", "grandchild2", "grandchild3"])
+        self.assertEqual(root.children[3].children[0].attributes, [])
+        self.assertEqual(root.children[3].children[0].children, [])
+
+    def test_same_as_read(self):
+        self.assertEqual(mug.dumps(self._read(max_depth=100)),
+                         mug.dumps(self._read()))
+
+
+class TestSelectiveReadSized(TestSelectiveRead):
+
+    def _dumps(self, entity: mug.Entity) -> bytes:
+        return mug.dumps(entity, sized=True)
+
+
+class TestSelectiveReadStreamed(TestSelectiveRead):
+
+    def _dumps(self, entity: mug.Entity) -> bytes:
+        fd = io.BytesIO()
+
+        with mug.StreamWriter(fd, streamed=True) as writer:
+            for event in mug.iter_events(io.BytesIO(mug.dumps(entity))):
+                if isinstance(event, mug.StartEntity):
+                    writer.begin_entity(event.name)
+                elif isinstance(event, mug.Attr):
+                    writer.add_attribute(*event)
+                else:
+                    writer.end_entity()
+
+        return fd.getvalue()
+
+
+class TestSelectiveReadInstanced(TestSelectiveRead):
+
+    def _dumps(self, entity: mug.Entity) -> bytes:
+        return mug.dumps(entity, instances=True)
+
+
+class TestStringTable(unittest.TestCase):
+
+    def _scene(self) -> mug.Entity:
+        root = mug.Entity("root")
+
+        for i in range(300):
+            child = mug.Entity("child")
+            child.attributes.append(mug.Attribute("visibility",
+                                                  mug.AttributeType.U8, 1))
+            child.attributes.append(mug.Attribute("translate",
+                                                  mug.AttributeType.F32X3,
+                                                  (float(i), 0.0, 0.0)))
+            root.children.append(child)
+
+        return root
+
+    def test_header(self):
+        data = mug.dumps(mug.Entity("foo"), string_table=True)
+
+        self.assertEqual(data[:5], b'MUG2\x04')
+
+    def test_bytes(self):
+        root = mug.Entity("foo")
+        root.attributes.append(mug.Attribute("bar", mug.AttributeType.U8, 1))
+        root.children.append(mug.Entity("bar"))
+
+        self.assertEqual(mug.dumps(root, string_table=True),
+                         b'MUG2\x04'
+                         b'\x02\x03bar\x03foo'  # most frequent first
+                         b'\x01\x01'
+                         b'\x00\x00\x01'
+                         b'\x01'
+                         b'\x00\x00\x00')
+
+    def test_write_read(self):
+        data = mug.dumps(self._scene(), string_table=True)
+
+        self.assertLess(len(data), len(mug.dumps(self._scene())) * 0.6)
+        self.assertEqual(mug.dumps(mug.loads(data)), mug.dumps(self._scene()))
+
+        fd = io.BytesIO()
+        mug.write(fd, self._scene(), chunk_size=64, string_table=True)
+        self.assertEqual(fd.getvalue(), data)
+
+    def test_shared_names(self):
+        root = mug.loads(mug.dumps(self._scene(), string_table=True))
+
+        self.assertIs(root.children[0].name, root.children[299].name)
+        self.assertIs(root.children[0].attributes[1].name,
+                      root.children[299].attributes[1].name)
+        self.assertIs(root.children[0].attributes[1].name,
+                      sys.intern("translate"))
+
+    def test_sized(self):
+        data = mug.dumps(self._scene(), sized=True, string_table=True)
+
+        self.assertEqual(data[4], mug.FormatFlag.SIZED |
+                         mug.FormatFlag.STRING_TABLE)
+        self.assertEqual(mug.dumps(mug.loads(data)), mug.dumps(self._scene()))
+
+    def test_selective_read(self):
+        for sized in (False, True):
+            with self.subTest(sized=sized):
+                data = mug.dumps(self._scene(), sized=sized,
+                                 string_table=True)
+                root = mug.read(io.BytesIO(data), attributes={"translate"},
+                                entity_filter=lambda e: e.attributes[0]
+                                .value[0] < 10)
+
+                self.assertEqual(len(root.children), 10)
+                self.assertEqual(root.children[9].attributes[0].value,
+                                 (9.0, 0.0, 0.0))
+
+    def test_scene_table(self):
+        table = mug.SceneTable.from_entity(self._scene())
+        data = mug.dumps(table, string_table=True)
+
+        self.assertEqual(data, mug.dumps(self._scene(), string_table=True))
+
+        table = mug.loads(data, table=True)
+        self.assertEqual(table.names, ["root", "child", "visibility",
+                                       "translate"])
+        self.assertEqual(mug.dumps(table), mug.dumps(self._scene()))
+
+    def test_invalid_index(self):
+        data = mug.dumps(scene(), string_table=True)
+
+        for attribute in (False, True):
+            invalid = invalid_string_index(data, attribute)
+
+            for options in ({}, {"max_depth": 1}, {"table": True}):
+                with self.subTest(attribute=attribute, **options):
+                    with self.assertRaisesRegex(ValueError,
+                                                "invalid string table"):
+                        mug.read(io.BytesIO(invalid), **options)
+
+
+class _Pipe(io.RawIOBase):
+    """Non seekable file object over bytes."""
+
+    def __init__(self, data: bytes):
+        self._fd = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        return self._fd.readinto(b)
+
+
+class TestInstanced(unittest.TestCase):
+
+    def _scene(self) -> mug.Entity:
+        prop = mug.Entity("prop")
+        prop.attributes.append(mug.Attribute("points",
+                                             mug.AttributeType.F32_ARRAY,
+                                             array.array('f', [1.5] * 30)))
+        prop.children.append(mug.Entity("mesh"))
+
+        root = mug.Entity("root")
+
+        for i in range(100):
+            child = mug.Entity("instance")
+            child.attributes.append(mug.Attribute("translate",
+                                                  mug.AttributeType.F32X3,
+                                                  (float(i), 0.0, 0.0)))
+            child.children.append(prop)
+            root.children.append(child)
+
+        return root
+
+    def test_header(self):
+        data = mug.dumps(mug.Entity("foo"), instances=True)
+
+        self.assertEqual(data[:5], b'MUG2\x08')
+
+    def test_bytes(self):
+        root = mug.Entity("root")
+        child = mug.Entity("foo")
+        child.attributes.append(mug.Attribute("bar", mug.AttributeType.U32,
+                                              1))
+        root.children.extend((child, child, mug.Entity("baz")))
+
+        self.assertEqual(mug.dumps(root, instances=True),
+                         b'MUG2\x08'
+                         b'\x00\x04root\x00\x03'
+                         b'\x01'  # instance
+                         b'\x03foo\x01\x03bar\x02\x01\x00\x00\x00\x00'
+                         b'\x02'  # reference to the instance, 16 bytes back
+                         b'\x10\x00\x00\x00\x00\x00\x00\x00'
+                         b'\x00'  # smaller than a reference, not instanced
+                         b'\x03baz\x00\x00')
+
+    def test_write_read(self):
+        data = mug.dumps(self._scene(), instances=True)
+
+        self.assertLess(len(data), len(mug.dumps(self._scene())) * 0.3)
+        self.assertEqual(mug.dumps(mug.loads(data)), mug.dumps(self._scene()))
+
+        fd = io.BytesIO()
+        mug.write(fd, self._scene(), chunk_size=64, instances=True)
+        self.assertEqual(fd.getvalue(), data)
+
+    def test_shared(self):
+        root = mug.loads(mug.dumps(self._scene(), instances=True))
+
+        self.assertIs(root.children[0].children[0],
+                      root.children[99].children[0])
+        self.assertIsNot(root.children[0], root.children[99])
+
+    def test_copy_instances(self):
+        data = mug.dumps(self._scene(), instances=True)
+        root = mug.loads(data, mug.ArrayFormat.ARRAY, copy_instances=True)
+        first = root.children[0].children[0]
+        last = root.children[99].children[0]
+
+        self.assertIsNot(first, last)
+        self.assertIsNot(first.children[0], last.children[0])
+
+        first.attributes[0].value[0] = 2.5
+        self.assertEqual(last.attributes[0].value[0], 1.5)
+        self.assertEqual(mug.dumps(root.children[1]),
+                         mug.dumps(self._scene().children[1]))
+
+    def test_equal_subtrees(self):
+        root = mug.Entity("root")
+
+        for _ in range(2):
+            # Equal, but distinct entities.
+            root.children.append(self._scene().children[0])
+
+        data = mug.dumps(root, instances=True)
+        self.assertEqual(data.count(b'instance'), 1)
+
+        root = mug.loads(data)
+        self.assertIs(root.children[0], root.children[1])
+
+    def test_options(self):
+        for options in ({'sized': True}, {'string_table': True},
+                        {'toc_attributes': True}, {'compression': 'zlib'}):
+            with self.subTest(**options):
+                data = mug.dumps(self._scene(), instances=True, **options)
+
+                self.assertEqual(mug.dumps(mug.loads(data)),
+                                 mug.dumps(self._scene()))
+
+    def test_scene_table(self):
+        table = mug.SceneTable.from_entity(self._scene())
+        data = mug.dumps(table, instances=True)
+
+        self.assertEqual(data, mug.dumps(self._scene(), instances=True))
+        self.assertEqual(mug.dumps(mug.loads(data, table=True)),
+                         mug.dumps(self._scene()))
+
+    def test_not_seekable(self):
+        data = mug.dumps(self._scene(), instances=True)
+        fd = io.BufferedReader(_Pipe(data))
+
+        self.assertEqual(mug.dumps(mug.read(fd)), mug.dumps(self._scene()))
+
+    def test_deep(self):
+        chain = mug.Entity("chain")
+        entity = chain
+
+        for _ in range(10000):
+            entity.children.append(mug.Entity("link"))
+            entity = entity.children[0]
+
+        root = mug.Entity("root")
+        root.children.extend((chain, chain))
+        data = mug.dumps(root, instances=True)
+
+        root = mug.loads(data)
+        self.assertIs(root.children[0], root.children[1])
+
+        root = mug.loads(data, copy_instances=True)
+        self.assertEqual(mug.dumps(root.children[1]), mug.dumps(chain))
+
+    def test_invalid_options(self):
+        for options in ({'workers': 1}, {'cache': mug.WriteCache()}):
+            with self.subTest(options=options):
+                with self.assertRaises(ValueError):
+                    mug.write(io.BytesIO(), self._scene(), instances=True,
+                              **options)
+
+    def test_streamed_flags(self):
+        with self.assertRaises(ValueError):
+            mug.loads(b'MUG2\x0a\x00\x03foo\x00\x00')
+
+    def test_invalid_reference(self):
+        for data in (b'MUG2\x08\x00\x03foo\x00\x01'
+                     b'\x02\x03\x00\x00\x00\x00\x00\x00\x00',  # not instance
+                     b'MUG2\x08\x01\x03foo\x00\x01'
+                     b'\x02\x07\x00\x00\x00\x00\x00\x00\x00',  # ancestor
+                     b'MUG2\x08\x00\x03foo\x00\x01'
+                     b'\x02\x00\x00\x00\x00\x00\x00\x00\x00'):  # itself
+            with self.subTest(data=data):
+                with self.assertRaises(ValueError):
+                    mug.loads(data)
+
+
+class TestLookup(unittest.TestCase):
+
+    def _scene(self) -> mug.Entity:
+        root = mug.Entity("root")
+
+        for name in ("foo", "bar", "foo"):
+            child = mug.Entity(name)
+            child.attributes.append(mug.Attribute("visibility",
+                                                  mug.AttributeType.U8, 1))
+            child.children.append(mug.Entity("leaf"))
+            root.children.append(child)
+
+        return root
+
+    def test_lookup(self):
+        root = self._scene()
+
+        self.assertIs(root.child("foo"), root.children[0])  # first wins
+        self.assertIs(root.child("bar"), root.children[1])
+        self.assertIsNone(root.child("baz"))
+        self.assertIs(root.children[1].get_attribute("visibility"),
+                      root.children[1].attributes[0])
+        self.assertIsNone(root.get_attribute("visibility"))
+
+    def test_mutations(self):
+        root = self._scene()
+        children = root.children
+        root.child("foo")
+
+        children.append(mug.Entity("baz"))
+        self.assertIs(root.child("baz"), children[3])
+
+        children.insert(0, mug.Entity("foo"))
+        self.assertIs(root.child("foo"), children[0])
+
+        children.pop(0)
+        self.assertIs(root.child("baz"), children[3])
+
+        children[0] = mug.Entity("qux")
+        self.assertIs(root.child("foo"), children[2])
+        self.assertIs(root.child("qux"), children[0])
+
+        children.reverse()
+        self.assertIs(root.child("qux"), children[3])
+
+        children.sort(key=lambda e: e.name)
+        self.assertIs(root.child("bar"), children[0])
+
+        del children[0]
+        self.assertIsNone(root.child("bar"))
+
+        children.remove(root.child("qux"))
+        self.assertIsNone(root.child("qux"))
+
+        children[0].name = "renamed"
+        self.assertIsNone(root.child("baz"))
+        self.assertIs(root.child("renamed"), children[0])
+
+        children.clear()
+        self.assertIsNone(root.child("foo"))
+
+    def test_plain_list(self):
+        root = mug.Entity("root")
+        root.children = [mug.Entity("foo"), mug.Entity("foo")]
+
+        self.assertIs(root.child("foo"), root.children[0])
+        self.assertIsNone(root.child("bar"))
+
+    def test_find(self):
+        root = self._scene()
+
+        self.assertIs(root.find("bar/leaf"), root.children[1].children[0])
+        self.assertIs(root.find("foo"), root.children[0])
+        self.assertIsNone(root.find("bar/leaf/leaf"))
+        self.assertIsNone(root.find("baz/leaf"))
+
+        with self.assertRaises(ValueError):
+            root.find("/bar")
+
+        with self.assertRaises(ValueError):
+            root.find("bar//leaf")
+
+    def test_find_duplicate_names(self):
+        root = self._scene()
+        chair = mug.Entity("chair")
+        root.children[2].children[0].children.append(chair)
+
+        # Only in the second "foo" child, as read_entity finds it.
+        self.assertIs(root.find("foo/leaf/chair"), chair)
+        self.assertEqual(mug.read_entity(io.BytesIO(mug.dumps(root)),
+                                         "/root/foo/leaf/chair").name,
+                         "chair")
+        self.assertIsNone(root.find("foo/leaf/table"))
+
+        root.children = list(root.children)
+        self.assertIs(root.find("foo/leaf/chair"), chair)
+
+    def test_read(self):
+        fd, temp_file_name = tempfile.mkstemp(prefix="mug_")
+        self.addCleanup(os.remove, temp_file_name)
+
+        data = mug.dumps(self._scene())
+        with os.fdopen(fd, 'wb') as fd:
+            fd.write(data)
+
+        roots = [mug.loads(data),
+                 mug.loads(data, table=True).to_entity(),
+                 mug.read_mmap(temp_file_name),
+                 mug.open(temp_file_name, lazy=True)]
+
+        for root in roots:
+            with self.subTest(type=type(root).__name__):
+                self.assertEqual(root.find("bar/leaf").name, "leaf")
+                self.assertEqual(root.child("foo").get_attribute(
+                    "visibility").value, 1)
@@ -0,0 +1,155 @@
+import io
+import unittest
+from unittest import mock
+
+import mug
+from mug import parallel
+
+from scenes import scene
+
+
+class TestWriteParallel(unittest.TestCase):
+
+    def _assert_same(self, root=None, **options):
+        if root is None:
+            root = scene()
+
+        expected = io.BytesIO()
+        mug.write(expected, root, **options)
+
+        for split_depth in (0, 1, 2, 5):
+            with self.subTest(split_depth=split_depth, **options):
+                fd = io.BytesIO()
+                mug.write(fd, root, workers=2, split_depth=split_depth,
+                          **options)
+                self.assertEqual(fd.getvalue(), expected.getvalue())
+
+    def test_write(self):
+        self._assert_same()
+
+    def test_sized(self):
+        self._assert_same(sized=True)
+
+    def test_toc(self):
+        self._assert_same(toc=True)
+        self._assert_same(sized=True, toc_attributes=True)
+
+    def test_string_table(self):
+        self._assert_same(string_table=True)
+
+    def test_duplicate_subtrees(self):
+        root = scene()
+        root.children.append(root.children[2])
+        root.children[1].children.append(root.children[0])
+
+        self._assert_same(root, sized=True, toc=True)
+
+    def test_scene_table(self):
+        fd = io.BytesIO()
+        mug.write(fd, mug.SceneTable.from_entity(scene()), workers=2)
+
+        self.assertEqual(fd.getvalue(), mug.dumps(scene()))
+
+    def test_compression(self):
+        fd = io.BytesIO()
+        mug.write(fd, scene(), compression="zlib", block_size=64,
+                  workers=2)
+
+        self.assertEqual(mug.dumps(mug.loads(fd.getvalue())),
+                         mug.dumps(scene()))
+
+    def test_not_forked(self):
+        with mock.patch.object(parallel, '_FORK', False):
+            self._assert_same(toc=True)
+
+    def test_negative_split_depth(self):
+        with self.assertRaises(ValueError):
+            mug.write(io.BytesIO(), scene(), workers=2, split_depth=-1)
+
+
+class TestReadParallel(unittest.TestCase):
+
+    def _assert_same(self, data: bytes, **options):
+        expected = mug.dumps(mug.loads(data))
+
+        for split_depth in (0, 1, 2, 5):
+            with self.subTest(split_depth=split_depth, **options):
+                root = mug.read(io.BytesIO(data), workers=2,
+                                split_depth=split_depth, **options)
+                self.assertEqual(mug.dumps(root), expected)
+
+    def test_read(self):
+        self._assert_same(mug.dumps(scene()))
+
+    def test_sized(self):
+        self._assert_same(mug.dumps(scene(), sized=True, toc=True))
+
+    def test_string_table(self):
+        self._assert_same(mug.dumps(scene(), string_table=True))
+
+    def test_streamed(self):
+        fd = io.BytesIO()
+
+        with mug.StreamWriter(fd, streamed=True) as writer:
+            writer.begin_entity("root")
+
+            for i in range(3):
+                writer.begin_entity("child")
+                writer.add_attribute("index", mug.AttributeType.U8, i)
+                writer.begin_entity("leaf")
+                writer.end_entity()
+                writer.end_entity()
+
+            writer.end_entity()
+
+        self._assert_same(fd.getvalue())
+
+    def test_compressed(self):
+        self._assert_same(mug.dumps(scene(), compression="zlib",
+                                    block_size=64))
+
+    def test_instanced(self):
+        root = scene()
+        root.children.append(root.children[0])
+        data = mug.dumps(root, instances=True)
+
+        self._assert_same(data)
+
+        root = mug.read(io.BytesIO(data), workers=2)
+        self.assertIs(root.children[0], root.children[-1])
+
+    def test_array_format(self):
+        data = mug.dumps(scene())
+
+        for array_format in (mug.ArrayFormat.TUPLE, mug.ArrayFormat.ARRAY,
+                             mug.ArrayFormat.MEMORYVIEW):
+            with self.subTest(array_format=array_format):
+                root = mug.read(io.BytesIO(data), array_format, workers=2)
+                expected = mug.loads(data, array_format)
+
+                self.assertEqual(type(root.children[2].attributes[1].value),
+                                 type(expected.children[2].attributes[1]
+                                      .value))
+                self.assertEqual(mug.dumps(root), data)
+
+    def test_not_forked(self):
+        with mock.patch.object(parallel, '_FORK', False):
+            self._assert_same(mug.dumps(scene(), sized=True))
+
+    def test_truncated(self):
+        data = mug.dumps(scene())
+
+        with self.assertRaises(ValueError):
+            mug.read(io.BytesIO(data[:40]), workers=2)
+
+    def test_invalid_options(self):
+        data = mug.dumps(scene())
+
+        with self.assertRaises(ValueError):
+            mug.read(io.BytesIO(data), workers=2, max_depth=1)
+
+        with self.assertRaises(ValueError):
+            mug.read(io.BytesIO(data), workers=2, table=True)
+
+        with self.assertRaises(ValueError):
+            mug.read(io.BytesIO(data), workers=2, split_depth=-1)
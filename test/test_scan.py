@@ -0,0 +1,215 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+
+import mug
+
+from scenes import scene
+
+
+class TestScan(unittest.TestCase):
+
+    options = {}
+
+    def _data(self, **options) -> bytes:
+        return mug.dumps(scene(), **self.options, **options)
+
+    def test_summary(self):
+        data = self._data()
+        result = mug.scan(io.BytesIO(data))
+
+        self.assertEqual(result.bytes, len(data))
+        self.assertEqual(result.entities, 10)
+        self.assertEqual(result.attributes, 1 + 9 + 6)
+        self.assertEqual(result.max_depth, 2)
+        self.assertFalse(result.has_toc)
+
+        self.assertEqual(result.type_counts, {
+            mug.AttributeType.STR: 1, mug.AttributeType.F32X16: 3,
+            mug.AttributeType.F32_ARRAY: 3, mug.AttributeType.STR_ARRAY: 3,
+            mug.AttributeType.U16: 6})
+        self.assertEqual(result.type_bytes[mug.AttributeType.U16], 12)
+        self.assertEqual(result.type_bytes[mug.AttributeType.STR_ARRAY],
+                         3 * (1 + 2 * 2))
+        self.assertEqual(result.array_bytes, 3 * (1 + 10 * 4))
+
+    def test_largest(self):
+        result = mug.scan(io.BytesIO(self._data()), largest_count=4)
+
+        self.assertEqual(result.largest, [
+            mug.LargeAttribute("/root/child0", "xform",
+                               mug.AttributeType.F32X16, 16 * 4),
+            mug.LargeAttribute("/root/child1", "xform",
+                               mug.AttributeType.F32X16, 16 * 4),
+            mug.LargeAttribute("/root/child2", "xform",
+                               mug.AttributeType.F32X16, 16 * 4),
+            mug.LargeAttribute("/root/child0", "points",
+                               mug.AttributeType.F32_ARRAY, 1 + 10 * 4)])
+
+        result = mug.scan(io.BytesIO(self._data()), largest_count=0)
+        self.assertEqual(result.largest, [])
+
+        # Equal sizes in file order.
+        result = mug.scan(io.BytesIO(self._data()), largest_count=20)
+        self.assertEqual(len(result.largest), 16)
+        self.assertEqual(result.largest[-1].path, "/root/child2/grandchild1")
+        self.assertEqual(result.largest[-1].name, "index")
+
+    def test_largest_same_entity(self):
+        root = mug.Entity("root")
+        for name, type_ in (("a0", mug.AttributeType.U32),
+                            ("a1", mug.AttributeType.U32),
+                            ("a2", mug.AttributeType.U64)):
+            root.attributes.append(mug.Attribute(name, type_, 0))
+
+        data = mug.dumps(root, **self.options)
+        result = mug.scan(io.BytesIO(data), largest_count=2)
+
+        self.assertEqual([attr.name for attr in result.largest],
+                         ["a2", "a0"])
+
+    def test_toc(self):
+        data = self._data(toc_attributes=True)
+        result = mug.scan(io.BytesIO(data))
+
+        self.assertTrue(result.has_toc)
+        self.assertEqual(result.bytes, len(data))
+        self.assertEqual(result.entities, 10)
+
+    def test_file(self):
+        fd, temp_file_name = tempfile.mkstemp(prefix="mug_")
+        self.addCleanup(os.remove, temp_file_name)
+
+        with os.fdopen(fd, 'wb') as fd:
+            fd.write(b'garbage')
+            fd.write(self._data())
+
+        with open(temp_file_name, 'rb') as fd:
+            fd.seek(7)
+            result = mug.scan(fd)
+
+        self.assertEqual(result.bytes, len(self._data()))
+        self.assertEqual(result.entities, 10)
+
+    def test_compressed(self):
+        result = mug.scan(io.BytesIO(self._data(compression='zlib')))
+
+        self.assertEqual(result.bytes, len(self._data()))
+        self.assertEqual(result.entities, 10)
+
+    def test_as_dict(self):
+        result = json.loads(json.dumps(mug.scan(io.BytesIO(
+            self._data())).as_dict()))
+
+        self.assertEqual(result['types']['U16'], {'count': 6, 'bytes': 12})
+        self.assertEqual(result['largest'][0]['path'], "/root/child0")
+
+    def test_truncated(self):
+        data = self._data()
+
+        for size in range(len(data)):
+            with self.subTest(size=size):
+                with self.assertRaises(ValueError):
+                    mug.scan(io.BytesIO(data[:size]))
+
+        with self.assertRaises(ValueError):
+            mug.scan(io.BytesIO(self._data(toc=True)[:-1]))
+
+    def test_trailing_bytes(self):
+        with self.assertRaises(ValueError):
+            mug.scan(io.BytesIO(self._data() + b'\x00'))
+
+    def test_unknown_type(self):
+        data = self._data()
+        type_offset = data.index(b'\x04root') - 1
+        if self.options.get('sized'):
+            type_offset -= 1  # value byte count
+
+        with self.assertRaises(ValueError):
+            mug.scan(io.BytesIO(data[:type_offset] + b'\xfe' +
+                                data[type_offset + 1:]))
+
+
+class TestScanSized(TestScan):
+
+    options = {'sized': True}
+
+    def test_invalid_sizes(self):
+        data = bytearray(self._data())
+        data[data.index(b'\x06child0') - 1] += 1  # entity byte count
+
+        with self.assertRaises(ValueError):
+            mug.scan(io.BytesIO(bytes(data)))
+
+        data = bytearray(self._data())
+        offset = data.index(b'\x04root')
+        data[offset - 1] += 1  # "name" value byte count
+
+        with self.assertRaises(ValueError):
+            mug.scan(io.BytesIO(bytes(data)))
+
+
+class TestScanStringTable(TestScan):
+
+    options = {'string_table': True}
+
+    def test_invalid_index(self):
+        data = bytearray(self._data())
+        strings, offset = mug.core.string_table_unpack_from(
+            data, 5, mug.FormatFlag.STRING_TABLE)
+        data[offset] = len(strings)  # root name index
+
+        with self.assertRaises(ValueError):
+            mug.scan(io.BytesIO(bytes(data)))
+
+
+class TestScanInstanced(TestScan):
+
+    options = {'instances': True}
+
+    def _shared_data(self) -> bytes:
+        root = scene()
+        root.children.append(root.children[1])
+
+        return mug.dumps(root, **self.options)
+
+    def test_references(self):
+        result = mug.scan(io.BytesIO(self._shared_data()))
+
+        self.assertEqual(result.entities, 10)
+        self.assertEqual(result.references, 1)
+        self.assertEqual(result.as_dict()['references'], 1)
+
+    def test_invalid_reference(self):
+        data = bytearray(self._shared_data())
+        data[-8] += 1  # reference distance, the reference being last
+
+        with self.assertRaises(ValueError):
+            mug.scan(io.BytesIO(bytes(data)))
+
+
+class TestScanStreamed(unittest.TestCase):
+
+    def test_streamed(self):
+        fd = io.BytesIO()
+
+        with mug.StreamWriter(fd, streamed=True) as writer:
+            writer.begin_entity("root")
+
+            for i in range(3):
+                writer.begin_entity("child")
+                writer.add_attribute("index", mug.AttributeType.U8, i)
+                writer.begin_entity("leaf")
+                writer.end_entity()
+                writer.end_entity()
+
+            writer.end_entity()
+
+        result = mug.scan(io.BytesIO(fd.getvalue()))
+
+        self.assertEqual(result.bytes, len(fd.getvalue()))
+        self.assertEqual(result.entities, 7)
+        self.assertEqual(result.max_depth, 2)
+        self.assertEqual(result.type_counts, {mug.AttributeType.U8: 3})
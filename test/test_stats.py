@@ -0,0 +1,243 @@
+import io
+import json
+import unittest
+
+import mug
+
+from scenes import scene
+
+
+class _BoolCodec(mug.AttributeCodec):
+
+    size = 1
+
+    def as_bytes(self, value) -> bytes:
+        return b'\x01' if value else b'\x00'
+
+    def read(self, fd):
+        return fd.read(1) != b'\x00'
+
+
+mug.register_codec(248, _BoolCodec())
+
+
+class _ReadOnlyFile:
+    """File object only having `read`, neither seekable nor `readinto`."""
+
+    def __init__(self, data: bytes):
+        self._fd = io.BytesIO(data)
+
+    def read(self, size: int = -1) -> bytes:
+        return self._fd.read(size)
+
+
+def _scene() -> mug.Entity:
+    root = scene()
+
+    for child in root.children:
+        child.attributes.append(mug.Attribute("visible", 248, True))
+
+    return root
+
+
+class TestReadStats(unittest.TestCase):
+
+    def _assert_stats(self, stats: mug.Stats, data: bytes):
+        self.assertEqual(stats.bytes, len(data))
+        self.assertEqual(stats.entities, 10)
+        self.assertEqual(stats.max_depth, 2)
+        self.assertGreater(stats.seconds, 0.0)
+
+        self.assertEqual(sorted(stats.types), [mug.AttributeType.U16,
+                                               mug.AttributeType.STR,
+                                               mug.AttributeType.F32X16,
+                                               mug.AttributeType.F32_ARRAY,
+                                               mug.AttributeType.STR_ARRAY,
+                                               248])
+
+        points = stats.types[mug.AttributeType.F32_ARRAY]
+        self.assertEqual(points.count, 3)
+        self.assertEqual(points.bytes, 3 * (1 + 10 * 4))
+        self.assertGreater(points.seconds, 0.0)
+
+        self.assertEqual(stats.types[mug.AttributeType.STR].bytes, 1 + 4)
+        self.assertEqual(stats.types[mug.AttributeType.U16].count, 6)
+        self.assertEqual(stats.types[248].count, 3)
+
+    def test_read(self):
+        data = mug.dumps(_scene())
+        stats = mug.Stats()
+
+        root = mug.read(io.BytesIO(data), stats=stats)
+
+        self.assertEqual(mug.dumps(root), data)
+        self._assert_stats(stats, data)
+
+        self.assertEqual(stats.names.count, 10 + 19)
+        self.assertEqual(stats.names.bytes, len("root") +
+                         3 * len("child0") + 6 * len("grandchild0") +
+                         len("name") + 3 * len("xform") +
+                         3 * len("points") + 3 * len("tags") +
+                         3 * len("visible") + 6 * len("index") +
+                         29)  # size prefixes
+        self.assertEqual(stats.suints.count, 10 * 2)  # attribute, child counts
+
+    def test_sized(self):
+        data = mug.dumps(_scene(), sized=True)
+        stats = mug.Stats()
+
+        mug.read(io.BytesIO(data), stats=stats)
+
+        self._assert_stats(stats, data)
+        self.assertEqual(stats.suints.count, 10 * 3 + 19)
+
+    def test_string_table(self):
+        data = mug.dumps(_scene(), string_table=True)
+        stats = mug.Stats()
+
+        mug.read(io.BytesIO(data), stats=stats)
+
+        self._assert_stats(stats, data)
+        self.assertEqual(stats.names.count, 0)
+        self.assertEqual(stats.suints.count, 10 * 2 + 10 + 19)
+
+    def test_streamed(self):
+        fd = io.BytesIO()
+
+        with mug.StreamWriter(fd, streamed=True) as writer:
+            writer.begin_entity("root")
+            writer.begin_entity("child")
+            writer.begin_entity("leaf")
+            writer.end_entity()
+            writer.end_entity()
+            writer.end_entity()
+
+        stats = mug.Stats()
+        root = mug.read(io.BytesIO(fd.getvalue()), stats=stats)
+
+        self.assertEqual(root.children[0].children[0].name, "leaf")
+        self.assertEqual(stats.bytes, len(fd.getvalue()))
+        self.assertEqual(stats.max_depth, 2)
+
+    def test_instanced(self):
+        root = _scene()
+        root.children.append(root.children[0])
+        data = mug.dumps(root, instances=True)
+        stats = mug.Stats()
+
+        read_root = mug.read(io.BytesIO(data), stats=stats)
+
+        self.assertIs(read_root.children[0], read_root.children[3])
+        self.assertEqual(stats.bytes, len(data))
+        self.assertEqual(stats.entities, 10)  # the reference isn't decoded
+
+        read_root = mug.read(io.BytesIO(data), stats=mug.Stats(),
+                             copy_instances=True)
+        self.assertIsNot(read_root.children[0], read_root.children[3])
+
+    def test_read_only_file(self):
+        root = _scene()
+        root.children.append(root.children[0])
+
+        for array_format in mug.ArrayFormat:
+            for instances in (False, True):
+                with self.subTest(array_format=array_format,
+                                  instances=instances):
+                    data = mug.dumps(root, instances=instances)
+                    stats = mug.Stats()
+
+                    read_root = mug.read(_ReadOnlyFile(data), array_format,
+                                         stats=stats)
+
+                    self.assertEqual(mug.dumps(read_root,
+                                               instances=instances), data)
+                    self.assertEqual(stats.bytes, len(data))
+                    self.assertEqual(
+                        stats.types[mug.AttributeType.F32_ARRAY].bytes,
+                        (3 if instances else 4) * (1 + 10 * 4))
+
+    def test_compressed(self):
+        data = mug.dumps(_scene())
+        stats = mug.Stats()
+
+        mug.read(io.BytesIO(mug.dumps(_scene(), compression='zlib')),
+                 stats=stats)
+
+        self._assert_stats(stats, data)
+
+    def test_accumulate(self):
+        data = mug.dumps(_scene())
+        stats = mug.Stats()
+
+        mug.read(io.BytesIO(data), stats=stats)
+        mug.read(io.BytesIO(data), stats=stats)
+
+        self.assertEqual(stats.bytes, 2 * len(data))
+        self.assertEqual(stats.entities, 20)
+        self.assertEqual(stats.max_depth, 2)
+        self.assertEqual(stats.types[248].count, 6)
+
+    def test_as_dict(self):
+        stats = mug.Stats()
+        mug.read(io.BytesIO(mug.dumps(_scene())), stats=stats)
+
+        stats_dict = json.loads(json.dumps(stats.as_dict()))
+
+        self.assertEqual(list(stats_dict['types']),
+                         ["U16", "STR", "F32X16", "F32_ARRAY", "STR_ARRAY",
+                          "248"])
+        self.assertEqual(stats_dict['types']["F32_ARRAY"]['count'], 3)
+        self.assertEqual(stats_dict['entities'], 10)
+        self.assertEqual(stats_dict['names']['count'], 29)
+
+    def test_invalid_options(self):
+        data = mug.dumps(_scene())
+
+        for options in ({'max_depth': 1}, {'table': True}, {'workers': 1}):
+            with self.subTest(options=options):
+                with self.assertRaises(ValueError):
+                    mug.read(io.BytesIO(data), stats=mug.Stats(), **options)
+
+
+class TestWriteStats(unittest.TestCase):
+
+    def test_write(self):
+        for options in ({}, {'sized': True}, {'toc_attributes': True},
+                        {'string_table': True}):
+            with self.subTest(**options):
+                fd = io.BytesIO()
+                stats = mug.Stats()
+
+                mug.write(fd, _scene(), stats=stats, **options)
+
+                self.assertEqual(fd.getvalue(), mug.dumps(_scene(),
+                                                          **options))
+                self.assertEqual(stats.bytes, len(fd.getvalue()))
+                self.assertEqual(stats.entities, 10)
+                self.assertEqual(stats.max_depth, 2)
+                self.assertEqual(stats.types[mug.AttributeType.U16].count, 6)
+                self.assertEqual(
+                    stats.types[mug.AttributeType.F32_ARRAY].bytes,
+                    3 * (1 + 10 * 4))
+                self.assertEqual(stats.names.count, 0)
+
+    def test_scene_table(self):
+        stats = mug.Stats()
+        table = mug.SceneTable.from_entity(_scene())
+
+        data = mug.dumps(table)
+        fd = io.BytesIO()
+        mug.write(fd, table, stats=stats)
+
+        self.assertEqual(fd.getvalue(), data)
+        self.assertEqual(stats.types[248].count, 3)
+
+    def test_compressed(self):
+        stats = mug.Stats()
+        mug.write(io.BytesIO(), _scene(), compression='zlib', stats=stats)
+
+        self.assertEqual(stats.bytes, len(mug.dumps(_scene())))
+
+    def test_workers(self):
+        with self.assertRaises(ValueError):
+            mug.write(io.BytesIO(), _scene(), workers=1, stats=mug.Stats())
@@ -0,0 +1,249 @@
+import io
+import os
+import struct
+import sys
+import tempfile
+import unittest
+
+import mug
+
+from scenes import scene
+
+
+def _stream(writer: mug.StreamWriter, entity: mug.Entity):
+    writer.begin_entity(entity.name)
+
+    for attr in entity.attributes:
+        writer.add_attribute(attr.name, attr.type_, attr.value)
+
+    for child in entity.children:
+        _stream(writer, child)
+
+    writer.end_entity()
+
+
+class _Pipe:
+    """Write only, not seekable, file object."""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data) -> int:
+        self.data += data
+        return len(data)
+
+    def seekable(self) -> bool:
+        return False
+
+
+class TestStreamWriter(unittest.TestCase):
+
+    def _dumps(self, entity: mug.Entity, **options) -> bytes:
+        fd = io.BytesIO()
+
+        with mug.StreamWriter(fd, **options) as writer:
+            _stream(writer, entity)
+
+        return fd.getvalue()
+
+    def test_round_trip(self):
+        data = self._dumps(scene())
+
+        self.assertEqual(data[:4], mug.core.MAGIC)
+        self.assertEqual(mug.dumps(mug.loads(data)), mug.dumps(scene()))
+
+    def test_leaves_not_padded(self):
+        self.assertEqual(self._dumps(mug.Entity("root")),
+                         mug.dumps(mug.Entity("root")))
+
+    def test_small_chunks(self):
+        for chunk_size in (1, 16, 100):
+            with self.subTest(chunk_size=chunk_size):
+                data = self._dumps(scene(), chunk_size=chunk_size)
+
+                self.assertEqual(mug.dumps(mug.loads(data)),
+                                 mug.dumps(scene()))
+
+    def test_not_at_file_start(self):
+        fd = io.BytesIO()
+        fd.write(b'garbage')
+
+        with mug.StreamWriter(fd, chunk_size=1) as writer:
+            _stream(writer, scene())
+
+        self.assertEqual(mug.dumps(mug.loads(fd.getvalue()[7:])),
+                         mug.dumps(scene()))
+
+    def test_mmap_and_lazy(self):
+        _, file_name = tempfile.mkstemp(prefix="mug_")
+        self.addCleanup(os.remove, file_name)
+
+        with open(file_name, 'wb') as fd, mug.StreamWriter(fd) as writer:
+            _stream(writer, scene())
+
+        self.assertEqual(mug.dumps(mug.read_mmap(file_name)),
+                         mug.dumps(scene()))
+
+        root = mug.open(file_name, lazy=True)
+        self.assertEqual(root.children[2].children[1].attributes[0].value, 21)
+
+    def test_deep(self):
+        depth = sys.getrecursionlimit() * 2
+        fd = io.BytesIO()
+
+        with mug.StreamWriter(fd, chunk_size=64) as writer:
+            for i in range(depth):
+                writer.begin_entity(str(i))
+
+            for _ in range(depth):
+                writer.end_entity()
+
+        entity = mug.loads(fd.getvalue())
+        for _ in range(depth - 1):
+            self.assertEqual(len(entity.children), 1)
+            entity = entity.children[0]
+
+        self.assertEqual(entity.name, str(depth - 1))
+
+    def test_attribute_after_child(self):
+        with self.assertRaises(ValueError):
+            with mug.StreamWriter(io.BytesIO()) as writer:
+                writer.begin_entity("root")
+                writer.begin_entity("child")
+                writer.end_entity()
+                writer.add_attribute("a", mug.AttributeType.U8, 1)
+
+    def test_no_entity(self):
+        writer = mug.StreamWriter(io.BytesIO())
+
+        with self.assertRaises(ValueError):
+            writer.add_attribute("a", mug.AttributeType.U8, 1)
+
+        with self.assertRaises(ValueError):
+            writer.end_entity()
+
+        with self.assertRaises(ValueError):
+            writer.close()
+
+    def test_second_root(self):
+        writer = mug.StreamWriter(io.BytesIO())
+        writer.begin_entity("root")
+        writer.end_entity()
+
+        with self.assertRaises(ValueError):
+            writer.begin_entity("root")
+
+    def test_not_ended(self):
+        writer = mug.StreamWriter(io.BytesIO())
+        writer.begin_entity("root")
+
+        with self.assertRaises(ValueError):
+            writer.close()
+
+    def test_unknown_type(self):
+        writer = mug.StreamWriter(io.BytesIO())
+        writer.begin_entity("root")
+
+        with self.assertRaises(ValueError):
+            writer.add_attribute("a", 200, 1)
+
+    def test_invalid_value(self):
+        root = mug.Entity("root")
+        root.attributes.append(mug.Attribute("index", mug.AttributeType.U8,
+                                             2))
+        fd = io.BytesIO()
+
+        with mug.StreamWriter(fd) as writer:
+            writer.begin_entity("root")
+
+            with self.assertRaises(struct.error):
+                writer.add_attribute("bad", mug.AttributeType.U8, "x")
+
+            writer.add_attribute("index", mug.AttributeType.U8, 2)
+            writer.end_entity()
+
+        self.assertEqual(fd.getvalue(), mug.dumps(root))
+
+    def test_error_not_hidden(self):
+        with self.assertRaises(KeyError):
+            with mug.StreamWriter(io.BytesIO()) as writer:
+                writer.begin_entity("root")
+                raise KeyError()
+
+
+class TestStreamWriterStreamed(unittest.TestCase):
+
+    def _dumps(self, entity: mug.Entity, **options) -> bytes:
+        pipe = _Pipe()
+
+        with mug.StreamWriter(pipe, **options) as writer:
+            _stream(writer, entity)
+
+        return bytes(pipe.data)
+
+    def test_header(self):
+        data = self._dumps(scene())
+
+        self.assertEqual(data[:4], mug.core.MAGIC_V2)
+        self.assertEqual(data[4], mug.FormatFlag.STREAMED)
+
+    def test_forced(self):
+        fd = io.BytesIO()
+
+        with mug.StreamWriter(fd, streamed=True) as writer:
+            _stream(writer, scene())
+
+        self.assertEqual(fd.getvalue(), self._dumps(scene()))
+
+    def test_bytes(self):
+        root = mug.Entity("r")
+        root.children.append(mug.Entity("a"))
+        root.children.append(mug.Entity("b"))
+        root.children[0].children.append(mug.Entity("c"))
+
+        self.assertEqual(self._dumps(root)[5:],
+                         b'\x01r\x00'
+                         b'\x01\x01a\x00'
+                         b'\x01\x01c\x00\x00\x00'
+                         b'\x01\x01b\x00\x00'
+                         b'\x00')
+
+    def test_read(self):
+        data = self._dumps(scene(), chunk_size=1)
+
+        self.assertEqual(mug.dumps(mug.loads(data)), mug.dumps(scene()))
+
+    def test_iter_events(self):
+        data = self._dumps(scene())
+
+        events = list(mug.iter_events(io.BytesIO(data)))
+        expected = list(mug.iter_events(io.BytesIO(mug.dumps(scene()))))
+
+        self.assertEqual(events, expected)
+
+    def test_read_entity(self):
+        data = self._dumps(scene())
+
+        for path in ("/root", "/root/child2/grandchild1", "/root/child0"):
+            with self.subTest(path=path):
+                entity = mug.read_entity(io.BytesIO(data), path)
+                self.assertEqual(entity.name, path.rsplit('/', 1)[1])
+
+        with self.assertRaises(KeyError):
+            mug.read_entity(io.BytesIO(data), "/root/child1/grandchild2")
+
+    def test_mmap_and_lazy(self):
+        _, file_name = tempfile.mkstemp(prefix="mug_")
+        self.addCleanup(os.remove, file_name)
+
+        with open(file_name, 'wb') as fd:
+            fd.write(self._dumps(scene()))
+
+        self.assertEqual(mug.dumps(mug.read_mmap(file_name)),
+                         mug.dumps(scene()))
+
+        root = mug.open(file_name, lazy=True)
+        self.assertEqual([c.name for c in root.children],
+                         ["child{}".format(i) for i in range(3)])
+        self.assertEqual(root.children[2].children[1].attributes[0].value, 21)
+        self.assertEqual(root.children[0].children[0].children, [])
@@ -0,0 +1,256 @@
+import array
+import io
+import unittest
+
+import mug
+
+from scenes import scene
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def _scene() -> mug.Entity:
+    """Return the shared scene with "half" arrays as long as the child
+    index, the first one empty."""
+    root = scene(child_count=4)
+
+    for i, child in enumerate(root.children):
+        child.attributes.append(mug.Attribute("half",
+                                              mug.AttributeType.F16_ARRAY,
+                                              (0.5,) * i))
+
+    return root
+
+
+class TestSlots(unittest.TestCase):
+
+    def test_slots(self):
+        entity = mug.Entity("foo")
+        attr = mug.Attribute("bar", mug.AttributeType.U8, 1)
+
+        self.assertFalse(hasattr(entity, '__dict__'))
+        self.assertFalse(hasattr(attr, '__dict__'))
+
+        with self.assertRaises(AttributeError):
+            entity.foo = 1
+
+    def test_lazy_slots(self):
+        self.assertFalse(hasattr(mug.LazyEntity("foo", None, 0), '__dict__'))
+
+
+class TestSceneTable(unittest.TestCase):
+
+    def test_from_entity(self):
+        table = mug.SceneTable.from_entity(_scene())
+
+        self.assertEqual(len(table), 1 + 4 + 8)
+        self.assertEqual(table.entity_parents[:6].tolist(),
+                         [-1, 0, 1, 1, 0, 4])
+        self.assertEqual(len(table.names), 2 + 4 + 4 + 2 + 1)
+        self.assertEqual(mug.dumps(table.to_entity()), mug.dumps(_scene()))
+
+    def test_columns(self):
+        table = mug.SceneTable.from_entity(_scene())
+
+        xforms = table.columns[mug.AttributeType.F32X16]
+        self.assertIsInstance(xforms.values, array.array)
+        self.assertEqual(xforms.values.typecode, 'f')
+        self.assertEqual(len(xforms), 4)
+        self.assertEqual(xforms[2], (2.0,) * 16)
+
+        points = table.columns[mug.AttributeType.F32_ARRAY]
+        self.assertEqual(points.offsets.tolist(), [0, 10, 20, 30, 40])
+        self.assertEqual(points[3], array.array('f', (3.0,) * 10))
+
+        self.assertEqual(table.columns[mug.AttributeType.F16_ARRAY][2],
+                         array.array('f', (0.5, 0.5)))
+        self.assertEqual(table.columns[mug.AttributeType.STR_ARRAY][1],
+                         ["a", "b"])
+        self.assertEqual(table.columns[mug.AttributeType.U16].values,
+                         array.array('H', (0, 1, 10, 11, 20, 21, 30, 31)))
+
+    def test_views(self):
+        root = mug.SceneTable.from_entity(_scene()).root
+
+        self.assertIsInstance(root, mug.Entity)
+        self.assertEqual(root.name, "root")
+        self.assertEqual([c.name for c in root.children],
+                         ["child{}".format(i) for i in range(4)])
+
+        grandchild = root.children[3].children[1]
+        self.assertEqual(grandchild.name, "grandchild1")
+        self.assertEqual(grandchild.attributes[0].name, "index")
+        self.assertIs(grandchild.attributes[0].type_, mug.AttributeType.U16)
+        self.assertEqual(grandchild.attributes[0].value, 31)
+        self.assertEqual(grandchild.children, [])
+
+        with self.assertRaises(AttributeError):
+            root.name = "foo"
+
+    def test_build(self):
+        table = mug.SceneTable()
+        root = table.add_entity("root")
+        table.add_attribute("id", mug.AttributeType.U32, 42)
+        child = table.add_entity("child", root)
+        table.add_entity("grandchild", child)
+        table.add_entity("child", root)
+
+        self.assertEqual(table.names, ["root", "id", "child", "grandchild"])
+        self.assertEqual(list(table.child_indices(root)), [1, 3])
+
+        entity = mug.loads(mug.dumps(table))
+        self.assertEqual(entity.attributes[0].value, 42)
+        self.assertEqual(entity.children[0].children[0].name, "grandchild")
+
+    def test_build_errors(self):
+        table = mug.SceneTable()
+
+        with self.assertRaises(ValueError):
+            table.add_attribute("id", mug.AttributeType.U32, 42)
+
+        table.add_entity("root")
+
+        with self.assertRaises(ValueError):
+            table.add_entity("root")
+
+        with self.assertRaises(ValueError):
+            table.add_entity("child", 1)
+
+        with self.assertRaises(ValueError):
+            table.add_attribute("xform", mug.AttributeType.F32X3, (1.0,))
+
+        with self.assertRaises(ValueError):
+            table.add_attribute("foo", 199, 1)
+
+    def test_not_in_file_order(self):
+        table = mug.SceneTable()
+        table.add_entity("root")
+        table.add_entity("a", 0)
+        table.add_entity("b", 0)
+        table.add_entity("c", 1)  # "a" child after its sibling
+
+        with self.assertRaises(ValueError):
+            mug.dumps(table)
+
+    def test_empty(self):
+        with self.assertRaises(ValueError):
+            mug.dumps(mug.SceneTable())
+
+    def test_write(self):
+        table = mug.SceneTable.from_entity(_scene())
+
+        self.assertEqual(mug.dumps(table), mug.dumps(_scene()))
+
+        fd = io.BytesIO()
+        mug.write(fd, table, chunk_size=16)
+        self.assertEqual(fd.getvalue(), mug.dumps(_scene()))
+
+        for options in ({'sized': True}, {'toc_attributes': True}):
+            with self.subTest(**options):
+                self.assertEqual(mug.dumps(table, **options),
+                                 mug.dumps(_scene(), **options))
+
+
+class TestReadTable(unittest.TestCase):
+
+    def _dumps(self, entity: mug.Entity) -> bytes:
+        return mug.dumps(entity)
+
+    def test_read(self):
+        table = mug.read(io.BytesIO(self._dumps(_scene())), table=True)
+
+        self.assertIsInstance(table, mug.SceneTable)
+        self.assertEqual(mug.dumps(table), mug.dumps(_scene()))
+
+        expected = mug.SceneTable.from_entity(_scene())
+        for name in ('names', 'entity_names', 'entity_parents',
+                     'attr_starts', 'attr_names', 'attr_types', 'attr_rows'):
+            self.assertEqual(getattr(table, name), getattr(expected, name))
+
+        for type_code, column in expected.columns.items():
+            self.assertEqual(table.columns[type_code].values, column.values)
+
+    def test_names_shared(self):
+        table = mug.loads(self._dumps(_scene()), table=True)
+
+        self.assertEqual(table.names.count("xform"), 1)
+        self.assertIs(table.root.children[0].attributes[0].name,
+                      table.root.children[3].attributes[0].name)
+
+    def test_selected(self):
+        table = mug.read(io.BytesIO(self._dumps(_scene())), table=True,
+                         max_depth=1, attributes={"xform"})
+
+        self.assertEqual(len(table), 5)
+        self.assertEqual(list(table.columns), [mug.AttributeType.F32X16])
+
+    def test_truncated(self):
+        data = self._dumps(_scene())
+
+        with self.assertRaises(ValueError):
+            mug.loads(data[:len(data) // 2], table=True)
+
+
+class TestReadTableSized(TestReadTable):
+
+    def _dumps(self, entity: mug.Entity) -> bytes:
+        return mug.dumps(entity, sized=True)
+
+
+class TestReadTableStreamed(TestReadTable):
+
+    def _dumps(self, entity: mug.Entity) -> bytes:
+        fd = io.BytesIO()
+
+        with mug.StreamWriter(fd, streamed=True) as writer:
+            for event in mug.iter_events(io.BytesIO(mug.dumps(entity))):
+                if isinstance(event, mug.StartEntity):
+                    writer.begin_entity(event.name)
+                elif isinstance(event, mug.Attr):
+                    writer.add_attribute(*event)
+                else:
+                    writer.end_entity()
+
+        return fd.getvalue()
+
+
+def _attribute_values(entity: mug.Entity) -> list:
+    """Return type and components of all attribute values of `entity`."""
+    values = []
+
+    for descendant in mug.core.iter_hierarchy(entity):
+        for attr in descendant.attributes:
+            value = attr.value
+            if hasattr(value, 'tolist'):
+                values.append((type(value), value.tolist()))
+            else:
+                values.append((type(value), value))
+
+    return values
+
+
+class TestToEntity(unittest.TestCase):
+
+    def test_array_formats(self):
+        data = mug.dumps(_scene())
+        table = mug.loads(data, table=True)
+
+        for array_format in (mug.ArrayFormat.TUPLE, mug.ArrayFormat.ARRAY,
+                             mug.ArrayFormat.MEMORYVIEW):
+            with self.subTest(array_format=array_format):
+                self.assertEqual(
+                    _attribute_values(table.to_entity(array_format)),
+                    _attribute_values(mug.loads(data, array_format)))
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_numpy(self):
+        data = mug.dumps(_scene())
+        root = mug.loads(data, table=True).to_entity(mug.ArrayFormat.NUMPY)
+        expected = mug.loads(data, numpy=True)
+
+        self.assertEqual(_attribute_values(root), _attribute_values(expected))
+        self.assertEqual(root.children[2].attributes[3].value.dtype,
+                         expected.children[2].attributes[3].value.dtype)